@@ -18,7 +18,8 @@ from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stre
 from utils.logger import logger, structlog
 from services.billing import check_billing_status, can_use_model
 from utils.config import config
-from sandbox.sandbox import create_sandbox, delete_sandbox, get_or_start_sandbox
+from sandbox.sandbox import delete_sandbox, get_or_start_sandbox, get_sandbox_preview_links
+from sandbox.pool import create_or_claim_sandbox, schedule_sandbox_prestart
 from services.llm import make_llm_api_call
 from run_agent_background import run_agent_background, _cleanup_redis_response_list, update_agent_run_status
 from utils.constants import MODEL_NAME_ALIASES
@@ -43,6 +44,9 @@ instance_id = None # Global instance ID for this backend instance
 # TTL for Redis response lists (24 hours)
 REDIS_RESPONSE_LIST_TTL = 3600 * 24
 
+# TTL for cached project-name LLM responses (7 days)
+PROJECT_NAME_CACHE_TTL = 3600 * 24 * 7
+
 
 
 class AgentStartRequest(BaseModel):
@@ -350,6 +354,9 @@ async def start_agent(
     if account_id != user_id:
         await verify_thread_access(client, thread_id, user_id)
 
+    # Start the project's sandbox now (if it auto-stopped) so it is up by the first tool call
+    schedule_sandbox_prestart(client, project_id)
+
     structlog.contextvars.bind_contextvars(
         project_id=project_id,
         account_id=account_id,
@@ -932,7 +939,7 @@ async def generate_and_update_project_name(project_id: str, prompt: str):
         messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
 
         logger.debug(f"Calling LLM ({model_name}) for project {project_id} naming.")
-        response = await make_llm_api_call(messages=messages, model_name=model_name, max_tokens=20, temperature=0.7)
+        response = await make_llm_api_call(messages=messages, model_name=model_name, max_tokens=20, temperature=0, cache_ttl=PROJECT_NAME_CACHE_TTL)
 
         generated_name = None
         if response and response.get('choices') and response['choices'][0].get('message'):
@@ -1138,21 +1145,13 @@ async def initiate_agent_with_files(
         if files:
             # 3. Create Sandbox (lazy): only create now if files were uploaded and need the
             try:
-                sandbox_pass = str(uuid.uuid4())
-                sandbox = await create_sandbox(sandbox_pass, project_id)
+                sandbox, sandbox_pass = await create_or_claim_sandbox(project_id)
                 sandbox_id = sandbox.id
                 logger.info(f"Created new sandbox {sandbox_id} for project {project_id}")
 
-                # Get preview links
-                vnc_link = await sandbox.get_preview_link(6080)
-                website_link = await sandbox.get_preview_link(8080)
-                vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-                website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-                token = None
-                if hasattr(vnc_link, 'token'):
-                    token = vnc_link.token
-                elif "token='" in str(vnc_link):
-                    token = str(vnc_link).split("token='")[1].split("'")[0]
+                # Get preview links (resolved concurrently)
+                links = await get_sandbox_preview_links(sandbox)
+                vnc_url, website_url, token = links['vnc_preview'], links['sandbox_url'], links['token']
 
                 # Update project with sandbox info
                 update_result = await client.table('projects').update({
@@ -3199,21 +3198,13 @@ async def create_thread(
         # 2. Create Sandbox
         sandbox_id = None
         try:
-            sandbox_pass = str(uuid.uuid4())
-            sandbox = await create_sandbox(sandbox_pass, project_id)
+            sandbox, sandbox_pass = await create_or_claim_sandbox(project_id)
             sandbox_id = sandbox.id
             logger.info(f"Created new sandbox {sandbox_id} for project {project_id}")
             
-            # Get preview links
-            vnc_link = await sandbox.get_preview_link(6080)
-            website_link = await sandbox.get_preview_link(8080)
-            vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
-            website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
-            token = None
-            if hasattr(vnc_link, 'token'):
-                token = vnc_link.token
-            elif "token='" in str(vnc_link):
-                token = str(vnc_link).split("token='")[1].split("'")[0]
+            # Get preview links (resolved concurrently)
+            links = await get_sandbox_preview_links(sandbox)
+            vnc_url, website_url, token = links['vnc_preview'], links['sandbox_url'], links['token']
         except Exception as e:
             logger.error(f"Error creating sandbox: {str(e)}")
             await client.table('projects').delete().eq('project_id', project_id).execute()
@@ -1,8 +1,9 @@
 import os
 import json
 import asyncio
+import time
 import datetime
-from typing import Optional, Dict, List, Any, AsyncGenerator
+from typing import Optional, Dict, List, Any, AsyncGenerator, Awaitable, Callable, Tuple
 from dataclasses import dataclass
 
 from agent.tools.message_tool import MessageTool
@@ -35,6 +36,7 @@ from agent.tools.mcp_tool_wrapper import MCPToolWrapper
 from agent.tools.task_list_tool import TaskListTool
 from agentpress.tool import SchemaType
 from agent.tools.sb_sheets_tool import SandboxSheetsTool
+from knowledge_base.retrieval import build_knowledge_base_context
 
 load_dotenv()
 
@@ -232,7 +234,8 @@ class PromptManager:
     async def build_system_prompt(model_name: str, agent_config: Optional[dict], 
                                   is_agent_builder: bool, thread_id: str, 
                                   mcp_wrapper_instance: Optional[MCPToolWrapper],
-                                  is_simple_mode: Optional[bool] = False) -> dict:
+                                  is_simple_mode: Optional[bool] = False,
+                                  knowledge_base_context: Optional[str] = None) -> dict:
         
         if "gemini-2.5-flash" in model_name.lower() and "gemini-2.5-pro" not in model_name.lower():
             default_system_content = get_gemini_system_prompt()
@@ -301,6 +304,13 @@ class PromptManager:
             
             system_content += mcp_info
 
+        if knowledge_base_context:
+            kb_info = "\n\n=== AGENT KNOWLEDGE BASE ===\n"
+            kb_info += "The following passages from your knowledge base were selected as relevant to the user's latest message. "
+            kb_info += "Use them when they apply; they are not the whole knowledge base.\n\n"
+            kb_info += knowledge_base_context
+            system_content += kb_info
+
         now = datetime.datetime.now(datetime.timezone.utc)
         datetime_info = f"\n\n=== CURRENT DATE/TIME INFORMATION ===\n"
         datetime_info += f"Today's date: {now.strftime('%A, %B %d, %Y')}\n"
@@ -316,27 +326,55 @@ class PromptManager:
 
 
 class MessageManager:
-    def __init__(self, client, thread_id: str, model_name: str, trace: Optional[StatefulTraceClient]):
+    def __init__(self, client, thread_id: str, model_name: str, trace: Optional[StatefulTraceClient], thread_manager: ThreadManager):
         self.client = client
         self.thread_id = thread_id
         self.model_name = model_name
         self.trace = trace
+        self.thread_manager = thread_manager
+        self._persisted_context_loaded = False
+
+    async def _load_persisted_context(self):
+        """Restore browser/image context persisted by an earlier run. Only runs once per run."""
+        if self._persisted_context_loaded:
+            return
+        self._persisted_context_loaded = True
+
+        latest_browser_state_msg, latest_image_context_msg = await asyncio.gather(
+            self.client.table('messages').select('content').eq('thread_id', self.thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute(),
+            self.client.table('messages').select('content').eq('thread_id', self.thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
+        )
+
+        try:
+            if self.thread_manager.browser_state is None and latest_browser_state_msg.data:
+                browser_content = latest_browser_state_msg.data[0]["content"]
+                self.thread_manager.browser_state = json.loads(browser_content) if isinstance(browser_content, str) else browser_content
+        except Exception as e:
+            logger.error(f"Error parsing browser state: {e}")
+
+        try:
+            if self.thread_manager.image_context is None and latest_image_context_msg.data:
+                image_content = latest_image_context_msg.data[0]["content"]
+                self.thread_manager.image_context = json.loads(image_content) if isinstance(image_content, str) else image_content
+        except Exception as e:
+            logger.error(f"Error parsing image context: {e}")
     
     async def build_temporary_message(self) -> Optional[dict]:
         temp_message_content_list = []
 
-        latest_browser_state_msg = await self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'browser_state').order('created_at', desc=True).limit(1).execute()
-        if latest_browser_state_msg.data and len(latest_browser_state_msg.data) > 0:
+        await self._load_persisted_context()
+
+        browser_content = self.thread_manager.browser_state
+        if browser_content:
             try:
-                browser_content = latest_browser_state_msg.data[0]["content"]
-                if isinstance(browser_content, str):
-                    browser_content = json.loads(browser_content)
                 screenshot_base64 = browser_content.get("screenshot_base64")
-                screenshot_url = browser_content.get("image_url")
+                # Prefer the downscaled variant made for LLM context over the full-resolution screenshot
+                screenshot_url = browser_content.get("llm_image_url") or browser_content.get("image_url")
                 
                 browser_state_text = browser_content.copy()
                 browser_state_text.pop('screenshot_base64', None)
                 browser_state_text.pop('image_url', None)
+                browser_state_text.pop('llm_image_url', None)
 
                 if browser_state_text:
                     temp_message_content_list.append({
@@ -383,10 +421,11 @@ class MessageManager:
             except Exception as e:
                 logger.error(f"Error parsing browser state: {e}")
 
-        latest_image_context_msg = await self.client.table('messages').select('*').eq('thread_id', self.thread_id).eq('type', 'image_context').order('created_at', desc=True).limit(1).execute()
-        if latest_image_context_msg.data and len(latest_image_context_msg.data) > 0:
+        image_context_content = self.thread_manager.image_context
+        if image_context_content:
+            # Image context is shown once; drop it from memory and from the durable backup
+            self.thread_manager.image_context = None
             try:
-                image_context_content = latest_image_context_msg.data[0]["content"] if isinstance(latest_image_context_msg.data[0]["content"], dict) else json.loads(latest_image_context_msg.data[0]["content"])
                 base64_image = image_context_content.get("base64")
                 mime_type = image_context_content.get("mime_type")
                 file_path = image_context_content.get("file_path", "unknown file")
@@ -403,7 +442,7 @@ class MessageManager:
                         }
                     })
 
-                await self.client.table('messages').delete().eq('message_id', latest_image_context_msg.data[0]["message_id"]).execute()
+                await self.client.table('messages').delete().eq('thread_id', self.thread_id).eq('type', 'image_context').execute()
             except Exception as e:
                 logger.error(f"Error parsing image context: {e}")
 
@@ -412,6 +451,61 @@ class MessageManager:
         return None
 
 
+class BootstrapGraph:
+    """Runs async setup steps as a dependency graph.
+
+    Every step starts as soon as the steps it depends on have finished, so
+    independent lookups run concurrently. Each step is timed and recorded as a
+    trace span.
+    """
+
+    def __init__(self, trace: Optional[StatefulTraceClient] = None):
+        self.trace = trace
+        self.timings: Dict[str, float] = {}
+        self._steps: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+
+    def add_step(self, name: str, fn: Callable[..., Awaitable[Any]], depends_on: Tuple[str, ...] = ()):
+        """Add a step; `fn` is called with the results of `depends_on`, in order."""
+        for dependency in depends_on:
+            if dependency not in self._steps:
+                raise ValueError(f"Bootstrap step '{name}' depends on unknown step '{dependency}'")
+        self._steps[name] = (fn, tuple(depends_on))
+
+    async def _run_step(self, name: str, fn: Callable[..., Awaitable[Any]], depends_on: Tuple[str, ...], tasks: Dict[str, asyncio.Task]) -> Any:
+        dependency_results = [await tasks[dependency] for dependency in depends_on]
+        span = self.trace.span(name=f"bootstrap.{name}") if self.trace else None
+        started = time.perf_counter()
+        try:
+            result = await fn(*dependency_results)
+        except Exception as e:
+            if span:
+                span.end(status_message=str(e), level="ERROR")
+            raise
+        finally:
+            self.timings[name] = (time.perf_counter() - started) * 1000
+        if span:
+            span.end()
+        return result
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for name, (fn, depends_on) in self._steps.items():
+            tasks[name] = asyncio.create_task(self._run_step(name, fn, depends_on, tasks))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        step_timings = ", ".join(f"{name}={elapsed:.0f}ms" for name, elapsed in self.timings.items())
+        logger.info(f"Agent bootstrap finished in {(time.perf_counter() - started) * 1000:.0f}ms ({step_timings})")
+        return dict(zip(tasks.keys(), results))
+
+
 class AgentRunner:
     def __init__(self, config: AgentConfig):
         self.config = config
@@ -428,21 +522,72 @@ class AgentRunner:
         )
         
         self.client = await self.thread_manager.db.client
+
+    async def load_account(self) -> str:
         self.account_id = await get_account_id_from_thread(self.client, self.config.thread_id)
         if not self.account_id:
             raise ValueError("Could not determine account ID for thread")
+        return self.account_id
 
-        project = await self.client.table('projects').select('*').eq('project_id', self.config.project_id).execute()
+    async def load_project(self) -> dict:
+        project = await self.client.table('projects').select('project_id, sandbox').eq('project_id', self.config.project_id).execute()
         if not project.data or len(project.data) == 0:
             raise ValueError(f"Project {self.config.project_id} not found")
 
         project_data = project.data[0]
-        sandbox_info = project_data.get('sandbox', {})
+        sandbox_info = project_data.get('sandbox') or {}
         if not sandbox_info.get('id'):
             # Sandbox is created lazily by tools when required. Do not fail setup
             # if no sandbox is present — tools will call `_ensure_sandbox()`
             # which will create and persist the sandbox metadata when needed.
             logger.info(f"No sandbox found for project {self.config.project_id}; will create lazily when needed")
+        return project_data
+
+    async def load_latest_user_message(self) -> Optional[str]:
+        latest_user_message = await self.client.table('messages').select('content').eq('thread_id', self.config.thread_id).eq('type', 'user').order('created_at', desc=True).limit(1).execute()
+        if latest_user_message.data and len(latest_user_message.data) > 0:
+            data = latest_user_message.data[0]['content']
+            if isinstance(data, str):
+                data = json.loads(data)
+            if self.config.trace:
+                self.config.trace.update(input=data['content'])
+            return data.get('content') if isinstance(data.get('content'), str) else None
+        return None
+
+    async def load_knowledge_base_context(self, latest_user_message: Optional[str]) -> Optional[str]:
+        """Select the agent's KB passages relevant to the latest user message."""
+        agent_id = (self.config.agent_config or {}).get('agent_id')
+        if not agent_id or not latest_user_message or not await is_enabled("knowledge_base"):
+            return None
+        try:
+            return await build_knowledge_base_context(agent_id, latest_user_message)
+        except Exception as e:
+            logger.warning(f"Failed to retrieve knowledge base context for agent {agent_id}: {e}")
+            return None
+
+    async def bootstrap(self, message_manager: 'MessageManager') -> Dict[str, Any]:
+        """Run the independent setup steps concurrently.
+
+        Returns the step results; `billing` and `temporary_message` are used
+        for the first iteration of the run loop.
+        """
+        graph = BootstrapGraph(trace=self.config.trace)
+        graph.add_step('account', self.load_account)
+        graph.add_step('project', self.load_project)
+        graph.add_step('tools', self.setup_tools)
+        graph.add_step('latest_user_message', self.load_latest_user_message)
+        graph.add_step('temporary_message', message_manager.build_temporary_message)
+        graph.add_step('billing', lambda account_id: check_billing_status(self.client, account_id), depends_on=('account',))
+        # MCP tools are registered after the built-in tools so they win on name clashes
+        graph.add_step('mcp', lambda account_id, _tools: self.setup_mcp_tools(), depends_on=('account', 'tools'))
+        graph.add_step('knowledge_base', self.load_knowledge_base_context, depends_on=('latest_user_message',))
+        graph.add_step('system_prompt', lambda mcp_wrapper_instance, knowledge_base_context: PromptManager.build_system_prompt(
+            self.config.model_name, self.config.agent_config,
+            self.config.is_agent_builder, self.config.thread_id,
+            mcp_wrapper_instance, self.config.is_simple_mode,
+            knowledge_base_context
+        ), depends_on=('mcp', 'knowledge_base'))
+        return await graph.run()
     
     async def setup_tools(self):
         tool_manager = ToolManager(self.thread_manager, self.config.project_id, self.config.thread_id)
@@ -493,32 +638,20 @@ class AgentRunner:
     
     async def run(self) -> AsyncGenerator[Dict[str, Any], None]:
         await self.setup()
-        await self.setup_tools()
-        mcp_wrapper_instance = await self.setup_mcp_tools()
-        
-        system_message = await PromptManager.build_system_prompt(
-            self.config.model_name, self.config.agent_config, 
-            self.config.is_agent_builder, self.config.thread_id, 
-            mcp_wrapper_instance, self.config.is_simple_mode
-        )
+        message_manager = MessageManager(self.client, self.config.thread_id, self.config.model_name, self.config.trace, self.thread_manager)
+        bootstrap_results = await self.bootstrap(message_manager)
+        system_message = bootstrap_results['system_prompt']
 
         iteration_count = 0
         continue_execution = True
 
-        latest_user_message = await self.client.table('messages').select('*').eq('thread_id', self.config.thread_id).eq('type', 'user').order('created_at', desc=True).limit(1).execute()
-        if latest_user_message.data and len(latest_user_message.data) > 0:
-            data = latest_user_message.data[0]['content']
-            if isinstance(data, str):
-                data = json.loads(data)
-            if self.config.trace:
-                self.config.trace.update(input=data['content'])
-
-        message_manager = MessageManager(self.client, self.config.thread_id, self.config.model_name, self.config.trace)
-
         while continue_execution and iteration_count < self.config.max_iterations:
             iteration_count += 1
 
-            can_run, message, subscription = await check_billing_status(self.client, self.account_id)
+            if iteration_count == 1:
+                can_run, message, subscription = bootstrap_results['billing']
+            else:
+                can_run, message, subscription = await check_billing_status(self.client, self.account_id)
             if not can_run:
                 error_msg = f"Billing limit reached: {message}"
                 yield {
@@ -531,7 +664,10 @@ class AgentRunner:
             # Remove problematic termination logic that stops agent after any assistant message
             # This was causing the agent to stop prematurely instead of continuing with tool usage
 
-            temporary_message = await message_manager.build_temporary_message()
+            if iteration_count == 1:
+                temporary_message = bootstrap_results['temporary_message']
+            else:
+                temporary_message = await message_manager.build_temporary_message()
             max_tokens = self.get_max_tokens()
             
             generation = self.config.trace.generation(name="thread_manager.run_thread") if self.config.trace else None
@@ -1,10 +1,16 @@
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from agentpress.thread_manager import ThreadManager
 from sandbox.tool_base import SandboxToolsBase
+from sandbox.browser_client import (
+    STAGEHAND_API_BASE_PATH,
+    STAGEHAND_API_PORT,
+    BrowserApiClient,
+    BrowserApiError,
+    get_browser_client,
+)
 from utils.logger import logger
-from utils.s3_upload_utils import upload_base64_image
+from utils.screenshot_pipeline import ScreenshotValidationError, process_screenshot
 import asyncio
-import json
 import base64
 import io
 import traceback
@@ -130,6 +136,10 @@ class BrowserTool(SandboxToolsBase):
         except Exception as e:
             return f"Error getting debug info: {e}"
 
+    def _stagehand_client(self) -> BrowserApiClient:
+        """Shared HTTP client for the sandbox's Stagehand API (port 8004)."""
+        return get_browser_client(self.sandbox_id, self.sandbox, STAGEHAND_API_PORT, STAGEHAND_API_BASE_PATH)
+
     async def _check_stagehand_api_health(self) -> bool:
         """Check if the Stagehand API server is running and accessible"""
         try:
@@ -140,34 +150,25 @@ class BrowserTool(SandboxToolsBase):
                 await asyncio.sleep(5)
                 self.__class__._sandbox_created = True
             
-            # Simple health check curl command
-            curl_cmd = "curl -s -X GET 'http://localhost:8004/api' -H 'Content-Type: application/json'"
-            
-            logger.debug(f"Checking Stagehand API health with: {curl_cmd}")
-            
-            response = await self.sandbox.process.exec(curl_cmd, timeout=10)
-            if response.exit_code == 0:
-                try:
-                    result = json.loads(response.result)
-                    if result.get("status") == "healthy":
-                        logger.info("✅ Stagehand API server is running and healthy")
-                        return True
-                    else:
-                        # If the browser api is not healthy, we need to restart the browser api
-                        model_api_key = config.ANTHROPIC_API_KEY
+            logger.debug("Checking Stagehand API health")
+            client = self._stagehand_client()
+            try:
+                result = await client.request("", method="GET", timeout=10)
+            except BrowserApiError as e:
+                logger.warning(f"Stagehand API server health check failed: {e}")
+                return False
 
-                        response = await self.sandbox.process.exec(f"curl -X POST 'http://localhost:8004/api/init' -H 'Content-Type: application/json' -d '{{\"api_key\": \"{model_api_key}\"}}'", timeout=90)
-                        if response.exit_code == 0:
-                            logger.info("Stagehand API server restarted successfully")
-                            return True
-                        else:
-                            logger.warning(f"Stagehand API server restart failed: {response.result}")
-                            return False
-                except json.JSONDecodeError:
-                    logger.warning(f"Stagehand API server responded but with invalid JSON: {response.result}")
-                    return False
-            else:
-                logger.warning(f"Stagehand API server health check failed with exit code {response.exit_code}")
+            if result.get("status") == "healthy":
+                logger.info("✅ Stagehand API server is running and healthy")
+                return True
+
+            # If the browser api is not healthy, we need to restart the browser api
+            try:
+                await client.request("init", {"api_key": config.ANTHROPIC_API_KEY}, timeout=90)
+                logger.info("Stagehand API server restarted successfully")
+                return True
+            except BrowserApiError as e:
+                logger.warning(f"Stagehand API server restart failed: {e}")
                 return False
                 
         except Exception as e:
@@ -194,103 +195,73 @@ class BrowserTool(SandboxToolsBase):
                 return self.fail_response(error_msg)
             
             
-            # Build the curl command to call the local Stagehand API
-            url = f"http://localhost:8004/api/{endpoint}"  # Fixed localhost as curl runs inside container
-            
-            if method == "GET" and params:
-                query_params = "&".join([f"{k}={v}" for k, v in params.items()])
-                url = f"{url}?{query_params}"
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-            else:
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-                if params:
-                    json_data = json.dumps(params)
-                    curl_cmd += f" -d '{json_data}'"
-            
-            logger.debug(f"\033[95mExecuting curl command:\033[0m\n{curl_cmd}")
-            
-            response = await self.sandbox.process.exec(curl_cmd, timeout=30)  # Execute curl inside sandbox
-            
-            if response.exit_code == 0:
-                try:
-                    result = json.loads(response.result)
-                    logger.info(f"Stagehand API result: {result}")
+            # Call the Stagehand API directly (shared HTTP client per sandbox)
+            try:
+                result = await self._stagehand_client().request(endpoint, params, method)
+            except BrowserApiError as e:
+                logger.error(f"Stagehand API request failed: {e}")
+                return self.fail_response(f"Stagehand API request failed: {e}")
+            screenshot_data = result.pop("screenshot_base64", None)
+            logger.info(f"Stagehand API result: {result}")
 
-                    logger.info("Stagehand API request completed successfully")
+            logger.info("Stagehand API request completed successfully")
 
-                    if "screenshot_base64" in result:
-                        try:
-                            screenshot_data = result["screenshot_base64"]
-                            is_valid, validation_message = self._validate_base64_image(screenshot_data)
-                            
-                            if is_valid:
-                                logger.debug(f"Screenshot validation passed: {validation_message}")
-                                image_url = await upload_base64_image(screenshot_data)
-                                result["image_url"] = image_url
-                                logger.debug(f"Uploaded screenshot to {image_url}")
-                            else:
-                                logger.warning(f"Screenshot validation failed: {validation_message}")
-                                result["image_validation_error"] = validation_message
-                                
-                            del result["screenshot_base64"]
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to process screenshot: {e}")
-                            result["image_upload_error"] = str(e)
+            if screenshot_data:
+                try:
+                    # Validated and encoded off the event loop; unchanged pages reuse the stored images
+                    screenshot = await process_screenshot(screenshot_data, self._validate_base64_image)
+                    result["image_url"] = screenshot.image_url
+                    result["llm_image_url"] = screenshot.llm_image_url
+                    logger.debug(f"Screenshot stored at {screenshot.image_url} (deduplicated: {screenshot.deduplicated})")
+                except ScreenshotValidationError as e:
+                    logger.warning(f"Screenshot validation failed: {e}")
+                    result["image_validation_error"] = str(e)
+                except Exception as e:
+                    logger.error(f"Failed to process screenshot: {e}")
+                    result["image_upload_error"] = str(e)
 
-                    added_message = await self.thread_manager.add_message(
-                        thread_id=self.thread_id,
-                        type="browser_state",
-                        content=result,
-                        is_llm_message=False
-                    )
+            added_message = await self.thread_manager.add_message(
+                thread_id=self.thread_id,
+                type="browser_state",
+                content=result,
+                is_llm_message=False
+            )
+            # Keep the latest state in memory for the next temporary message
+            self.thread_manager.browser_state = result
 
-                    # Prepare clean response for agent (filter out internal metadata)
-                    # Only include data that's useful for the agent's decision making
-                    clean_result = {
-                        "success": result.get("success", True),
-                        "message": result.get("message", "Stagehand action completed successfully"),
-                        "message_id": added_message.data[0]["message_id"] if added_message.data else None
-                    }
+            # Prepare clean response for agent (filter out internal metadata)
+            # Only include data that's useful for the agent's decision making
+            clean_result = {
+                "success": result.get("success", True),
+                "message": result.get("message", "Stagehand action completed successfully"),
+                "message_id": added_message.data[0]["message_id"] if added_message.data else None
+            }
 
-                    # Include only data that actually comes from browserApi.ts
-                    if result.get("url"):
-                        clean_result["url"] = result["url"]
-                    if result.get("title"):
-                        clean_result["title"] = result["title"]
-                    if result.get("action"):
-                        clean_result["action"] = result["action"]
-                    if result.get("image_url"):  # This is screenshot_base64 converted to image_url
-                        clean_result["image_url"] = result["image_url"]
-                    
-                    # Include any error context that's useful for the agent
-                    if result.get("image_validation_error"):
-                        clean_result["screenshot_issue"] = f"Screenshot processing issue: {result['image_validation_error']}"
-                    if result.get("image_upload_error"):
-                        clean_result["screenshot_issue"] = f"Screenshot upload issue: {result['image_upload_error']}"
+            # Include only data that actually comes from browserApi.ts
+            if result.get("url"):
+                clean_result["url"] = result["url"]
+            if result.get("title"):
+                clean_result["title"] = result["title"]
+            if result.get("action"):
+                clean_result["action"] = result["action"]
+            if result.get("image_url"):  # This is screenshot_base64 converted to image_url
+                clean_result["image_url"] = result["image_url"]
 
-                    if clean_result.get("success"):
-                        return self.success_response(clean_result)
-                    else:
-                        # Handle error responses with helpful context  
-                        error_msg = result.get("error", result.get("message", "Unknown error"))
-                        if "Page crashed" in error_msg:
-                            error_msg += "\n\nNote: Browser page crashes in Docker environments can be caused by insufficient browser launch options. Consider using the regular browser automation tool (sb_browser_tool) as an alternative."
-                        clean_result["message"] = error_msg
-                        return self.fail_response(clean_result)
+            # Include any error context that's useful for the agent
+            if result.get("image_validation_error"):
+                clean_result["screenshot_issue"] = f"Screenshot processing issue: {result['image_validation_error']}"
+            if result.get("image_upload_error"):
+                clean_result["screenshot_issue"] = f"Screenshot upload issue: {result['image_upload_error']}"
 
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse response JSON: {response.result} {e}")
-                    return self.fail_response(f"Failed to parse response JSON: {response.result} {e}")
+            if clean_result.get("success"):
+                return self.success_response(clean_result)
             else:
-                # Check if it's a connection error (exit code 7)
-                if response.exit_code == 7:
-                    error_msg = f"Stagehand API server is not available on port 8004. Please ensure the Stagehand API server is running. Error: {response}"
-                    logger.error(error_msg)
-                    return self.fail_response(error_msg)
-                else:
-                    logger.error(f"Stagehand API request failed: {response}")
-                    return self.fail_response(f"Stagehand API request failed: {response}")
+                # Handle error responses with helpful context  
+                error_msg = result.get("error", result.get("message", "Unknown error"))
+                if "Page crashed" in error_msg:
+                    error_msg += "\n\nNote: Browser page crashes in Docker environments can be caused by insufficient browser launch options. Consider using the regular browser automation tool (sb_browser_tool) as an alternative."
+                clean_result["message"] = error_msg
+                return self.fail_response(clean_result)
 
         except Exception as e:
             logger.error(f"Error executing Stagehand action: {e}")
@@ -1,5 +1,6 @@
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
+from sandbox.fs_batch import SandboxFS, SandboxFSConflict, WRITE_MODE_CREATE, WRITE_MODE_OVERWRITE
 from utils.files_utils import should_exclude_file, clean_path
 from agentpress.thread_manager import ThreadManager
 from utils.logger import logger
@@ -27,6 +28,11 @@ class SandboxFilesTool(SandboxToolsBase):
         """Check if a file should be excluded based on path, name, or extension"""
         return should_exclude_file(rel_path)
 
+    @property
+    def fs(self) -> SandboxFS:
+        """Batched filesystem operations on the current sandbox."""
+        return SandboxFS(self.sandbox)
+
     async def _file_exists(self, path: str) -> bool:
         """Check if a file exists in the sandbox"""
         try:
@@ -43,31 +49,34 @@ class SandboxFilesTool(SandboxToolsBase):
             await self._ensure_sandbox()
             
             files = await self.sandbox.fs.list_files(self.workspace_path)
-            for file_info in files:
-                rel_path = file_info.name
-                
+            file_infos = {
+                f"{self.workspace_path}/{file_info.name}": file_info
+                for file_info in files
                 # Skip excluded files and directories
-                if self._should_exclude_file(rel_path) or file_info.is_dir:
-                    continue
+                if not (self._should_exclude_file(file_info.name) or file_info.is_dir)
+            }
 
+            # Fetch all contents in one batch instead of one download per file
+            contents = await self.fs.read_many(file_infos)
+            for full_path, file_info in file_infos.items():
+                rel_path = file_info.name
+                if full_path not in contents:
+                    logger.warning(f"Error reading file {rel_path}")
+                    continue
                 try:
-                    full_path = f"{self.workspace_path}/{rel_path}"
-                    content = (await self.sandbox.fs.download_file(full_path)).decode()
                     files_state[rel_path] = {
-                        "content": content,
+                        "content": contents[full_path].decode(),
                         "is_dir": file_info.is_dir,
                         "size": file_info.size,
                         "modified": file_info.mod_time
                     }
-                except Exception as e:
-                    print(f"Error reading file {rel_path}: {e}")
                 except UnicodeDecodeError:
-                    print(f"Skipping binary file: {rel_path}")
+                    logger.debug(f"Skipping binary file: {rel_path}")
 
             return files_state
         
         except Exception as e:
-            print(f"Error getting workspace state: {str(e)}")
+            logger.error(f"Error getting workspace state: {str(e)}")
             return {}
 
 
@@ -125,21 +134,16 @@ class SandboxFilesTool(SandboxToolsBase):
             
             file_path = self.clean_path(file_path)
             full_path = f"{self.workspace_path}/{file_path}"
-            if await self._file_exists(full_path):
-                return self.fail_response(f"File '{file_path}' already exists. Use update_file to modify existing files.")
-            
-            # Create parent directories if needed
-            parent_dir = '/'.join(full_path.split('/')[:-1])
-            if parent_dir:
-                await self.sandbox.fs.create_folder(parent_dir, "755")
             
             # convert to json string if file_contents is a dict
             if isinstance(file_contents, dict):
                 file_contents = json.dumps(file_contents, indent=4)
             
-            # Write the file content
-            await self.sandbox.fs.upload_file(file_contents.encode(), full_path)
-            await self.sandbox.fs.set_file_permissions(full_path, permissions)
+            # Existence check, parent directories, content and permissions in one batched write
+            try:
+                await self.fs.write_file(full_path, file_contents.encode(), permissions, mode=WRITE_MODE_CREATE)
+            except SandboxFSConflict:
+                return self.fail_response(f"File '{file_path}' already exists. Use update_file to modify existing files.")
             
             message = f"File '{file_path}' created successfully."
             
@@ -198,10 +202,11 @@ class SandboxFilesTool(SandboxToolsBase):
             
             file_path = self.clean_path(file_path)
             full_path = f"{self.workspace_path}/{file_path}"
-            if not await self._file_exists(full_path):
+            contents = await self.fs.read_many([full_path])
+            if full_path not in contents:
                 return self.fail_response(f"File '{file_path}' does not exist")
             
-            content = (await self.sandbox.fs.download_file(full_path)).decode()
+            content = contents[full_path].decode()
             old_str = old_str.expandtabs()
             new_str = new_str.expandtabs()
             
@@ -214,7 +219,7 @@ class SandboxFilesTool(SandboxToolsBase):
             
             # Perform replacement
             new_content = content.replace(old_str, new_str)
-            await self.sandbox.fs.upload_file(new_content.encode(), full_path)
+            await self.fs.write_file(full_path, new_content.encode())
             
             # Show snippet around the edit
             replacement_line = content.split(old_str)[0].count('\n')
@@ -279,12 +284,11 @@ class SandboxFilesTool(SandboxToolsBase):
             
             file_path = self.clean_path(file_path)
             full_path = f"{self.workspace_path}/{file_path}"
-            if not await self._file_exists(full_path):
+            try:
+                await self.fs.write_file(full_path, file_contents.encode(), permissions, mode=WRITE_MODE_OVERWRITE)
+            except SandboxFSConflict:
                 return self.fail_response(f"File '{file_path}' does not exist. Use create_file to create a new file.")
             
-            await self.sandbox.fs.upload_file(file_contents.encode(), full_path)
-            await self.sandbox.fs.set_file_permissions(full_path, permissions)
-            
             message = f"File '{file_path}' completely rewritten successfully."
             
             # Check if index.html was rewritten and add 8080 server info (only in root workspace)
@@ -1,12 +1,20 @@
-import asyncio
 from typing import Optional, Dict, Any
-import time
-import asyncio
 from uuid import uuid4
 from agentpress.tool import ToolResult, openapi_schema, usage_example
 from sandbox.tool_base import SandboxToolsBase
 from agentpress.thread_manager import ThreadManager
 
+# Per-session output logs (tmux pipe-pane) and exit-code files live here inside the sandbox
+COMMAND_STATE_DIR = "/tmp/suna_commands"
+# Strips ANSI escape sequences and carriage returns from raw pane output
+CLEAN_OUTPUT_FILTER = "sed 's/\\x1b\\[[0-9;?]*[a-zA-Z]//g' | tr -d '\\r'"
+# Default cap on the output returned by a single check_command_output call
+DEFAULT_OUTPUT_MAX_BYTES = 20000
+# How often the blocking wait checks that the tmux session is still alive
+SESSION_ALIVE_CHECK_SECONDS = 0.5
+# How long the blocking wait gives pipe-pane to flush the end of the output to the log
+OUTPUT_FLUSH_WAIT_STEPS = 20  # x 0.1s
+
 class SandboxShellTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities. 
     Uses sessions for maintaining state between commands and provides comprehensive process management."""
@@ -134,52 +142,51 @@ class SandboxShellTool(SandboxToolsBase):
             wrapped_command = full_command.replace('"', '\\"')  # Escape double quotes
             
             if blocking:
-                # For blocking execution, use a more reliable approach
-                # Add a unique marker to detect command completion
-                marker = f"COMMAND_DONE_{str(uuid4())[:8]}"
-                completion_command = f"{command} ; echo {marker}"
+                # The command writes its exit code, prints an end marker and signals a tmux wait-for
+                # channel when it finishes, so completion is detected as soon as it happens instead of
+                # by polling capture-pane, and only the output appended to the session log since the
+                # command started is transferred
+                command_id = str(uuid4())[:8]
+                channel = f"suna_done_{command_id}"
+                log_file = self._session_log_file(session_name)
+                exit_file = f"{COMMAND_STATE_DIR}/{command_id}.exit"
+                # Split by quotes so the typed command line echoed by the pane never contains the marker
+                end_marker = f"__SUNA_END_{command_id}__"
+                typed_end_marker = f'__SUNA_END_""{command_id}__'
+                completion_command = (
+                    f"{command} ; echo \\$? > {exit_file} ; echo {typed_end_marker} ; tmux wait-for -S {channel}"
+                )
                 wrapped_completion_command = completion_command.replace('"', '\\"')
                 
-                # Send the command with completion marker
-                await self._execute_raw_command(f'tmux send-keys -t {session_name} "cd {cwd} && {wrapped_completion_command}" Enter')
-                
-                start_time = time.time()
-                final_output = ""
+                start_result = await self._execute_raw_command(
+                    f"{self._start_output_log_command(session_name)} && stat -c %s {log_file} && "
+                    f'tmux send-keys -t {session_name} "cd {cwd} && {wrapped_completion_command}" Enter'
+                )
+                log_offset = self._parse_offset(start_result.get("output", ""))
                 
-                while (time.time() - start_time) < timeout:
-                    # Wait a shorter interval for more responsive checking
-                    await asyncio.sleep(0.5)
-                    
-                    # Check if session still exists (command might have exited)
-                    check_result = await self._execute_raw_command(f"tmux has-session -t {session_name} 2>/dev/null || echo 'ended'")
-                    if "ended" in check_result.get("output", ""):
-                        break
-                        
-                    # Get current output and check for our completion marker
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    current_output = output_result.get("output", "")
-
-                    if self._is_command_completed(current_output, marker):
-                        final_output = current_output
-                        break
-                
-                # If we didn't get the marker, capture whatever output we have
-                if not final_output:
-                    output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-                    final_output = output_result.get("output", "")
-                
-                # Kill the session after capture
-                await self._execute_raw_command(f"tmux kill-session -t {session_name}")
+                # Runs in its own Daytona session so the wait does not hold up other raw commands
+                wait_result = await self._execute_in_dedicated_session(
+                    self._wait_for_command_script(session_name, channel, exit_file, end_marker, log_offset, timeout),
+                    timeout=timeout + 30
+                )
+                wait_output = wait_result.get("output", "")
+                session_ended = "__SESSION_ENDED__" in wait_output.partition("__EXIT__")[0]
+                exit_status, final_output = self._split_exit_status(wait_output)
                 
                 return self.success_response({
                     "output": final_output,
                     "session_name": session_name,
                     "cwd": cwd,
-                    "completed": True
+                    "completed": exit_status is not None or session_ended,
+                    "exit_code": exit_status
                 })
             else:
-                # Send command to tmux session for non-blocking execution
-                await self._execute_raw_command(f'tmux send-keys -t {session_name} "{wrapped_command}" Enter')
+                # Send command to tmux session for non-blocking execution, logging the session's
+                # output so check_command_output can return only what is new since the last check
+                await self._execute_raw_command(
+                    f"{self._start_output_log_command(session_name)} && "
+                    f'tmux send-keys -t {session_name} "{wrapped_command}" Enter'
+                )
                 
                 # For non-blocking, just return immediately
                 return self.success_response({
@@ -198,11 +205,124 @@ class SandboxShellTool(SandboxToolsBase):
                     pass
             return self.fail_response(f"Error executing command: {str(e)}")
 
-    async def _execute_raw_command(self, command: str) -> Dict[str, Any]:
+    def _wait_for_command_script(
+        self,
+        session_name: str,
+        channel: str,
+        exit_file: str,
+        end_marker: str,
+        log_offset: int,
+        timeout: int
+    ) -> str:
+        """Shell script that waits for a blocking command and prints its exit status and output.
+
+        Prints `__SESSION_ENDED__` if the tmux session is gone (e.g. the command ran `exit`), then
+        `__EXIT__<code>` (empty if the command did not finish) followed by the command's output.
+        """
+        log_file = self._session_log_file(session_name)
+        new_output = f"tail -c +{log_offset + 1} {log_file}"
+        return (
+            # A watcher releases the wait if the session ends before the command signals
+            f"( while tmux has-session -t {session_name} 2>/dev/null; do sleep {SESSION_ALIVE_CHECK_SECONDS}; done ; "
+            f"tmux wait-for -S {channel} ) & WATCHER=$! ; "
+            f"timeout {timeout} tmux wait-for {channel} ; kill $WATCHER 2>/dev/null ; "
+            # pipe-pane writes asynchronously: read until the end marker has reached the log
+            f"if [ -f {exit_file} ]; then i=0; while [ $i -lt {OUTPUT_FLUSH_WAIT_STEPS} ] && "
+            f"! {new_output} | grep -q {end_marker}; do sleep 0.1; i=$((i + 1)); done; fi ; "
+            f"tmux has-session -t {session_name} 2>/dev/null || echo __SESSION_ENDED__ ; "
+            f"echo \"__EXIT__$(cat {exit_file} 2>/dev/null)\" ; "
+            f"{new_output} | {CLEAN_OUTPUT_FILTER} | sed '/{end_marker}/,$d' ; "
+            f"rm -f {exit_file} {log_file} {self._session_cursor_file(session_name)} ; "
+            f"tmux kill-session -t {session_name} 2>/dev/null"
+        )
+
+    def _session_log_file(self, session_name: str) -> str:
+        return f"{COMMAND_STATE_DIR}/{session_name}.log"
+
+    def _session_cursor_file(self, session_name: str) -> str:
+        return f"{COMMAND_STATE_DIR}/{session_name}.cursor"
+
+    def _read_new_output_command(
+        self,
+        session_name: str,
+        tail_lines: Optional[int],
+        max_bytes: int,
+        from_start: bool
+    ) -> str:
+        """Shell command that prints the session log written since the stored cursor and advances it.
+
+        The first line is `__CURSOR__<start>:<end>:<bytes>` where `bytes` is the size of the new
+        output before the tail_lines/max_bytes window is applied. Prints nothing if there is no log.
+        """
+        log_file = self._session_log_file(session_name)
+        cursor_file = self._session_cursor_file(session_name)
+        chunk_file = f"{log_file}.chunk"
+        start = "0" if from_start else f"$(cat {cursor_file} 2>/dev/null || echo 0)"
+        window = f" | tail -n {int(tail_lines)}" if tail_lines else ""
+        window += f" | tail -c {int(max_bytes)}"
+        return (
+            f"SIZE=$(stat -c %s {log_file} 2>/dev/null) && CUR={start} && "
+            f"if [ \"$CUR\" -gt \"$SIZE\" ]; then CUR=0; fi && "
+            f"tail -c +$((CUR + 1)) {log_file} | head -c $((SIZE - CUR)) | {CLEAN_OUTPUT_FILTER} > {chunk_file} && "
+            f"echo \"__CURSOR__$CUR:$SIZE:$(wc -c < {chunk_file})\" && "
+            f"cat {chunk_file}{window} ; echo $SIZE > {cursor_file} ; rm -f {chunk_file}"
+        )
+
+    @staticmethod
+    def _split_cursor_header(output: str):
+        """Split the `__CURSOR__` header from the output; returns (None, output) if it is missing."""
+        head, marker, rest = output.partition("__CURSOR__")
+        if not marker:
+            return None, output
+        header, _, new_output = rest.partition("\n")
+        try:
+            start, end, new_bytes = (int(value) for value in header.strip().split(":"))
+        except ValueError:
+            return None, output
+        return {"start": start, "end": end, "new_bytes": new_bytes}, new_output
+
+    def _start_output_log_command(self, session_name: str) -> str:
+        """Shell command that makes tmux append everything the session prints to its log file."""
+        log_file = self._session_log_file(session_name)
+        return f"mkdir -p {COMMAND_STATE_DIR} && touch {log_file} && tmux pipe-pane -t {session_name} 'cat >> {log_file}'"
+
+    @staticmethod
+    def _parse_offset(output: str) -> int:
+        for line in reversed(output.strip().splitlines()):
+            if line.strip().isdigit():
+                return int(line.strip())
+        return 0
+
+    @staticmethod
+    def _split_exit_status(output: str):
+        """Split the `__EXIT__<code>` line written by the blocking wait from the command output."""
+        head, marker, rest = output.partition("__EXIT__")
+        if not marker:
+            return None, output
+        status, _, command_output = rest.partition("\n")
+        status = status.strip()
+        return (int(status) if status.lstrip('-').isdigit() else None), command_output
+
+    async def _execute_raw_command(self, command: str, timeout: int = 30) -> Dict[str, Any]:
         """Execute a raw command directly in the sandbox."""
         # Ensure session exists for raw commands
         session_id = await self._ensure_session("raw_commands")
-        
+        return await self._execute_session_command(session_id, command, timeout)
+
+    async def _execute_in_dedicated_session(self, command: str, timeout: int) -> Dict[str, Any]:
+        """Execute a long-running raw command in a throwaway session, so it does not block the shared one."""
+        await self._ensure_sandbox()
+        session_id = str(uuid4())
+        await self.sandbox.process.create_session(session_id)
+        try:
+            return await self._execute_session_command(session_id, command, timeout)
+        finally:
+            try:
+                await self.sandbox.process.delete_session(session_id)
+            except Exception as e:
+                print(f"Warning: Failed to delete session {session_id}: {str(e)}")
+
+    async def _execute_session_command(self, session_id: str, command: str, timeout: int) -> Dict[str, Any]:
         # Execute command in session
         from daytona_sdk import SessionExecuteRequest
         req = SessionExecuteRequest(
@@ -214,7 +334,7 @@ class SandboxShellTool(SandboxToolsBase):
         response = await self.sandbox.process.execute_session_command(
             session_id=session_id,
             req=req,
-            timeout=30  # Short timeout for utility commands
+            timeout=timeout  # Short timeout for utility commands unless the caller waits on a command
         )
         
         logs = await self.sandbox.process.get_session_command_logs(
@@ -231,7 +351,7 @@ class SandboxShellTool(SandboxToolsBase):
         "type": "function",
         "function": {
             "name": "check_command_output",
-            "description": "Check the output of a previously executed command in a tmux session. Use this to monitor the progress or results of non-blocking commands.",
+            "description": "Check the output of a previously executed command in a tmux session. Use this to monitor the progress or results of non-blocking commands. Each check returns only the output produced since the previous check; the full output is kept in the log file returned as log_file.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -243,6 +363,20 @@ class SandboxShellTool(SandboxToolsBase):
                         "type": "boolean",
                         "description": "Whether to terminate the tmux session after checking. Set to true when you're done with the command.",
                         "default": False
+                    },
+                    "tail_lines": {
+                        "type": "integer",
+                        "description": "Only return the last N lines of the new output. Useful for long-running servers and builds."
+                    },
+                    "max_bytes": {
+                        "type": "integer",
+                        "description": "Maximum number of bytes of output to return (the end of the output is kept).",
+                        "default": DEFAULT_OUTPUT_MAX_BYTES
+                    },
+                    "from_start": {
+                        "type": "boolean",
+                        "description": "Return output from the beginning of the session log instead of only output produced since the last check.",
+                        "default": False
                     }
                 },
                 "required": ["session_name"]
@@ -256,6 +390,14 @@ class SandboxShellTool(SandboxToolsBase):
         </invoke>
         </function_calls>
         
+        <!-- Only the last 50 lines of new output -->
+        <function_calls>
+        <invoke name="check_command_output">
+        <parameter name="session_name">dev_server</parameter>
+        <parameter name="tail_lines">50</parameter>
+        </invoke>
+        </function_calls>
+        
         <!-- Example 2: Check final output and kill session -->
         <function_calls>
         <invoke name="check_command_output">
@@ -267,7 +409,10 @@ class SandboxShellTool(SandboxToolsBase):
     async def check_command_output(
         self,
         session_name: str,
-        kill_session: bool = False
+        kill_session: bool = False,
+        tail_lines: Optional[int] = None,
+        max_bytes: int = DEFAULT_OUTPUT_MAX_BYTES,
+        from_start: bool = False
     ) -> ToolResult:
         try:
             # Ensure sandbox is initialized
@@ -278,9 +423,24 @@ class SandboxShellTool(SandboxToolsBase):
             if "not_exists" in check_result.get("output", ""):
                 return self.fail_response(f"Tmux session '{session_name}' does not exist.")
             
-            # Get output from tmux pane
-            output_result = await self._execute_raw_command(f"tmux capture-pane -t {session_name} -p -S - -E -")
-            output = output_result.get("output", "")
+            # Read only the output logged since the last check
+            output_result = await self._execute_raw_command(
+                self._read_new_output_command(session_name, tail_lines, max_bytes, from_start)
+            )
+            cursor, output = self._split_cursor_header(output_result.get("output", ""))
+            
+            if cursor is None:
+                # Session started without an output log (e.g. before logging existed):
+                # fall back to the pane contents and start logging from here on
+                window = f" | tail -n {int(tail_lines)}" if tail_lines else ""
+                output_result = await self._execute_raw_command(
+                    f"tmux capture-pane -t {session_name} -p -S - -E -{window} | tail -c {int(max_bytes)} ; "
+                    f"{self._start_output_log_command(session_name)} ; rm -f {self._session_cursor_file(session_name)}"
+                )
+                output = output_result.get("output", "")
+                new_bytes = len(output.encode())
+            else:
+                new_bytes = cursor["new_bytes"]
             
             # Kill session if requested
             if kill_session:
@@ -292,7 +452,10 @@ class SandboxShellTool(SandboxToolsBase):
             return self.success_response({
                 "output": output,
                 "session_name": session_name,
-                "status": termination_status
+                "status": termination_status,
+                "new_output_bytes": new_bytes,
+                "truncated": new_bytes > len(output.encode()),
+                "log_file": self._session_log_file(session_name)
             })
                 
         except Exception as e:
@@ -394,82 +557,6 @@ class SandboxShellTool(SandboxToolsBase):
         except Exception as e:
             return self.fail_response(f"Error listing commands: {str(e)}")
 
-    def _is_command_completed(self, current_output: str, marker: str) -> bool:
-        """
-        Check if command execution is completed by comparing marker from end to start.
-        
-        Args:
-            current_output: Current output content
-            marker: Completion marker
-            
-        Returns:
-            bool: True if command completed, False otherwise
-        """
-        if not current_output or not marker:
-            return False
-
-        # Find the last complete marker match position to start comparison
-        # Avoid terminal prompt output at the end
-        marker_end_pos = -1
-        for i in range(len(current_output) - len(marker), -1, -1):
-            if current_output[i:i+len(marker)] == marker:
-                marker_end_pos = i + len(marker) - 1
-                break
-        
-        # Start comparison from found marker position or end of output
-        if marker_end_pos != -1:
-            output_idx = marker_end_pos
-            marker_idx = len(marker) - 1
-        else:
-            output_idx = len(current_output) - 1
-            marker_idx = len(marker) - 1
-        
-        # Compare characters from end to start
-        while marker_idx >= 0 and output_idx >= 0:
-            # Skip newlines in current_output
-            if current_output[output_idx] == '\n':
-                output_idx -= 1
-                continue
-                
-            # Compare characters
-            if current_output[output_idx] != marker[marker_idx]:
-                return False
-                
-            # Continue comparison
-            output_idx -= 1
-            marker_idx -= 1
-        
-        # If marker not fully matched
-        if marker_idx >= 0:
-            return False
-            
-        # Check if preceded by "echo " (command just started)
-        check_count = 0
-        echo_chars = "echo "
-        echo_idx = len(echo_chars) - 1
-        
-        while output_idx >= 0 and check_count < 5:
-            # Skip newlines
-            if current_output[output_idx] == '\n':
-                output_idx -= 1
-                continue
-                
-            check_count += 1
-            
-            # Check for "echo " pattern
-            if echo_idx >= 0 and current_output[output_idx] == echo_chars[echo_idx]:
-                echo_idx -= 1
-            else:
-                echo_idx = len(echo_chars) - 1
-                
-            output_idx -= 1
-            
-        # If "echo " found, command just started
-        if echo_idx < 0:
-            return False
-            
-        return True
-
     async def cleanup(self):
         """Clean up all sessions."""
         for session_name in list(self._sessions.keys()):
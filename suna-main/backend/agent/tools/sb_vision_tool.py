@@ -250,6 +250,8 @@ class SandboxVisionTool(SandboxToolsBase):
                 content=image_context_data, # Store the dict directly
                 is_llm_message=False # This is context generated by a tool
             )
+            # The persisted message is a backup; the next temporary message is built from memory
+            self.thread_manager.image_context = image_context_data
 
             # Inform the agent the image will be available next turn
             return self.success_response(f"Successfully loaded and compressed the image '{cleaned_path}' (reduced from {original_size / 1024:.1f}KB to {len(compressed_bytes) / 1024:.1f}KB).")
@@ -6,7 +6,7 @@ reaching the context window limitations of LLM models.
 """
 
 import json
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Set, Union
 
 from litellm.utils import token_counter
 from services.supabase import DBConnection
@@ -25,6 +25,14 @@ class ContextManager:
         """
         self.db = DBConnection()
         self.token_threshold = token_threshold
+        # message_id -> content as last sent to the LLM, used to keep the prompt-cache prefix stable
+        self.sent_message_contents: Dict[str, Any] = {}
+
+    def remember_sent_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """Record the form in which persisted messages were sent, so later calls can reuse it."""
+        for msg in messages:
+            if isinstance(msg, dict) and msg.get('message_id'):
+                self.sent_message_contents[msg['message_id']] = msg.get('content')
 
     def is_tool_result_message(self, msg: Dict[str, Any]) -> bool:
         """Check if a message is a tool result message."""
@@ -107,7 +115,7 @@ class ContextManager:
             else:
                 return msg_content
   
-    def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_tool_result_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, pinned_message_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
         """Compress the tool result messages except the most recent one."""
         uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
         max_tokens_value = max_tokens or (100 * 1000)
@@ -117,6 +125,8 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if not isinstance(msg, dict):
                     continue  # Skip non-dict messages
+                if pinned_message_ids and msg.get('message_id') in pinned_message_ids:
+                    continue  # Keep the already-sent (cached) form of this message
                 if self.is_tool_result_message(msg):  # Only compress ToolResult messages
                     _i += 1  # Count the number of ToolResult messages
                     msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
@@ -131,7 +141,7 @@ class ContextManager:
                             msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
         return messages
 
-    def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_user_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, pinned_message_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
         """Compress the user messages except the most recent one."""
         uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
         max_tokens_value = max_tokens or (100 * 1000)
@@ -141,6 +151,8 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if not isinstance(msg, dict):
                     continue  # Skip non-dict messages
+                if pinned_message_ids and msg.get('message_id') in pinned_message_ids:
+                    continue  # Keep the already-sent (cached) form of this message
                 if msg.get('role') == 'user':  # Only compress User messages
                     _i += 1  # Count the number of User messages
                     msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
@@ -155,7 +167,7 @@ class ContextManager:
                             msg["content"] = self.safe_truncate(msg["content"], int(max_tokens_value * 2))
         return messages
 
-    def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000) -> List[Dict[str, Any]]:
+    def compress_assistant_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int], token_threshold: int = 1000, pinned_message_ids: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
         """Compress the assistant messages except the most recent one."""
         uncompressed_total_token_count = token_counter(model=llm_model, messages=messages)
         max_tokens_value = max_tokens or (100 * 1000)
@@ -165,6 +177,8 @@ class ContextManager:
             for msg in reversed(messages):  # Start from the end and work backwards
                 if not isinstance(msg, dict):
                     continue  # Skip non-dict messages
+                if pinned_message_ids and msg.get('message_id') in pinned_message_ids:
+                    continue  # Keep the already-sent (cached) form of this message
                 if msg.get('role') == 'assistant':  # Only compress Assistant messages
                     _i += 1  # Count the number of Assistant messages
                     msg_token_count = token_counter(messages=[msg])  # Count the number of tokens in the message
@@ -207,7 +221,7 @@ class ContextManager:
                 result.append(msg)
         return result
 
-    def compress_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int] = 41000, token_threshold: int = 4096, max_iterations: int = 5) -> List[Dict[str, Any]]:
+    def compress_messages(self, messages: List[Dict[str, Any]], llm_model: str, max_tokens: Optional[int] = 41000, token_threshold: int = 4096, max_iterations: int = 5, pinned_contents: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """Compress the messages.
         
         Args:
@@ -216,6 +230,9 @@ class ContextManager:
             max_tokens: Maximum allowed tokens
             token_threshold: Token threshold for individual message compression (must be a power of 2)
             max_iterations: Maximum number of compression iterations
+            pinned_contents: message_id -> content already sent to the LLM. Pinned messages are
+                sent exactly as before and skipped by compression, so the provider's cached
+                prompt prefix is not invalidated. Pinning is dropped if the budget can't be met.
         """
         # Set model-specific token limits
         if 'sonnet' in llm_model.lower():
@@ -232,16 +249,29 @@ class ContextManager:
         result = messages
         result = self.remove_meta_messages(result)
 
+        pinned_message_ids = None
+        if pinned_contents:
+            result = [
+                {**msg, 'content': pinned_contents[msg['message_id']]}
+                if isinstance(msg, dict) and msg.get('message_id') in pinned_contents else msg
+                for msg in result
+            ]
+            pinned_message_ids = set(pinned_contents)
+
         uncompressed_total_token_count = token_counter(model=llm_model, messages=result)
 
-        result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold)
-        result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold)
-        result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold)
+        result = self.compress_tool_result_messages(result, llm_model, max_tokens, token_threshold, pinned_message_ids)
+        result = self.compress_user_messages(result, llm_model, max_tokens, token_threshold, pinned_message_ids)
+        result = self.compress_assistant_messages(result, llm_model, max_tokens, token_threshold, pinned_message_ids)
 
         compressed_token_count = token_counter(model=llm_model, messages=result)
 
         logger.info(f"compress_messages: {uncompressed_total_token_count} -> {compressed_token_count}")  # Log the token compression for debugging later
 
+        if pinned_message_ids and compressed_token_count > max_tokens:
+            logger.info(f"compress_messages: pinned prefix exceeds budget ({compressed_token_count} > {max_tokens}), recompressing without pinning")
+            return self.compress_messages(messages, llm_model, max_tokens, token_threshold, max_iterations)
+
         if max_iterations <= 0:
             logger.warning(f"compress_messages: Max iterations reached, omitting messages")
             result = self.compress_messages_by_omitting_messages(messages, llm_model, max_tokens)
@@ -21,6 +21,7 @@ from agentpress.tool_registry import ToolRegistry
 from agentpress.xml_tool_parser import XMLToolParser
 from langfuse.client import StatefulTraceClient
 from services.langfuse import langfuse
+from services import llm_rate_limiter
 from utils.json_helpers import (
     ensure_dict, ensure_list, safe_json_parse, 
     to_json_string, format_for_yield
@@ -149,6 +150,7 @@ class ResponseProcessor:
         can_auto_continue: bool = False,
         auto_continue_count: int = 0,
         continuous_state: Optional[Dict[str, Any]] = None,
+        llm_api_key: Optional[str] = None,
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """Process a streaming LLM response, handling tool calls and execution.
         
@@ -161,6 +163,7 @@ class ResponseProcessor:
             can_auto_continue: Whether auto-continue is enabled
             auto_continue_count: Number of auto-continue cycles
             continuous_state: Previous state of the conversation
+            llm_api_key: API key override the call was made with (selects the rate limit bucket)
             
         Yields:
             Complete message objects matching the DB schema, except for content chunks.
@@ -244,6 +247,16 @@ class ResponseProcessor:
                         streaming_metadata["usage"]["completion_tokens"] = chunk.usage.completion_tokens
                     if hasattr(chunk.usage, 'total_tokens') and chunk.usage.total_tokens is not None:
                         streaming_metadata["usage"]["total_tokens"] = chunk.usage.total_tokens
+                    # Prompt cache accounting (Anthropic reports reads/writes, OpenAI reports cached prompt tokens)
+                    cache_read_tokens = getattr(chunk.usage, 'cache_read_input_tokens', None)
+                    if cache_read_tokens is None:
+                        prompt_tokens_details = getattr(chunk.usage, 'prompt_tokens_details', None)
+                        cache_read_tokens = getattr(prompt_tokens_details, 'cached_tokens', None)
+                    if cache_read_tokens is not None:
+                        streaming_metadata["usage"]["cache_read_input_tokens"] = cache_read_tokens
+                    cache_creation_tokens = getattr(chunk.usage, 'cache_creation_input_tokens', None)
+                    if cache_creation_tokens is not None:
+                        streaming_metadata["usage"]["cache_creation_input_tokens"] = cache_creation_tokens
 
                 if hasattr(chunk, 'choices') and chunk.choices and hasattr(chunk.choices[0], 'finish_reason') and chunk.choices[0].finish_reason:
                     finish_reason = chunk.choices[0].finish_reason
@@ -422,6 +435,17 @@ class ResponseProcessor:
                     logger.warning(f"Failed to calculate usage: {str(e)}")
                     self.trace.event(name="failed_to_calculate_usage", level="WARNING", status_message=(f"Failed to calculate usage: {str(e)}"))
 
+            if "cache_read_input_tokens" in streaming_metadata["usage"] or "cache_creation_input_tokens" in streaming_metadata["usage"]:
+                logger.info(
+                    f"Prompt cache – read: {streaming_metadata['usage'].get('cache_read_input_tokens', 0)}, "
+                    f"write: {streaming_metadata['usage'].get('cache_creation_input_tokens', 0)}, "
+                    f"prompt: {streaming_metadata['usage']['prompt_tokens']}"
+                )
+
+            # Prompt tokens were reserved before the call; charge the completion to the shared limiter
+            await llm_rate_limiter.record_usage(
+                llm_model, streaming_metadata["usage"]["completion_tokens"], api_key=llm_api_key
+            )
 
             # Wait for pending tool executions from streaming phase
             tool_results_buffer = [] # Stores (tool_call, result, tool_index, context)
@@ -64,6 +64,11 @@ class ThreadManager:
             agent_config=self.agent_config
         )
         self.context_manager = ContextManager()
+        # Latest browser state / image context written by tools during this run. Kept in memory
+        # so the temporary message can be built without querying the messages table each turn;
+        # the persisted messages are only a durable backup.
+        self.browser_state: Optional[Dict[str, Any]] = None
+        self.image_context: Optional[Dict[str, Any]] = None
 
     def add_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
         """Add a tool to the ThreadManager."""
@@ -261,6 +266,7 @@ class ThreadManager:
         reasoning_effort: Optional[str] = 'low',
         enable_context_manager: bool = True,
         generation: Optional[StatefulGenerationClient] = None,
+        llm_api_key: Optional[str] = None,
     ) -> Union[Dict[str, Any], AsyncGenerator]:
         """Run a conversation thread with LLM integration and tool execution.
 
@@ -281,6 +287,7 @@ class ThreadManager:
             enable_thinking: Whether to enable thinking before making a decision
             reasoning_effort: The effort level for reasoning
             enable_context_manager: Whether to enable automatic context summarization.
+            llm_api_key: Override the provider API key (also selects the rate limit bucket)
 
         Returns:
             An async generator yielding response chunks or error dict
@@ -447,7 +454,13 @@ When using the tools:
 
                 # print(f"\n\n\n\n prepared_messages: {prepared_messages}\n\n\n\n")
 
-                prepared_messages = self.context_manager.compress_messages(prepared_messages, llm_model)
+                # Reuse the form earlier calls sent so the provider's cached prompt prefix stays valid
+                prepared_messages = self.context_manager.compress_messages(
+                    prepared_messages,
+                    llm_model,
+                    pinned_contents=self.context_manager.sent_message_contents
+                )
+                self.context_manager.remember_sent_messages(prepared_messages)
 
                 # 5. Make LLM API call
                 logger.debug("Making LLM API call")
@@ -476,7 +489,8 @@ When using the tools:
                         tool_choice=tool_choice if config.native_tool_calling else "none",
                         stream=stream,
                         enable_thinking=enable_thinking,
-                        reasoning_effort=reasoning_effort
+                        reasoning_effort=reasoning_effort,
+                        api_key=llm_api_key
                     )
                     logger.debug("Successfully received raw LLM API response stream/object")
 
@@ -497,7 +511,8 @@ When using the tools:
                             llm_model=llm_model,
                             can_auto_continue=(native_max_auto_continues > 0),
                             auto_continue_count=auto_continue_count,
-                            continuous_state=continuous_state
+                            continuous_state=continuous_state,
+                            llm_api_key=llm_api_key
                         )
                     else:
                         # Fallback to non-streaming if response is not iterable
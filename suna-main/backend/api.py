@@ -59,9 +59,11 @@ async def lifespan(app: FastAPI):
         
         # Initialize Redis connection
         from services import redis
+        from sandbox.pool import schedule_pool_replenish
         try:
             await redis.initialize_async()
             logger.info("Redis connection initialized successfully")
+            schedule_pool_replenish()
         except Exception as e:
             logger.error(f"Failed to initialize Redis connection: {e}")
             # Continue without Redis - the application will handle Redis failures gracefully
@@ -2,13 +2,33 @@
 """
 Processing 상태에서 멈춘 PDF 문서들을 자동으로 completed로 변경하는 스크립트
 저장된 청크가 있으면 completed, 없으면 failed로 처리
+
+--reprocess 옵션을 주면 상태만 바꾸는 대신 문서를 다시 임베딩한다.
+이미 저장된 청크는 내용 해시 캐시로 재사용되므로 누락된 청크만 Ollama로 보낸다.
 """
 
 import os
+import sys
 import asyncio
 from supabase import create_client
 
-async def fix_processing_documents():
+async def reprocess_documents(documents):
+    """멈춘 문서를 다시 처리 (변경 없는 청크는 임베딩 캐시 재사용)"""
+    from pdf_documents.ollama_embeddings import OllamaEmbeddingProcessor
+
+    processor = OllamaEmbeddingProcessor()
+    for doc in documents:
+        if not doc.get('storage_path'):
+            print(f"\n문서: {doc['original_file_name']} - 업로드된 파일 없음, 건너뜀")
+            continue
+        print(f"\n문서 재처리: {doc['original_file_name']}")
+        result = await processor.process_document(doc['id'], doc['storage_path'], doc['original_file_name'])
+        if result.get("success"):
+            print(f"✅ 재처리 완료: {result.get('chunks_processed')}개 청크 ({result.get('metrics')})")
+        else:
+            print(f"❌ 재처리 실패: {result.get('error')}")
+
+async def fix_processing_documents(reprocess: bool = False):
     # Supabase 연결
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -20,7 +40,7 @@ async def fix_processing_documents():
     supabase = create_client(supabase_url, supabase_key)
     
     # processing 상태인 문서들 조회
-    result = supabase.table('pdf_documents').select('id, original_file_name').eq('embedding_status', 'processing').execute()
+    result = supabase.table('pdf_documents').select('id, original_file_name, storage_path').eq('embedding_status', 'processing').execute()
     
     if not result.data:
         print("Processing 상태의 문서가 없습니다.")
@@ -28,6 +48,10 @@ async def fix_processing_documents():
     
     print(f"발견된 Processing 문서: {len(result.data)}개")
     
+    if reprocess:
+        await reprocess_documents(result.data)
+        return
+    
     for doc in result.data:
         doc_id = doc['id']
         filename = doc['original_file_name']
@@ -64,4 +88,4 @@ async def fix_processing_documents():
                 print(f"❌ 상태 변경 완료: processing → failed (저장된 청크 없음)")
 
 if __name__ == "__main__":
-    asyncio.run(fix_processing_documents())
\ No newline at end of file
+    asyncio.run(fix_processing_documents(reprocess="--reprocess" in sys.argv))
\ No newline at end of file
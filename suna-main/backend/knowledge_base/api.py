@@ -1,10 +1,12 @@
 import json
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks
-from pydantic import BaseModel, Field, HttpUrl
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from pydantic import BaseModel, Field
 from utils.auth_utils import get_current_user_id_from_jwt, verify_agent_access
 from services.supabase import DBConnection
-from knowledge_base.file_processor import FileProcessor
+from knowledge_base.ingestion import stage_file_payload, request_cancellation
+from knowledge_base.retrieval import build_knowledge_base_context, schedule_sync, sync_entries
+from run_agent_background import process_kb_ingestion_job
 from utils.logger import logger
 from flags.flags import is_enabled
 
@@ -159,6 +161,7 @@ async def create_agent_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to create agent knowledge base entry")
         
         created_entry = result.data[0]
+        await schedule_sync(agent_id, [created_entry['entry_id']])
         
         return KnowledgeBaseEntryResponse(
             entry_id=created_entry['entry_id'],
@@ -181,7 +184,6 @@ async def create_agent_knowledge_base_entry(
 @router.post("/agents/{agent_id}/upload-file")
 async def upload_file_to_agent_kb(
     agent_id: str,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user_id: str = Depends(get_current_user_id_from_jwt)
 ):
@@ -215,15 +217,13 @@ async def upload_file_to_agent_kb(
             raise HTTPException(status_code=500, detail="Failed to create processing job")
         
         job_id = job_id.data
-        background_tasks.add_task(
-            process_file_background,
-            job_id,
-            agent_id,
-            account_id,
-            file_content,
-            file.filename,
-            file.content_type or 'application/octet-stream'
-        )
+        source_info = {
+            'filename': file.filename,
+            'mime_type': file.content_type or 'application/octet-stream',
+            'file_size': len(file_content)
+        }
+        await stage_file_payload(client, job_id, file_content)
+        process_kb_ingestion_job.send(job_id, 'file_upload', agent_id, account_id, source_info)
         
         return {
             "job_id": job_id,
@@ -287,6 +287,7 @@ async def update_knowledge_base_entry(
             raise HTTPException(status_code=500, detail="Failed to update knowledge base entry")
         
         updated_entry = result.data[0]
+        await schedule_sync(agent_id, [updated_entry['entry_id']])
         
         logger.info(f"Updated agent knowledge base entry {entry_id} for agent {agent_id}")
         
@@ -340,6 +341,7 @@ async def delete_knowledge_base_entry(
         await verify_agent_access(client, agent_id, user_id)
         
         result = await client.table('agent_knowledge_base_entries').delete().eq('entry_id', entry_id).execute()
+        await sync_entries(agent_id, removed_ids=[entry_id])
         
         logger.info(f"Deleted agent knowledge base entry {entry_id} for agent {agent_id}")
         
@@ -451,59 +453,53 @@ async def get_agent_processing_jobs(
         logger.error(f"Error getting processing jobs for agent {agent_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get processing jobs")
 
-async def process_file_background(
-    job_id: str,
+@router.post("/agents/{agent_id}/processing-jobs/{job_id}/cancel")
+async def cancel_agent_processing_job(
     agent_id: str,
-    account_id: str,
-    file_content: bytes,
-    filename: str,
-    mime_type: str
+    job_id: str,
+    user_id: str = Depends(get_current_user_id_from_jwt)
 ):
-    """Background task to process uploaded files"""
+    if not await is_enabled("knowledge_base"):
+        raise HTTPException(
+            status_code=403, 
+            detail="This feature is not available at the moment."
+        )
     
-    processor = FileProcessor()
-    client = await processor.db.client
+    """Cancel a pending or running processing job"""
     try:
-        await client.rpc('update_agent_kb_job_status', {
-            'p_job_id': job_id,
-            'p_status': 'processing'
+        client = await db.client
+
+        await verify_agent_access(client, agent_id, user_id)
+        
+        result = await client.rpc('get_agent_kb_processing_jobs', {
+            'p_agent_id': agent_id,
+            'p_limit': 100
         }).execute()
         
-        result = await processor.process_file_upload(
-            agent_id, account_id, file_content, filename, mime_type
-        )
+        job_data = next((job for job in result.data or [] if job['job_id'] == job_id), None)
+        if not job_data:
+            raise HTTPException(status_code=404, detail="Processing job not found")
         
-        if result['success']:
-            await client.rpc('update_agent_kb_job_status', {
-                'p_job_id': job_id,
-                'p_status': 'completed',
-                'p_result_info': result,
-                'p_entries_created': 1,
-                'p_total_files': 1
-            }).execute()
-        else:
-            await client.rpc('update_agent_kb_job_status', {
-                'p_job_id': job_id,
-                'p_status': 'failed',
-                'p_error_message': result.get('error', 'Unknown error')
-            }).execute()
-            
+        if job_data['status'] not in ('pending', 'processing'):
+            raise HTTPException(status_code=409, detail=f"Processing job is already {job_data['status']}")
+        
+        # The worker checks this flag between files and marks the job as failed
+        await request_cancellation(job_id)
+        
+        return {"job_id": job_id, "message": "Cancellation requested"}
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in background file processing for job {job_id}: {str(e)}")
-        try:
-            await client.rpc('update_agent_kb_job_status', {
-                'p_job_id': job_id,
-                'p_status': 'failed',
-                'p_error_message': str(e)
-            }).execute()
-        except:
-            pass
+        logger.error(f"Error cancelling processing job {job_id} for agent {agent_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to cancel processing job")
 
 
 @router.get("/agents/{agent_id}/context")
 async def get_agent_knowledge_base_context(
     agent_id: str,
     max_tokens: int = 4000,
+    query: Optional[str] = None,
     user_id: str = Depends(get_current_user_id_from_jwt)
 ):
     if not await is_enabled("knowledge_base"):
@@ -512,19 +508,27 @@ async def get_agent_knowledge_base_context(
             detail="This feature is not available at the moment."
         )
     
-    """Get knowledge base context for agent prompts"""
+    """Get knowledge base context for agent prompts
+
+    With `query`, only the passages most relevant to it are returned (what the
+    agent gets at prompt-build time); without it, the whole knowledge base up to
+    `max_tokens`.
+    """
     try:
         client = await db.client
         
         # Verify agent access
         await verify_agent_access(client, agent_id, user_id)
         
-        result = await client.rpc('get_agent_knowledge_base_context', {
-            'p_agent_id': agent_id,
-            'p_max_tokens': max_tokens
-        }).execute()
-        
-        context = result.data if result.data else None
+        if query:
+            context = await build_knowledge_base_context(agent_id, query, max_tokens=max_tokens)
+        else:
+            result = await client.rpc('get_agent_knowledge_base_context', {
+                'p_agent_id': agent_id,
+                'p_max_tokens': max_tokens
+            }).execute()
+            
+            context = result.data if result.data else None
         
         return {
             "context": context,
@@ -6,16 +6,18 @@ import shutil
 import asyncio
 import subprocess
 import re
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 from pathlib import Path
 import mimetypes
 import chardet
 
-import PyPDF2
 import docx
 
 from utils.logger import logger
 from services.supabase import DBConnection
+from utils.pdf_extraction import extract_pdf_text
+from knowledge_base.ingestion import IngestionJob, IngestionCancelled
+from knowledge_base.retrieval import sync_entries
 
 class FileProcessor:
     SUPPORTED_TEXT_EXTENSIONS = {
@@ -29,6 +31,10 @@ class FileProcessor:
     MAX_FILE_SIZE = 50 * 1024 * 1024
     MAX_ZIP_ENTRIES = 1000
     MAX_CONTENT_LENGTH = 100000
+    # Files of one ZIP/repository extracted at the same time
+    INGESTION_CONCURRENCY = int(os.getenv('KB_INGESTION_CONCURRENCY', '8'))
+    # Rows per multi-row insert into agent_knowledge_base_entries
+    INSERT_BATCH_SIZE = 50
     
     def __init__(self):
         self.db = DBConnection()
@@ -39,7 +45,8 @@ class FileProcessor:
         account_id: str, 
         file_content: bytes, 
         filename: str, 
-        mime_type: str
+        mime_type: str,
+        job: Optional[IngestionJob] = None
     ) -> Dict[str, Any]:
         try:
             file_size = len(file_content)
@@ -49,7 +56,7 @@ class FileProcessor:
             file_extension = Path(filename).suffix.lower()
 
             if file_extension == '.zip':
-                return await self._process_zip_file(agent_id, account_id, file_content, filename)
+                return await self._process_zip_file(agent_id, account_id, file_content, filename, job)
             
             content = await self._extract_file_content(file_content, filename, mime_type)
             
@@ -82,6 +89,12 @@ class FileProcessor:
             if not result.data:
                 raise Exception("Failed to create knowledge base entry")
             
+            await sync_entries(agent_id, entries=result.data)
+            
+            if job:
+                job.record_entries(result.data)
+                job.total_files = job.processed_files = job.entries_created = 1
+            
             return {
                 'success': True,
                 'entry_id': result.data[0]['entry_id'],
@@ -90,6 +103,8 @@ class FileProcessor:
                 'extraction_method': entry_data['source_metadata']['extraction_method']
             }
             
+        except IngestionCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error processing file {filename}: {str(e)}")
             return {
@@ -103,7 +118,8 @@ class FileProcessor:
         agent_id: str, 
         account_id: str, 
         zip_content: bytes, 
-        zip_filename: str
+        zip_filename: str,
+        job: Optional[IngestionJob] = None
     ) -> Dict[str, Any]:
         try:
             client = await self.db.client
@@ -129,9 +145,8 @@ class FileProcessor:
             
             zip_result = await client.table('agent_knowledge_base_entries').insert(zip_entry_data).execute()
             zip_entry_id = zip_result.data[0]['entry_id']
-            
-            extracted_files = []
-            failed_files = []
+            if job:
+                job.record_entries(zip_result.data)
             
             with zipfile.ZipFile(io.BytesIO(zip_content), 'r') as zip_ref:
                 file_list = zip_ref.namelist()
@@ -139,62 +154,44 @@ class FileProcessor:
                 if len(file_list) > self.MAX_ZIP_ENTRIES:
                     raise ValueError(f"ZIP contains too many files: {len(file_list)} (max: {self.MAX_ZIP_ENTRIES})")
                 
-                for file_path in file_list:
-                    if file_path.endswith('/'):
-                        continue
-                    
-                    try:
-                        file_content = zip_ref.read(file_path)
-                        filename = os.path.basename(file_path)
-                        
-                        if not filename:
-                            continue
-                        
-                        mime_type, _ = mimetypes.guess_type(filename)
-                        if not mime_type:
-                            mime_type = 'application/octet-stream'
-                        
-                        content = await self._extract_file_content(file_content, filename, mime_type)
-                        
-                        if content and content.strip():
-                            extracted_entry_data = {
-                                'agent_id': agent_id,
-                                'account_id': account_id,
-                                'name': f"📄 {filename}",
-                                'description': f"Extracted from {zip_filename}: {file_path}",
-                                'content': content[:self.MAX_CONTENT_LENGTH],
-                                'source_type': 'zip_extracted',
-                                'source_metadata': {
-                                    'filename': filename,
-                                    'original_path': file_path,
-                                    'zip_filename': zip_filename,
-                                    'mime_type': mime_type,
-                                    'file_size': len(file_content),
-                                    'extraction_method': self._get_extraction_method(Path(filename).suffix.lower(), mime_type)
-                                },
-                                'file_size': len(file_content),
-                                'file_mime_type': mime_type,
-                                'extracted_from_zip_id': zip_entry_id,
-                                'usage_context': 'always',
-                                'is_active': True
-                            }
-                            
-                            extracted_result = await client.table('agent_knowledge_base_entries').insert(extracted_entry_data).execute()
-                            
-                            extracted_files.append({
-                                'filename': filename,
-                                'path': file_path,
-                                'entry_id': extracted_result.data[0]['entry_id'],
-                                'content_length': len(content)
-                            })
-                        
-                    except Exception as e:
-                        logger.error(f"Error extracting {file_path} from ZIP: {str(e)}")
-                        failed_files.append({
-                            'filename': os.path.basename(file_path),
-                            'path': file_path,
-                            'error': str(e)
-                        })
+                file_paths = [
+                    file_path for file_path in file_list
+                    if not file_path.endswith('/') and os.path.basename(file_path)
+                ]
+                
+                # Decompression happens off the event loop, one member at a time
+                read_lock = asyncio.Lock()
+                
+                async def read_member(file_path: str) -> bytes:
+                    async with read_lock:
+                        return await asyncio.to_thread(zip_ref.read, file_path)
+                
+                def build_entry(file_path: str, filename: str, file_content: bytes, mime_type: str, content: str) -> Dict[str, Any]:
+                    return {
+                        'agent_id': agent_id,
+                        'account_id': account_id,
+                        'name': f"📄 {filename}",
+                        'description': f"Extracted from {zip_filename}: {file_path}",
+                        'content': content[:self.MAX_CONTENT_LENGTH],
+                        'source_type': 'zip_extracted',
+                        'source_metadata': {
+                            'filename': filename,
+                            'original_path': file_path,
+                            'zip_filename': zip_filename,
+                            'mime_type': mime_type,
+                            'file_size': len(file_content),
+                            'extraction_method': self._get_extraction_method(Path(filename).suffix.lower(), mime_type)
+                        },
+                        'file_size': len(file_content),
+                        'file_mime_type': mime_type,
+                        'extracted_from_zip_id': zip_entry_id,
+                        'usage_context': 'always',
+                        'is_active': True
+                    }
+                
+                extracted_files, failed_files = await self._ingest_files(
+                    file_paths, read_member, build_entry, 'path', job
+                )
             
             return {
                 'success': True,
@@ -206,6 +203,8 @@ class FileProcessor:
                 'total_failed': len(failed_files)
             }
             
+        except IngestionCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error processing ZIP file {zip_filename}: {str(e)}")
             return {
@@ -221,7 +220,8 @@ class FileProcessor:
         git_url: str,
         branch: str = 'main',
         include_patterns: List[str] = None,
-        exclude_patterns: List[str] = None
+        exclude_patterns: List[str] = None,
+        job: Optional[IngestionJob] = None
     ) -> Dict[str, Any]:
         if include_patterns is None:
             include_patterns = ['*.txt', '*.pdf', '*.docx']
@@ -266,75 +266,47 @@ class FileProcessor:
             
             repo_result = await client.table('agent_knowledge_base_entries').insert(repo_entry_data).execute()
             repo_entry_id = repo_result.data[0]['entry_id']
+            if job:
+                job.record_entries(repo_result.data)
             
-            processed_files = []
-            failed_files = []
+            file_paths = await asyncio.to_thread(
+                self._list_repository_files, temp_dir, include_patterns, exclude_patterns
+            )
             
-            for root, dirs, files in os.walk(temp_dir):
-                if '.git' in dirs:
-                    dirs.remove('.git')
-                
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, temp_dir)
-                    
-                    if not self._should_include_file(relative_path, include_patterns, exclude_patterns):
-                        continue
-                    
-                    try:
-                        with open(file_path, 'rb') as f:
-                            file_content = f.read()
-                        
-                        if len(file_content) > self.MAX_FILE_SIZE:
-                            continue
-                        
-                        mime_type, _ = mimetypes.guess_type(file)
-                        if not mime_type:
-                            mime_type = 'application/octet-stream'
-                        
-                        content = await self._extract_file_content(file_content, file, mime_type)
-                        
-                        if content and content.strip():
-                            file_entry_data = {
-                                'agent_id': agent_id,
-                                'account_id': account_id,
-                                'name': f"📄 {file}",
-                                'description': f"From {repo_name}: {relative_path}",
-                                'content': content[:self.MAX_CONTENT_LENGTH],
-                                'source_type': 'git_repo',
-                                'source_metadata': {
-                                    'filename': file,
-                                    'relative_path': relative_path,
-                                    'git_url': git_url,
-                                    'branch': branch,
-                                    'repo_name': repo_name,
-                                    'mime_type': mime_type,
-                                    'file_size': len(file_content),
-                                    'extraction_method': self._get_extraction_method(Path(file).suffix.lower(), mime_type)
-                                },
-                                'file_size': len(file_content),
-                                'file_mime_type': mime_type,
-                                'extracted_from_zip_id': repo_entry_id,
-                                'usage_context': 'always',
-                                'is_active': True
-                            }
-                            
-                            file_result = await client.table('agent_knowledge_base_entries').insert(file_entry_data).execute()
-                            
-                            processed_files.append({
-                                'filename': file,
-                                'relative_path': relative_path,
-                                'entry_id': file_result.data[0]['entry_id'],
-                                'content_length': len(content)
-                            })
-                    
-                    except Exception as e:
-                        logger.error(f"Error processing {relative_path} from git repo: {str(e)}")
-                        failed_files.append({
-                            'filename': file,
-                            'relative_path': relative_path,
-                            'error': str(e)
-                        })
+            async def read_repo_file(relative_path: str) -> Optional[bytes]:
+                file_path = os.path.join(temp_dir, relative_path)
+                if os.path.getsize(file_path) > self.MAX_FILE_SIZE:
+                    return None
+                return await asyncio.to_thread(Path(file_path).read_bytes)
+            
+            def build_entry(relative_path: str, file: str, file_content: bytes, mime_type: str, content: str) -> Dict[str, Any]:
+                return {
+                    'agent_id': agent_id,
+                    'account_id': account_id,
+                    'name': f"📄 {file}",
+                    'description': f"From {repo_name}: {relative_path}",
+                    'content': content[:self.MAX_CONTENT_LENGTH],
+                    'source_type': 'git_repo',
+                    'source_metadata': {
+                        'filename': file,
+                        'relative_path': relative_path,
+                        'git_url': git_url,
+                        'branch': branch,
+                        'repo_name': repo_name,
+                        'mime_type': mime_type,
+                        'file_size': len(file_content),
+                        'extraction_method': self._get_extraction_method(Path(file).suffix.lower(), mime_type)
+                    },
+                    'file_size': len(file_content),
+                    'file_mime_type': mime_type,
+                    'extracted_from_zip_id': repo_entry_id,
+                    'usage_context': 'always',
+                    'is_active': True
+                }
+            
+            processed_files, failed_files = await self._ingest_files(
+                file_paths, read_repo_file, build_entry, 'relative_path', job
+            )
             
             return {
                 'success': True,
@@ -348,6 +320,8 @@ class FileProcessor:
                 'total_failed': len(failed_files)
             }
             
+        except IngestionCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error processing git repository {git_url}: {str(e)}")
             return {
@@ -360,18 +334,127 @@ class FileProcessor:
             if temp_dir and os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir, ignore_errors=True)
     
+    async def _ingest_files(
+        self,
+        file_paths: List[str],
+        read_file: Callable[[str], Awaitable[Optional[bytes]]],
+        build_entry: Callable[[str, str, bytes, str, str], Dict[str, Any]],
+        path_key: str,
+        job: Optional[IngestionJob] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Extract files concurrently and insert their entries in multi-row batches.
+        
+        `read_file` returns None for files that should be skipped. Returns
+        (processed_files, failed_files) in the shape the callers already report.
+        """
+        semaphore = asyncio.Semaphore(self.INGESTION_CONCURRENCY)
+        
+        async def extract(file_path: str):
+            async with semaphore:
+                if job:
+                    await job.check_cancelled()
+                filename = os.path.basename(file_path)
+                try:
+                    file_content = await read_file(file_path)
+                    if file_content is None:
+                        return file_path, None, None
+                    
+                    mime_type, _ = mimetypes.guess_type(filename)
+                    if not mime_type:
+                        mime_type = 'application/octet-stream'
+                    
+                    content = await self._extract_file_content(file_content, filename, mime_type)
+                    if not content or not content.strip():
+                        return file_path, None, None
+                    
+                    entry = build_entry(file_path, filename, file_content, mime_type, content)
+                    record = {
+                        'filename': filename,
+                        path_key: file_path,
+                        'content_length': len(content)
+                    }
+                    return file_path, (entry, record), None
+                except Exception as e:
+                    logger.error(f"Error extracting {file_path}: {str(e)}")
+                    return file_path, None, {'filename': filename, path_key: file_path, 'error': str(e)}
+        
+        processed_files = []
+        failed_files = []
+        pending_entries = []
+        
+        async def flush():
+            batch = pending_entries[:]
+            pending_entries.clear()
+            records = await self._insert_entries([entry for entry, _ in batch])
+            for (_, record), row in zip(batch, records):
+                record['entry_id'] = row['entry_id']
+                processed_files.append(record)
+            if job:
+                job.record_entries(records)
+                job.entries_created += len(records)
+        
+        if job:
+            job.total_files = len(file_paths)
+            await job.report_progress(force=True)
+        
+        tasks = [asyncio.create_task(extract(file_path)) for file_path in file_paths]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                file_path, extracted, failure = await next_done
+                if extracted:
+                    pending_entries.append(extracted)
+                    if len(pending_entries) >= self.INSERT_BATCH_SIZE:
+                        await flush()
+                if failure:
+                    failed_files.append(failure)
+                
+                if job:
+                    job.processed_files += 1
+                    job.failed_files = len(failed_files)
+                    await job.report_progress()
+            
+            if pending_entries:
+                await flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        return processed_files, failed_files
+    
+    async def _insert_entries(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not entries:
+            return []
+        client = await self.db.client
+        result = await client.table('agent_knowledge_base_entries').insert(entries).execute()
+        if not result.data or len(result.data) != len(entries):
+            raise Exception("Failed to create knowledge base entries")
+        await sync_entries(result.data[0]['agent_id'], entries=result.data)
+        return result.data
+    
+    def _list_repository_files(self, repo_dir: str, include_patterns: List[str], exclude_patterns: List[str]) -> List[str]:
+        file_paths = []
+        for root, dirs, files in os.walk(repo_dir):
+            if '.git' in dirs:
+                dirs.remove('.git')
+            
+            for file in files:
+                relative_path = os.path.relpath(os.path.join(root, file), repo_dir)
+                if self._should_include_file(relative_path, include_patterns, exclude_patterns):
+                    file_paths.append(relative_path)
+        return file_paths
+    
     async def _extract_file_content(self, file_content: bytes, filename: str, mime_type: str) -> str:
         file_extension = Path(filename).suffix.lower()
         
         try:
             if file_extension in self.SUPPORTED_TEXT_EXTENSIONS or mime_type.startswith('text/'):
-                return self._extract_text_content(file_content)
+                return await asyncio.to_thread(self._extract_text_content, file_content)
             
             elif file_extension == '.pdf':
-                return self._extract_pdf_content(file_content)
+                return await self._extract_pdf_content(file_content)
             
             elif file_extension == '.docx':
-                return self._extract_docx_content(file_content)
+                return await asyncio.to_thread(self._extract_docx_content, file_content)
             
             else:
                 raise ValueError(f"Unsupported file format: {file_extension}. Only .txt, .pdf, and .docx files are supported.")
@@ -391,14 +474,10 @@ class FileProcessor:
         
         return self._sanitize_content(raw_text)
     
-    def _extract_pdf_content(self, file_content: bytes) -> str:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-        text_content = []
-        
-        for page in pdf_reader.pages:
-            text_content.append(page.extract_text())
-        
-        raw_text = '\n\n'.join(text_content)
+    async def _extract_pdf_content(self, file_content: bytes) -> str:
+        # Pages are extracted in a process pool; content is truncated to MAX_CONTENT_LENGTH anyway,
+        # so stop reading pages once that much text has been extracted
+        raw_text = await extract_pdf_text(file_content, separator='\n\n', max_chars=self.MAX_CONTENT_LENGTH)
         return self._sanitize_content(raw_text)
     
     def _extract_docx_content(self, file_content: bytes) -> str:
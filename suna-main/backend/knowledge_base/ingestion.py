@@ -0,0 +1,189 @@
+"""
+Knowledge-base ingestion jobs.
+
+File uploads and ZIP archives are ingested by the `process_kb_ingestion_job`
+dramatiq actor instead of FastAPI background tasks, so large archives never tie
+up API workers. This module holds the pieces shared by the API and the worker:
+
+- uploaded bytes are staged in the private `kb-ingestion-staging` storage
+  bucket under the job id (dramatiq messages and Redis values should stay
+  small); the worker downloads the object and deletes it when the job ends
+- progress is written to the processing job row (throttled), so
+  `get_agent_processing_jobs` shows files processed/failed while a job runs
+- cancellation is a Redis flag checked between files; entries the job already
+  inserted are deleted, so a cancelled job leaves nothing behind
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+from services import redis
+from services.supabase import DBConnection
+from utils.logger import logger
+
+STAGING_BUCKET = "kb-ingestion-staging"
+CANCEL_KEY_PREFIX = "kb_ingestion_cancel"
+CANCEL_TTL_SECONDS = 3600 * 24
+# Minimum interval between progress writes to the job row
+PROGRESS_UPDATE_INTERVAL_SECONDS = 2.0
+# Entry ids per delete when cleaning up a cancelled job
+DELETE_BATCH_SIZE = 100
+
+CANCELLED_MESSAGE = "Cancelled by user"
+
+
+class IngestionCancelled(Exception):
+    pass
+
+
+async def stage_file_payload(client, job_id: str, file_content: bytes) -> None:
+    """Store uploaded bytes for the worker in the staging bucket."""
+    await client.storage.from_(STAGING_BUCKET).upload(
+        job_id,
+        file_content,
+        {"content-type": "application/octet-stream"}
+    )
+
+
+async def fetch_file_payload(client, job_id: str) -> Optional[bytes]:
+    try:
+        return await client.storage.from_(STAGING_BUCKET).download(job_id)
+    except Exception as e:
+        logger.warning(f"Staged upload for KB job {job_id} is not available: {str(e)}")
+        return None
+
+
+async def delete_file_payload(client, job_id: str) -> None:
+    try:
+        await client.storage.from_(STAGING_BUCKET).remove([job_id])
+    except Exception as e:
+        logger.warning(f"Failed to delete staged upload for KB job {job_id}: {str(e)}")
+
+
+async def request_cancellation(job_id: str) -> None:
+    await redis.set(f"{CANCEL_KEY_PREFIX}:{job_id}", "1", ex=CANCEL_TTL_SECONDS)
+
+
+class IngestionJob:
+    """Progress reporting and cancellation checks for one processing job."""
+
+    def __init__(self, job_id: str, db: Optional[DBConnection] = None):
+        self.job_id = job_id
+        self.db = db or DBConnection()
+        self.total_files = 0
+        self.processed_files = 0
+        self.failed_files = 0
+        self.entries_created = 0
+        # Entries inserted so far, deleted again if the job is cancelled
+        self.entry_ids: List[str] = []
+        self._last_progress_update = 0.0
+
+    def record_entries(self, rows: List[Dict[str, Any]]) -> None:
+        self.entry_ids.extend(row['entry_id'] for row in rows)
+
+    async def update_status(self, status: str, **fields: Any) -> None:
+        client = await self.db.client
+        params: Dict[str, Any] = {'p_job_id': self.job_id, 'p_status': status}
+        params.update({f"p_{name}": value for name, value in fields.items()})
+        await client.rpc('update_agent_kb_job_status', params).execute()
+
+    async def check_cancelled(self) -> None:
+        if await redis.get(f"{CANCEL_KEY_PREFIX}:{self.job_id}"):
+            raise IngestionCancelled(CANCELLED_MESSAGE)
+
+    async def report_progress(self, force: bool = False) -> None:
+        """Write files processed/failed so far to the job row, at most every few seconds."""
+        now = time.monotonic()
+        if not force and now - self._last_progress_update < PROGRESS_UPDATE_INTERVAL_SECONDS:
+            return
+        self._last_progress_update = now
+        try:
+            await self.update_status(
+                'processing',
+                result_info={
+                    'progress': {
+                        'processed_files': self.processed_files,
+                        'failed_files': self.failed_files,
+                        'total_files': self.total_files,
+                    }
+                },
+                entries_created=self.entries_created,
+                total_files=self.total_files,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to report progress for KB job {self.job_id}: {str(e)}")
+
+    async def delete_created_entries(self, agent_id: str) -> None:
+        """Remove the entries this job inserted before it was cancelled."""
+        from knowledge_base.retrieval import sync_entries
+
+        if not self.entry_ids:
+            return
+        client = await self.db.client
+        for start in range(0, len(self.entry_ids), DELETE_BATCH_SIZE):
+            batch = self.entry_ids[start:start + DELETE_BATCH_SIZE]
+            await client.table('agent_knowledge_base_entries').delete().in_('entry_id', batch).execute()
+        await sync_entries(agent_id, removed_ids=self.entry_ids)
+        logger.info(f"Deleted {len(self.entry_ids)} entries of cancelled KB job {self.job_id}")
+        self.entry_ids = []
+
+
+async def run_ingestion_job(
+    job_id: str,
+    job_type: str,
+    agent_id: str,
+    account_id: str,
+    source_info: Dict[str, Any],
+) -> None:
+    """Process one ingestion job end to end and record the outcome on the job row."""
+    from knowledge_base.file_processor import FileProcessor
+
+    processor = FileProcessor()
+    job = IngestionJob(job_id, processor.db)
+    client = await processor.db.client
+    try:
+        await job.check_cancelled()
+        await job.update_status('processing')
+
+        file_content = await fetch_file_payload(client, job_id)
+        if file_content is None:
+            raise Exception("Uploaded file is no longer available for processing")
+        result = await processor.process_file_upload(
+            agent_id,
+            account_id,
+            file_content,
+            source_info['filename'],
+            source_info.get('mime_type') or 'application/octet-stream',
+            job=job,
+        )
+
+        if result['success']:
+            await job.update_status(
+                'completed',
+                result_info=result,
+                entries_created=job.entries_created,
+                total_files=job.total_files,
+            )
+        else:
+            await job.update_status('failed', error_message=result.get('error', 'Unknown error'))
+
+    except IngestionCancelled:
+        logger.info(f"KB ingestion job {job_id} cancelled")
+        try:
+            await job.delete_created_entries(agent_id)
+        except Exception as e:
+            logger.error(f"Failed to delete entries of cancelled KB job {job_id}: {str(e)}")
+        await job.update_status(
+            'failed',
+            error_message=CANCELLED_MESSAGE,
+            entries_created=len(job.entry_ids),
+            total_files=job.total_files,
+        )
+    except Exception as e:
+        logger.error(f"Error in KB ingestion job {job_id}: {str(e)}")
+        try:
+            await job.update_status('failed', error_message=str(e))
+        except Exception:
+            pass
+    finally:
+        await delete_file_payload(client, job_id)
@@ -0,0 +1,435 @@
+"""
+Retrieval-based knowledge-base context.
+
+Instead of concatenating every active entry of an agent up to a token budget
+(the `get_agent_knowledge_base_context` RPC), entries are chunked and embedded
+when they are written, and at prompt-build time only the passages most
+relevant to the latest user message are selected.
+
+- Write time: `index_entries` / `remove_entries` keep a per-agent Redis hash
+  `kb_chunks:{agent_id}` (entry_id -> chunks with float32 embeddings) and bump
+  `kb_index_version:{agent_id}`, atomically and only if the agent is already
+  indexed. Entry writes from the API are applied by the
+  `sync_knowledge_base_entries` dramatiq actor, so requests never wait on Ollama.
+- Read time: the hash is turned into an in-process index (normalized vector
+  matrix plus BM25 postings) cached per agent and version. Vector and keyword
+  rankings are fused with reciprocal rank fusion and passages are added until
+  the token budget is reached.
+- Contexts are cached per (agent, version, normalized message, budget), so
+  repeated turns do not hit Ollama or rebuild anything.
+
+Agents whose KB predates this index (no version key, e.g. after a Redis flush)
+are indexed from the entries table by the `reindex_knowledge_base` dramatiq
+actor, scheduled on first retrieval or write; until it finishes, the whole-KB RPC context
+is returned so agent startup never waits on embedding. If Ollama is
+unavailable, chunks are stored without embeddings and retrieval falls back to
+keyword ranking.
+"""
+
+import asyncio
+import base64
+import json
+import math
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from litellm.utils import token_counter
+
+from services import redis
+from services.supabase import DBConnection
+from utils.logger import logger
+from pdf_documents.bm25_index import tokenize
+from pdf_documents.ollama_embeddings import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MODEL,
+    EMBEDDING_TIMEOUT_SECONDS,
+    embed_texts,
+)
+from pdf_documents.search_cache import LRUTTLCache, normalize_query, query_embedding_cache
+from pdf_documents.search_service import rrf_scores
+
+CHUNKS_KEY_PREFIX = "kb_chunks"
+VERSION_KEY_PREFIX = "kb_index_version"
+REINDEX_LOCK_KEY_PREFIX = "kb_reindex_scheduled"
+# Set when a write is skipped because the agent is not indexed yet; a running reindex re-runs
+REINDEX_PENDING_KEY_PREFIX = "kb_reindex_pending"
+# A failed reindex is retried on the first retrieval after this
+REINDEX_LOCK_TTL_SECONDS = 600
+
+KB_CHUNK_SIZE = 1000
+KB_CHUNK_OVERLAP = 150
+KB_CONTEXT_MAX_TOKENS = 4000
+KB_CONTEXT_TOP_K = 8
+# Candidates taken from each ranking before fusion
+KB_CANDIDATES_PER_RETRIEVER = 30
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Applies one incremental write only if the agent is already indexed (version key exists) and
+# bumps the version. Returns the new version, or 0 without writing anything otherwise.
+# ARGV: number of entry ids to delete, those ids, then entry_id/record pairs to set.
+_APPLY_WRITE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return 0
+end
+local deletes = tonumber(ARGV[1])
+for i = 2, deletes + 1 do
+    redis.call('HDEL', KEYS[1], ARGV[i])
+end
+if #ARGV > deletes + 1 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, deletes + 2))
+end
+return redis.call('INCR', KEYS[2])
+"""
+
+_index_cache = LRUTTLCache(max_size=256, ttl_seconds=3600)
+_context_cache = LRUTTLCache(max_size=1024, ttl_seconds=600)
+
+_text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=KB_CHUNK_SIZE,
+    chunk_overlap=KB_CHUNK_OVERLAP,
+    separators=["\n\n", "\n", ".", "!", "?", "。", " ", ""],
+    length_function=len,
+)
+
+db = DBConnection()
+
+
+def _chunks_key(agent_id: str) -> str:
+    return f"{CHUNKS_KEY_PREFIX}:{agent_id}"
+
+
+def _version_key(agent_id: str) -> str:
+    return f"{VERSION_KEY_PREFIX}:{agent_id}"
+
+
+def _reindex_lock_key(agent_id: str) -> str:
+    return f"{REINDEX_LOCK_KEY_PREFIX}:{agent_id}"
+
+
+def _reindex_pending_key(agent_id: str) -> str:
+    return f"{REINDEX_PENDING_KEY_PREFIX}:{agent_id}"
+
+
+def _encode_embedding(embedding: Optional[List[float]]) -> Optional[str]:
+    if not embedding:
+        return None
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_embedding(encoded: Optional[str]) -> Optional[np.ndarray]:
+    if not encoded:
+        return None
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+
+
+async def _embed_all(texts: List[str]) -> List[Optional[List[float]]]:
+    embeddings: List[Optional[List[float]]] = []
+    async with httpx.AsyncClient(timeout=EMBEDDING_TIMEOUT_SECONDS) as client:
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            embeddings.extend(await embed_texts(texts[start:start + EMBEDDING_BATCH_SIZE], client))
+    return embeddings
+
+
+async def invalidate_agent(agent_id: str) -> None:
+    """Force a rebuild from the entries table on the next retrieval."""
+    await redis.delete(_version_key(agent_id))
+
+
+async def _build_records(entries: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Chunk and embed active entries (rows of agent_knowledge_base_entries) into hash records."""
+    records = {}
+    for entry in entries:
+        if entry.get('is_active') is False or not (entry.get('content') or '').strip():
+            continue
+        chunks = _text_splitter.split_text(entry['content'])
+        embeddings = await _embed_all(chunks)
+        records[entry['entry_id']] = json.dumps({
+            'name': entry.get('name') or '',
+            'parent_id': entry.get('extracted_from_zip_id'),
+            'chunks': [
+                {'text': chunk, 'embedding': _encode_embedding(embedding)}
+                for chunk, embedding in zip(chunks, embeddings)
+            ],
+        })
+    return records
+
+
+async def _skip_unindexed_write(agent_id: str) -> None:
+    """An agent without an index gets a full reindex; a partial hash would hide its older entries."""
+    await redis.set(_reindex_pending_key(agent_id), "1", ex=REINDEX_LOCK_TTL_SECONDS)
+    await schedule_reindex(agent_id)
+
+
+async def _apply_write(agent_id: str, removed_ids: List[str], records: Dict[str, str]) -> None:
+    redis_client = await redis.get_client()
+    script = redis_client.register_script(_APPLY_WRITE_SCRIPT)
+    args: List[Any] = [len(removed_ids), *removed_ids]
+    for entry_id, record in records.items():
+        args.extend([entry_id, record])
+    version = await script(keys=[_chunks_key(agent_id), _version_key(agent_id)], args=args)
+    if not int(version):
+        await _skip_unindexed_write(agent_id)
+
+
+async def index_entries(agent_id: str, entries: List[Dict[str, Any]]) -> None:
+    """Chunk, embed and store entries (rows of agent_knowledge_base_entries)."""
+    if not entries:
+        return
+    # Checked again atomically on write; this only avoids embedding for an unindexed agent
+    if await redis.get(_version_key(agent_id)) is None:
+        await _skip_unindexed_write(agent_id)
+        return
+    records = await _build_records(entries)
+    inactive = [entry['entry_id'] for entry in entries if entry['entry_id'] not in records]
+    await _apply_write(agent_id, inactive, records)
+
+
+async def remove_entries(agent_id: str, entry_ids: List[str]) -> None:
+    """Drop entries, and entries extracted from them (ZIP/repository children), from the index."""
+    redis_client = await redis.get_client()
+    removed = set(entry_ids)
+    stored = await redis_client.hgetall(_chunks_key(agent_id))
+    for entry_id, record in stored.items():
+        if json.loads(record).get('parent_id') in removed:
+            removed.add(entry_id)
+    await _apply_write(agent_id, sorted(removed), {})
+
+
+async def sync_entries(
+    agent_id: str,
+    entries: Optional[List[Dict[str, Any]]] = None,
+    removed_ids: Optional[List[str]] = None,
+) -> None:
+    """Apply entry writes to the index. Never raises: on failure the agent is reindexed on next use."""
+    try:
+        if removed_ids:
+            await remove_entries(agent_id, removed_ids)
+        if entries:
+            await index_entries(agent_id, entries)
+    except Exception as e:
+        logger.warning(f"Failed to update knowledge base index for agent {agent_id}: {str(e)}")
+        try:
+            await invalidate_agent(agent_id)
+        except Exception:
+            pass
+
+
+async def sync_entry_ids(agent_id: str, entry_ids: List[str]) -> None:
+    """Apply writes of the given entries, reading their current rows (missing rows were deleted)."""
+    client = await db.client
+    result = await client.table('agent_knowledge_base_entries').select(
+        'entry_id, name, content, is_active, extracted_from_zip_id'
+    ).in_('entry_id', entry_ids).execute()
+    rows = result.data or []
+    found = {row['entry_id'] for row in rows}
+    await sync_entries(agent_id, entries=rows, removed_ids=[entry_id for entry_id in entry_ids if entry_id not in found])
+
+
+async def schedule_sync(agent_id: str, entry_ids: List[str]) -> None:
+    """Queue indexing of written entries on a worker. Never raises: on failure the agent is reindexed."""
+    try:
+        from run_agent_background import sync_knowledge_base_entries
+        sync_knowledge_base_entries.send(agent_id, entry_ids)
+    except Exception as e:
+        logger.warning(f"Failed to queue knowledge base index update for agent {agent_id}: {str(e)}")
+        try:
+            await invalidate_agent(agent_id)
+        except Exception:
+            pass
+
+
+async def reindex_agent(agent_id: str) -> None:
+    """Rebuild an agent's index from the entries table."""
+    redis_client = await redis.get_client()
+    # Writes skipped from here on set the flag again and are picked up by another reindex
+    await redis_client.delete(_reindex_pending_key(agent_id))
+    client = await db.client
+    result = await client.table('agent_knowledge_base_entries').select(
+        'entry_id, name, content, is_active, extracted_from_zip_id'
+    ).eq('agent_id', agent_id).eq('is_active', True).execute()
+    records = await _build_records(result.data or [])
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(_chunks_key(agent_id))
+        if records:
+            pipe.hset(_chunks_key(agent_id), mapping=records)
+        pipe.incr(_version_key(agent_id))
+        await pipe.execute()
+    # A failed reindex keeps the lock, so it is retried once the lock expires
+    await redis_client.delete(_reindex_lock_key(agent_id))
+    logger.info(f"Indexed {len(records)} knowledge base entries for agent {agent_id}")
+    if await redis_client.exists(_reindex_pending_key(agent_id)):
+        await schedule_reindex(agent_id)
+
+
+async def schedule_reindex(agent_id: str) -> None:
+    """Queue a background rebuild of the agent's index, at most one at a time."""
+    if not await redis.set(_reindex_lock_key(agent_id), "1", ex=REINDEX_LOCK_TTL_SECONDS, nx=True):
+        return
+    from run_agent_background import reindex_knowledge_base
+    reindex_knowledge_base.send(agent_id)
+    logger.info(f"Scheduled knowledge base reindex for agent {agent_id}")
+
+
+async def _get_version(agent_id: str) -> Optional[int]:
+    """Return the index version, or None (after scheduling a reindex) if the agent is not indexed."""
+    version = await redis.get(_version_key(agent_id))
+    if version is None:
+        await schedule_reindex(agent_id)
+        return None
+    return int(version)
+
+
+async def _whole_knowledge_base_context(agent_id: str, max_tokens: int) -> Optional[str]:
+    """The pre-retrieval context: every active entry up to `max_tokens`."""
+    client = await db.client
+    result = await client.rpc('get_agent_knowledge_base_context', {
+        'p_agent_id': agent_id,
+        'p_max_tokens': max_tokens,
+    }).execute()
+    return result.data or None
+
+
+class AgentKnowledgeIndex:
+    """In-process vector and BM25 index over one agent's KB chunks."""
+
+    def __init__(self, stored: Dict[str, str]):
+        self.texts: List[str] = []
+        self.names: List[str] = []
+        vectors: List[Optional[np.ndarray]] = []
+        for entry_id in sorted(stored):
+            record = json.loads(stored[entry_id])
+            for chunk in record['chunks']:
+                self.texts.append(chunk['text'])
+                self.names.append(record['name'])
+                vectors.append(_decode_embedding(chunk.get('embedding')))
+
+        self.vectors = self._build_matrix(vectors)
+        self._build_postings()
+
+    @staticmethod
+    def _build_matrix(vectors: List[Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        dims = {vector.shape[0] for vector in vectors if vector is not None}
+        if len(dims) != 1:
+            return None
+        matrix = np.zeros((len(vectors), dims.pop()), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            if vector is not None:
+                norm = np.linalg.norm(vector)
+                if norm > 0:
+                    matrix[row] = vector / norm
+        return matrix
+
+    def _build_postings(self) -> None:
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths = np.zeros(len(self.texts), dtype=np.float32)
+        for row, text in enumerate(self.texts):
+            tokens = tokenize(text.lower())
+            self.doc_lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((row, tf))
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(self.texts) else 0.0
+
+    def vector_ranking(self, query_embedding: Optional[List[float]], limit: int) -> List[int]:
+        if self.vectors is None or not query_embedding:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != self.vectors.shape[1]:
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.vectors @ (query / norm)
+        ranked = np.argsort(-scores)[:limit]
+        return [int(row) for row in ranked if scores[row] > 0]
+
+    def keyword_ranking(self, query: str, limit: int) -> List[int]:
+        if not self.texts or not self.avg_doc_length:
+            return []
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        n = len(self.texts)
+        for term in set(tokenize(query.lower())):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log((n - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+            for row, tf in postings:
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[row] / self.avg_doc_length
+                scores[row] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+        ranked = np.argsort(-scores)[:limit]
+        return [int(row) for row in ranked if scores[row] > 0]
+
+
+async def _load_index(agent_id: str, version: int) -> AgentKnowledgeIndex:
+    cached = _index_cache.get(agent_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    redis_client = await redis.get_client()
+    stored = await redis_client.hgetall(_chunks_key(agent_id))
+    index = await asyncio.to_thread(AgentKnowledgeIndex, stored)
+    _index_cache.set(agent_id, (version, index))
+    return index
+
+
+async def _get_query_embedding(query: str) -> Optional[List[float]]:
+    cache_key = (EMBEDDING_MODEL, normalize_query(query))
+    embedding = query_embedding_cache.get(cache_key)
+    if embedding is None:
+        embedding = (await _embed_all([query]))[0]
+        if embedding:
+            query_embedding_cache.set(cache_key, embedding)
+    return embedding
+
+
+async def build_knowledge_base_context(
+    agent_id: str,
+    query: str,
+    max_tokens: int = KB_CONTEXT_MAX_TOKENS,
+    top_k: int = KB_CONTEXT_TOP_K,
+) -> Optional[str]:
+    """Return the KB passages most relevant to `query`, within `max_tokens`, or None."""
+    if not query or not query.strip():
+        return None
+
+    version = await _get_version(agent_id)
+    if version is None:
+        logger.info(f"Knowledge base index for agent {agent_id} is being built, using the whole-KB context")
+        return await _whole_knowledge_base_context(agent_id, max_tokens)
+    cache_key = (agent_id, version, normalize_query(query), max_tokens, top_k)
+    cached = _context_cache.get(cache_key)
+    if cached is not None:
+        return cached or None
+
+    index = await _load_index(agent_id, version)
+    if not index.texts:
+        _context_cache.set(cache_key, "")
+        return None
+
+    query_embedding = await _get_query_embedding(query) if index.vectors is not None else None
+    scores = rrf_scores([
+        index.vector_ranking(query_embedding, KB_CANDIDATES_PER_RETRIEVER),
+        index.keyword_ranking(query, KB_CANDIDATES_PER_RETRIEVER),
+    ])
+    rows = sorted(scores, key=lambda row: scores[row], reverse=True)
+
+    passages = []
+    used_tokens = 0
+    for row in rows:
+        if len(passages) >= top_k:
+            break
+        passage = f"### {index.names[row]}\n{index.texts[row]}"
+        tokens = token_counter(text=passage)
+        # Hard budget: skip passages that do not fit, a shorter one further down may
+        if used_tokens + tokens > max_tokens:
+            continue
+        passages.append(passage)
+        used_tokens += tokens
+
+    context = "\n\n".join(passages)
+    _context_cache.set(cache_key, context)
+    logger.debug(f"Selected {len(passages)} KB passages ({used_tokens} tokens) for agent {agent_id}")
+    return context or None
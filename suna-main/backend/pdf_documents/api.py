@@ -1,10 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request
 from fastapi.responses import Response
 import os
+import asyncio
+import json
 import time
 from utils.auth_utils import get_current_user_id_from_jwt
 from services.supabase import DBConnection
-from .ollama_embeddings import OllamaEmbeddingProcessor
+from services import redis
+from .ollama_embeddings import OllamaEmbeddingProcessor, PROGRESS_KEY_PREFIX
+from .vector_index import get_vector_index
+from .bm25_index import get_bm25_index
+from .search_cache import bump_corpus_version
 
 router = APIRouter(prefix="/pdf-documents")
 
@@ -270,7 +276,7 @@ async def search_documents(
         processor = OllamaEmbeddingProcessor()
         
         # 검색 실행
-        results = await processor.search_similar_documents(
+        response = await processor.search_documents(
             query=query,
             match_count=match_count,
             filter_department=filter_department
@@ -279,8 +285,9 @@ async def search_documents(
         return {
             "success": True,
             "query": query,
-            "results": results,
-            "total_results": len(results)
+            "results": response.results,
+            "total_results": len(response.results),
+            "timings_ms": response.timings_ms
         }
         
     except Exception as e:
@@ -311,10 +318,20 @@ async def get_embedding_status(
 
         document = document_response.data[0]
 
+        # 처리 중인 문서의 단계별 진행률/소요 시간 (OllamaEmbeddingProcessor가 기록)
+        progress = None
+        try:
+            cached_progress = await redis.get(f"{PROGRESS_KEY_PREFIX}:{document_id}")
+            if cached_progress:
+                progress = json.loads(cached_progress)
+        except Exception as e:
+            print(f"진행 상황 조회 실패 (무시): {e}")
+
         return {
             "document_id": document_id,
             "embedding_status": document.get('embedding_status'),
-            "total_chunks": document.get('total_chunks', 0)
+            "total_chunks": document.get('total_chunks', 0),
+            "progress": progress
         }
 
     except Exception as e:
@@ -366,6 +383,11 @@ async def delete_pdf_document(
         except Exception as e:
             print(f"임베딩 삭제 중 오류 (무시): {e}")
 
+        # 검색 캐시 무효화 및 검색 인덱스에서 제거
+        corpus_version = await bump_corpus_version()
+        get_vector_index().remove_document(document_id, corpus_version)
+        await asyncio.to_thread(get_bm25_index().remove_document, document_id, corpus_version)
+
         # 3. pdf_documents 테이블에서 소프트 삭제
         delete_response = await client.table('pdf_documents').update({
             'deleted_at': time.strftime('%Y-%m-%dT%H:%M:%S')
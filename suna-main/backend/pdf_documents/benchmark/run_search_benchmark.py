@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+PDF 검색 오프라인 벤치마크
+
+fixtures/corpus.json(청크)과 fixtures/queries.json(질의 + 관련 문서 ID)으로
+벡터 단독, 키워드 단독, 하이브리드(RRF) 검색을 실행하고
+recall@k, MRR, 지연 시간(p50/p95/p99)을 출력한다.
+
+DB 없이 실제 검색 경로(PdfVectorIndex, PdfBm25Index, HybridSearchService)를 그대로 사용한다.
+임베딩은 기본적으로 문자 n-gram 해싱 벡터(오프라인, 결정적)를 쓰고,
+--embeddings ollama를 주면 실제 Ollama 임베딩 모델을 사용한다.
+
+사용 예 (backend 디렉터리에서):
+    python -m pdf_documents.benchmark.run_search_benchmark
+    python -m pdf_documents.benchmark.run_search_benchmark --rrf-k 10,30,60 --k 3 --repeat 20
+    python -m pdf_documents.benchmark.run_search_benchmark --embeddings ollama --json results.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from pdf_documents.bm25_index import PdfBm25Index
+from pdf_documents.search_service import HybridSearchService, Retriever
+from pdf_documents.vector_index import PdfVectorIndex
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+HASHING_DIMENSION = 512
+
+
+def hashing_embedding(text: str) -> List[float]:
+    """문자 2/3-gram을 해싱한 bag-of-ngrams 벡터 (Ollama 없이 재현 가능한 벡터 검색용)"""
+    vector = np.zeros(HASHING_DIMENSION, dtype=np.float32)
+    normalized = " ".join(text.lower().split())
+    for n in (2, 3):
+        for i in range(len(normalized) - n + 1):
+            gram = normalized[i:i + n]
+            if gram.strip():
+                digest = hashlib.md5(gram.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % HASHING_DIMENSION] += 1.0
+    return vector.tolist()
+
+
+async def ollama_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    import httpx
+    from pdf_documents.ollama_embeddings import EMBEDDING_BATCH_SIZE, EMBEDDING_TIMEOUT_SECONDS, embed_texts
+
+    embeddings: List[Optional[List[float]]] = []
+    async with httpx.AsyncClient(timeout=EMBEDDING_TIMEOUT_SECONDS) as client:
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            embeddings.extend(await embed_texts(texts[start:start + EMBEDDING_BATCH_SIZE], client))
+    return embeddings
+
+
+async def embed(texts: List[str], mode: str) -> List[Optional[List[float]]]:
+    if mode == "ollama":
+        return await ollama_embeddings(texts)
+    return [hashing_embedding(text) for text in texts]
+
+
+def load_fixture(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def evaluate(ranked_document_ids: List[str], relevant: List[str], k: int) -> Dict[str, float]:
+    """문서 단위 recall@k와 reciprocal rank (같은 문서의 여러 청크는 첫 순위만 인정)"""
+    unique_ids: List[str] = []
+    for document_id in ranked_document_ids:
+        if document_id not in unique_ids:
+            unique_ids.append(document_id)
+
+    found = set(unique_ids[:k]) & set(relevant)
+    reciprocal_rank = 0.0
+    for rank, document_id in enumerate(unique_ids, start=1):
+        if document_id in relevant:
+            reciprocal_rank = 1.0 / rank
+            break
+    return {"recall": len(found) / len(relevant), "rr": reciprocal_rank}
+
+
+async def run_config(
+    name: str,
+    service: HybridSearchService,
+    queries: List[Dict[str, Any]],
+    k: int,
+    repeat: int,
+) -> Dict[str, Any]:
+    recalls, reciprocal_ranks, latencies = [], [], []
+    retriever_latencies: Dict[str, List[float]] = {retriever.name: [] for retriever in service.retrievers}
+
+    for query in queries:
+        for attempt in range(repeat):
+            started = time.perf_counter()
+            response = await service.search(query["query"], k, query.get("filter_department"))
+            latencies.append((time.perf_counter() - started) * 1000)
+            for retriever_name in retriever_latencies:
+                retriever_latencies[retriever_name].append(response.timings_ms.get(retriever_name, 0.0))
+
+        scores = evaluate(
+            [result["document_id"] for result in response.results],
+            query["relevant_document_ids"],
+            k,
+        )
+        recalls.append(scores["recall"])
+        reciprocal_ranks.append(scores["rr"])
+
+    return {
+        "config": name,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+        },
+        "retriever_p50_ms": {
+            retriever_name: round(percentile(values, 50), 3)
+            for retriever_name, values in retriever_latencies.items()
+        },
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    corpus = load_fixture(args.corpus)
+    queries = load_fixture(args.queries)
+
+    chunk_embeddings = await embed([row["chunk_text"] for row in corpus], args.embeddings)
+    rows = [dict(row, embedding=embedding) for row, embedding in zip(corpus, chunk_embeddings)]
+
+    vector_index = PdfVectorIndex()
+    vector_index.build(rows)
+    bm25_index = PdfBm25Index(index_dir=os.path.join(FIXTURES_DIR, ".unused"))
+    bm25_index.build(rows)
+
+    # 질의 임베딩은 미리 계산해 두어 지연 시간에는 검색 자체만 포함 (운영에서는 질의 임베딩 캐시가 이 역할)
+    query_texts = [query["query"] for query in queries]
+    query_embeddings = dict(zip(query_texts, await embed(query_texts, args.embeddings)))
+
+    async def vector_search(query: str, limit: int, filter_department: Optional[str], corpus_version: Optional[int]):
+        embedding = query_embeddings.get(query)
+        if not embedding:
+            return []
+        return vector_index.search(embedding, limit, filter_department, min_similarity=args.min_similarity)
+
+    async def keyword_search(query: str, limit: int, filter_department: Optional[str], corpus_version: Optional[int]):
+        return bm25_index.search(query, limit, filter_department)
+
+    configs: List[tuple] = [
+        ("vector", HybridSearchService([Retriever("vector", vector_search)])),
+        ("keyword", HybridSearchService([Retriever("keyword", keyword_search)])),
+    ]
+    for rrf_k in args.rrf_k:
+        configs.append((
+            f"hybrid(rrf_k={rrf_k}, w={args.vector_weight}/{args.keyword_weight})",
+            HybridSearchService(
+                [
+                    Retriever("vector", vector_search, args.vector_weight),
+                    Retriever("keyword", keyword_search, args.keyword_weight),
+                ],
+                rrf_k=rrf_k,
+            ),
+        ))
+
+    reports = []
+    for name, service in configs:
+        reports.append(await run_config(name, service, queries, args.k, args.repeat))
+    return reports
+
+
+def print_reports(reports: List[Dict[str, Any]], k: int, corpus_size: int, query_count: int, embeddings: str) -> None:
+    print(f"\n청크 {corpus_size}개, 질의 {query_count}개, 임베딩: {embeddings}\n")
+    header = f"{'config':<40} {'recall@' + str(k):>9} {'MRR':>7} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}"
+    print(header)
+    print("-" * len(header))
+    for report in reports:
+        latency = report["latency_ms"]
+        print(
+            f"{report['config']:<40} {report[f'recall@{k}']:>9.3f} {report['mrr']:>7.3f} "
+            f"{latency['p50']:>9.3f} {latency['p95']:>9.3f} {latency['p99']:>9.3f}"
+        )
+    print()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="PDF 검색 오프라인 벤치마크 (recall@k, MRR, 지연 시간)")
+    parser.add_argument("--corpus", default=os.path.join(FIXTURES_DIR, "corpus.json"))
+    parser.add_argument("--queries", default=os.path.join(FIXTURES_DIR, "queries.json"))
+    parser.add_argument("--embeddings", choices=("hashing", "ollama"), default="hashing")
+    parser.add_argument("--k", type=int, default=5, help="평가할 상위 결과 수 (match_count)")
+    parser.add_argument("--repeat", type=int, default=10, help="지연 시간 측정을 위한 질의당 반복 횟수")
+    parser.add_argument(
+        "--rrf-k",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[60],
+        help="비교할 RRF 상수 목록 (쉼표 구분)",
+    )
+    parser.add_argument("--vector-weight", type=float, default=1.0)
+    parser.add_argument("--keyword-weight", type=float, default=1.0)
+    parser.add_argument("--min-similarity", type=float, default=0.2, help="벡터 검색 최소 유사도")
+    parser.add_argument("--json", dest="json_path", help="결과를 JSON 파일로 저장")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    reports = asyncio.run(run_benchmark(args))
+    print_reports(
+        reports, args.k,
+        len(load_fixture(args.corpus)), len(load_fixture(args.queries)),
+        args.embeddings,
+    )
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"결과 저장: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
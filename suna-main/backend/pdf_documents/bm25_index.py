@@ -0,0 +1,484 @@
+# PDF 청크 BM25 역색인
+#
+# 기존 키워드 검색은 검색할 때마다 500개 청크를 조회하고, 모든 청크를 다시 토큰화해
+# 문서 빈도를 새로 계산했다. 이 모듈은 전체 코퍼스에 대한 역색인을 유지한다.
+#
+# - 단어 → 포스팅(청크 행 번호, 단어 빈도)을 단어 ID 순으로 정렬된 배열(CSR)로 저장
+# - 청크 길이, 평균 길이, 단어별 IDF를 함께 보관 (부서 필터 검색은 기존처럼 부서 내 통계로 IDF 계산)
+# - 검색 비용은 질의 단어들의 포스팅 길이에 비례
+# - process_document 완료 시 add_document, 삭제 시 remove_document로 증분 갱신
+#   (변경은 모아 두었다가 다음 검색이나 저장 때 한 번에 정렬해 반영하고, 저장은 잠시 미뤄 한 번만 한다)
+# - 빌드/갱신된 색인은 PDF_SEARCH_INDEX_DIR에 .npy로 저장되고, 다른 프로세스는
+#   DB를 다시 읽는 대신 mmap으로 불러온다
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_index import INDEX_REFRESH_SECONDS, fetch_completed_chunks
+
+
+# BM25 파라미터
+BM25_K1 = 1.5  # term frequency saturation parameter
+BM25_B = 0.75  # length normalization parameter
+
+INDEX_DIR = os.getenv("PDF_SEARCH_INDEX_DIR", os.path.join(tempfile.gettempdir(), "pdf_search_index"))
+BM25_INDEX_DIR = os.path.join(INDEX_DIR, "bm25")
+# 증분 갱신 후 디스크 저장까지 기다리는 시간 (연속된 문서 처리를 한 번의 저장으로 묶음)
+BM25_SAVE_DELAY_SECONDS = 5.0
+
+_COLUMNS = ('document_id', 'chunk_text', 'document_title', 'department')
+_ARRAYS = ('post_terms', 'post_rows', 'post_tfs', 'offsets', 'idf', 'doc_lengths')
+
+
+def tokenize(text: str) -> List[str]:
+    """텍스트 토큰화 (한국어/영어 지원)"""
+    # 한국어, 영어, 숫자만 남기고 나머지 제거
+    text = re.sub(r'[^\w\s가-힣]', ' ', text)
+
+    # 공백으로 분할하여 토큰화
+    tokens = text.split()
+
+    # 길이가 1인 토큰 제거 (너무 짧은 단어)
+    tokens = [token for token in tokens if len(token) > 1]
+
+    return tokens
+
+
+class PdfBm25Index:
+    """pdf_embeddings 전체 청크에 대한 BM25 역색인"""
+
+    def __init__(self, index_dir: str = BM25_INDEX_DIR):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._vocab: Dict[str, int] = {}
+        self._columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype=object) for name in _COLUMNS}
+        self._arrays: Dict[str, np.ndarray] = {
+            'post_terms': np.empty(0, dtype=np.int32),
+            'post_rows': np.empty(0, dtype=np.int32),
+            'post_tfs': np.empty(0, dtype=np.float32),
+            'offsets': np.zeros(1, dtype=np.int64),
+            'idf': np.empty(0, dtype=np.float32),
+            'doc_lengths': np.empty(0, dtype=np.float32),
+        }
+        self._loaded_at = 0.0
+        # 마지막으로 반영한 코퍼스 버전 (search_cache.get_corpus_version)
+        self._corpus_version: Optional[int] = None
+        # 아직 포스팅에 반영하지 않은 문서별 변경 (문서 ID → 새 행 목록, 삭제면 빈 목록)
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._unsaved = False
+        self._save_timer: Optional[threading.Timer] = None
+
+    def __len__(self) -> int:
+        return len(self._arrays['doc_lengths'])
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self._loaded_at > INDEX_REFRESH_SECONDS
+
+    def needs_reload(self, corpus_version: Optional[int] = None) -> bool:
+        """재적재 주기가 지났거나 다른 프로세스에서 코퍼스가 바뀐 경우"""
+        if self.is_stale:
+            return True
+        return corpus_version is not None and corpus_version != self._corpus_version
+
+    # ---- 빌드 ----
+
+    def _tokenize_rows(
+        self,
+        rows: List[Dict[str, Any]],
+        vocab: Dict[str, int],
+        first_row: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """행 목록을 (단어 ID, 행 번호, 빈도) 포스팅과 청크 길이로 변환 (vocab은 확장됨)"""
+        terms, post_rows, tfs, lengths = [], [], [], []
+        for offset, row in enumerate(rows):
+            tokens = tokenize((row.get('chunk_text') or '').lower())
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                term_id = vocab.get(token)
+                if term_id is None:
+                    term_id = vocab[token] = len(vocab)
+                terms.append(term_id)
+                post_rows.append(first_row + offset)
+                tfs.append(count)
+        return (
+            np.asarray(terms, dtype=np.int32),
+            np.asarray(post_rows, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32),
+            np.asarray(lengths, dtype=np.float32),
+        )
+
+    @staticmethod
+    def _finalize(
+        vocab_size: int,
+        post_terms: np.ndarray,
+        post_rows: np.ndarray,
+        post_tfs: np.ndarray,
+        doc_lengths: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """포스팅을 단어 ID 순으로 정렬하고 오프셋/IDF 계산"""
+        order = np.argsort(post_terms, kind='stable')
+        post_terms = np.ascontiguousarray(post_terms[order])
+        post_rows = np.ascontiguousarray(post_rows[order])
+        post_tfs = np.ascontiguousarray(post_tfs[order])
+
+        postings_per_term = np.bincount(post_terms, minlength=vocab_size)
+        offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(postings_per_term)
+        doc_freq = postings_per_term.astype(np.float64)
+
+        total_docs = len(doc_lengths)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            idf = np.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        idf = np.nan_to_num(idf, nan=0.0, neginf=0.0).astype(np.float32)
+
+        return {
+            'post_terms': post_terms,
+            'post_rows': post_rows,
+            'post_tfs': post_tfs,
+            'offsets': offsets,
+            'idf': idf,
+            'doc_lengths': doc_lengths,
+        }
+
+    def _build_columns(self, rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        columns = {}
+        for name in _COLUMNS:
+            column = np.empty(len(rows), dtype=object)
+            column[:] = [row.get(name) for row in rows]
+            columns[name] = column
+        return columns
+
+    def build(self, rows: List[Dict[str, Any]], corpus_version: Optional[int] = None) -> None:
+        """행 목록으로 색인 전체를 다시 만든다"""
+        vocab: Dict[str, int] = {}
+        post_terms, post_rows, post_tfs, doc_lengths = self._tokenize_rows(rows, vocab, 0)
+        arrays = self._finalize(len(vocab), post_terms, post_rows, post_tfs, doc_lengths)
+        columns = self._build_columns(rows)
+        with self._lock:
+            self._vocab, self._arrays, self._columns = vocab, arrays, columns
+            self._loaded_at = time.time()
+            self._corpus_version = corpus_version
+            self._pending = {}
+            self._unsaved = False
+
+    # ---- 증분 갱신 ----
+
+    def _remove_rows(self, keep: np.ndarray) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """keep 마스크에 해당하는 행만 남기고 포스팅의 행 번호를 다시 매김 (lock 보유 상태에서 호출)"""
+        arrays = self._arrays
+        new_row_numbers = np.cumsum(keep, dtype=np.int64) - 1
+        post_keep = keep[arrays['post_rows']]
+        post_rows = new_row_numbers[arrays['post_rows'][post_keep]].astype(np.int32)
+        columns = {name: column[keep] for name, column in self._columns.items()}
+        return {
+            'post_terms': arrays['post_terms'][post_keep],
+            'post_rows': post_rows,
+            'post_tfs': arrays['post_tfs'][post_keep],
+            'doc_lengths': arrays['doc_lengths'][keep],
+        }, columns
+
+    def _advance_version(self, corpus_version: Optional[int]) -> bool:
+        """증분 갱신이 바로 다음 코퍼스 버전일 때만 버전을 올린다 (lock 보유 상태에서 호출)
+
+        그 사이에 다른 프로세스의 변경이 있었다면 색인에 빠진 문서가 있으므로 저장하지 않고
+        적재되지 않은 상태로 되돌려, 다음 검색 때 디스크나 DB에서 다시 적재한다.
+        """
+        if corpus_version is None:
+            return True
+        if self._corpus_version is None or corpus_version != self._corpus_version + 1:
+            self._loaded_at = 0.0
+            self._pending = {}
+            self._unsaved = False
+            return False
+        self._corpus_version = corpus_version
+        return True
+
+    def _queue_change(self, document_id: str, rows: List[Dict[str, Any]]) -> None:
+        """문서 변경을 대기열에 넣고 저장을 예약 (lock 보유 상태에서 호출)"""
+        # 마지막 변경 순서대로 행이 추가되도록 기존 항목을 지우고 다시 넣는다
+        self._pending.pop(document_id, None)
+        self._pending[document_id] = rows
+        self._unsaved = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(BM25_SAVE_DELAY_SECONDS, self._deferred_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _apply_pending(self) -> None:
+        """대기 중인 변경을 포스팅에 한 번에 반영 (lock 보유 상태에서 호출)"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        keep = np.fromiter(
+            (document_id not in pending for document_id in self._columns['document_id']),
+            dtype=bool,
+            count=len(self._columns['document_id'])
+        )
+        kept, columns = self._remove_rows(keep)
+        new_rows = [row for rows in pending.values() for row in rows]
+        vocab = dict(self._vocab)
+        first_row = len(kept['doc_lengths'])
+        post_terms, post_rows, post_tfs, doc_lengths = self._tokenize_rows(new_rows, vocab, first_row)
+        self._arrays = self._finalize(
+            len(vocab),
+            np.concatenate([kept['post_terms'], post_terms]),
+            np.concatenate([kept['post_rows'], post_rows]),
+            np.concatenate([kept['post_tfs'], post_tfs]),
+            np.concatenate([kept['doc_lengths'], doc_lengths]),
+        )
+        new_columns = self._build_columns(new_rows)
+        self._columns = {name: np.concatenate([columns[name], new_columns[name]]) for name in _COLUMNS}
+        self._vocab = vocab
+
+    def add_document(
+        self,
+        document_id: str,
+        rows: List[Dict[str, Any]],
+        document_title: str,
+        department: str,
+        corpus_version: Optional[int] = None
+    ) -> None:
+        """문서 한 건의 청크를 교체 (process_document 완료 시 호출)"""
+        new_rows = [{
+            'document_id': document_id,
+            'chunk_text': row['chunk_text'],
+            'document_title': document_title or '제목 없음',
+            'department': department or '부서 정보 없음',
+        } for row in rows]
+
+        with self._lock:
+            # 아직 적재되지 않았다면 다음 검색 때 전체 적재에 포함된다
+            if not self._loaded_at or not self._advance_version(corpus_version):
+                return
+            self._queue_change(document_id, new_rows)
+
+    def remove_document(self, document_id: str, corpus_version: Optional[int] = None) -> None:
+        """삭제된 문서의 청크를 색인에서 제거"""
+        with self._lock:
+            if not self._loaded_at or not self._advance_version(corpus_version):
+                return
+            if document_id in self._pending or (self._columns['document_id'] == document_id).any():
+                self._queue_change(document_id, [])
+
+    def _deferred_save(self) -> None:
+        with self._lock:
+            self._save_timer = None
+            if not self._unsaved:
+                return
+        self.save()
+
+    # ---- 저장/적재 ----
+
+    def save(self) -> None:
+        """현재 색인을 새 버전 디렉터리에 저장하고 CURRENT 포인터를 원자적으로 교체"""
+        with self._lock:
+            # 다른 프로세스의 변경이 빠진 색인은 저장하지 않는다
+            if not self._loaded_at:
+                return
+            self._apply_pending()
+            vocab, arrays, columns, built_at = self._vocab, self._arrays, self._columns, self._loaded_at
+            corpus_version = self._corpus_version
+            self._unsaved = False
+
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            # 다른 프로세스가 mmap 중인 파일을 덮어쓰지 않도록 저장할 때마다 새 디렉터리 사용
+            version = f"{int(time.time() * 1000)}-{os.getpid()}"
+            version_dir = os.path.join(self.index_dir, version)
+            os.makedirs(version_dir, exist_ok=True)
+
+            for name in _ARRAYS:
+                np.save(os.path.join(version_dir, f"{name}.npy"), np.asarray(arrays[name]))
+            terms = [None] * len(vocab)
+            for term, term_id in vocab.items():
+                terms[term_id] = term
+            with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    'built_at': built_at,
+                    'corpus_version': corpus_version,
+                    'terms': terms,
+                    'columns': {name: columns[name].tolist() for name in _COLUMNS},
+                }, f, ensure_ascii=False)
+
+            pointer_path = os.path.join(self.index_dir, "CURRENT")
+            try:
+                with open(pointer_path) as f:
+                    previous = f.read().strip()
+            except OSError:
+                previous = None
+            pointer_tmp = os.path.join(self.index_dir, f"CURRENT.{os.getpid()}")
+            with open(pointer_tmp, "w") as f:
+                f.write(version)
+            os.replace(pointer_tmp, pointer_path)
+
+            # 이전 버전 정리: 다른 프로세스가 방금 mmap했을 수 있는 직전 버전과,
+            # 다른 프로세스가 쓰는 중일 수 있는 더 새로운 버전은 남기고 그보다 오래된 것만 삭제
+            if previous:
+                cutoff = _version_time(previous)
+                for entry in os.listdir(self.index_dir):
+                    entry_path = os.path.join(self.index_dir, entry)
+                    if entry in (version, previous) or not os.path.isdir(entry_path):
+                        continue
+                    entry_time = _version_time(entry)
+                    if entry_time is not None and cutoff is not None and entry_time < cutoff:
+                        shutil.rmtree(entry_path, ignore_errors=True)
+        except Exception as e:
+            print(f"BM25 색인 저장 실패: {str(e)}")
+
+    def _load_from_disk(self, corpus_version: Optional[int] = None) -> bool:
+        """저장된 최신 색인이 충분히 새롭고 코퍼스 버전이 같으면 mmap으로 불러온다"""
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT")) as f:
+                version_dir = os.path.join(self.index_dir, f.read().strip())
+            with open(os.path.join(version_dir, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta['built_at'] > INDEX_REFRESH_SECONDS:
+                return False
+            if corpus_version is not None and meta.get('corpus_version') != corpus_version:
+                return False
+            arrays = {
+                name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r')
+                for name in _ARRAYS
+            }
+        except (OSError, ValueError, KeyError):
+            return False
+
+        columns = {}
+        for name in _COLUMNS:
+            values = meta['columns'][name]
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            columns[name] = column
+
+        with self._lock:
+            self._vocab = {term: term_id for term_id, term in enumerate(meta['terms'])}
+            self._arrays = arrays
+            self._columns = columns
+            self._loaded_at = meta['built_at']
+            self._corpus_version = meta.get('corpus_version')
+            self._pending = {}
+            self._unsaved = False
+        return True
+
+    def load(self, supabase, corpus_version: Optional[int] = None) -> None:
+        """DB에서 전체 코퍼스를 읽어 색인을 다시 만들고 저장"""
+        started = time.time()
+        self.build(fetch_completed_chunks(supabase, include_embeddings=False), corpus_version)
+        self.save()
+        print(f"BM25 색인 빌드 완료: {len(self)}개 청크, {len(self._vocab)}개 단어 ({time.time() - started:.2f}초)")
+
+    def ensure_loaded(self, supabase, corpus_version: Optional[int] = None) -> None:
+        if not self.needs_reload(corpus_version):
+            return
+        with self._load_lock:
+            if self.needs_reload(corpus_version) and not self._load_from_disk(corpus_version):
+                self.load(supabase, corpus_version)
+
+    # ---- 검색 ----
+
+    def search(self, query: str, match_count: int, filter_department: str = None) -> List[Dict[str, Any]]:
+        """BM25 점수 상위 청크 (점수 0 이하 제외)"""
+        query_terms = tokenize(query.lower())
+        if not query_terms:
+            return []
+
+        with self._lock:
+            self._apply_pending()
+            vocab, arrays, columns = self._vocab, self._arrays, self._columns
+
+        doc_lengths = arrays['doc_lengths']
+        if not len(doc_lengths):
+            return []
+        offsets = arrays['offsets']
+
+        # 부서 필터가 있으면 기존 구현처럼 문서 수, 평균 길이, 문서 빈도(IDF)를 그 부서 청크만으로 계산
+        in_department = None
+        if filter_department:
+            in_department = columns['department'] == filter_department
+            total_docs = int(in_department.sum())
+            if not total_docs:
+                return []
+            avg_doc_length = float(doc_lengths[in_department].mean()) or 1.0
+        else:
+            avg_doc_length = float(doc_lengths.mean()) or 1.0
+
+        # 질의 단어별 포스팅 구간만 읽어 점수 기여분 계산 (중복 단어는 원래 구현처럼 중복 합산)
+        hit_rows, hit_scores = [], []
+        for term in query_terms:
+            term_id = vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = offsets[term_id], offsets[term_id + 1]
+            rows = arrays['post_rows'][start:end]
+            tfs = arrays['post_tfs'][start:end]
+            if in_department is not None:
+                in_scope = in_department[rows]
+                rows, tfs = rows[in_scope], tfs[in_scope]
+                if not len(rows):
+                    continue
+                doc_freq = len(rows)
+                idf = np.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            else:
+                idf = arrays['idf'][term_id]
+            norm = tfs + BM25_K1 * (1 - BM25_B + BM25_B * (doc_lengths[rows] / avg_doc_length))
+            hit_rows.append(rows)
+            hit_scores.append(idf * (tfs * (BM25_K1 + 1)) / norm)
+
+        if not hit_rows:
+            return []
+
+        rows, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+
+        positive = scores > 0
+        rows, scores = rows[positive], scores[positive]
+        k = min(match_count, len(scores))
+        if k <= 0:
+            return []
+        if k < len(scores):
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        results = []
+        for idx in top:
+            row = rows[idx]
+            bm25_score = float(scores[idx])
+            results.append({
+                'document_id': columns['document_id'][row],
+                'chunk_text': columns['chunk_text'][row],
+                'document_title': columns['document_title'][row],
+                'department': columns['department'][row],
+                'search_type': 'bm25',
+                'bm25_score': round(bm25_score, 4),
+                'similarity': min(bm25_score / 10, 1.0)  # 0-1 범위로 정규화
+            })
+        return results
+
+
+def _version_time(version: str) -> Optional[int]:
+    """버전 디렉터리 이름(밀리초-pid)의 생성 시각"""
+    try:
+        return int(version.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+_bm25_index = PdfBm25Index()
+
+
+def get_bm25_index() -> PdfBm25Index:
+    """프로세스 전역 BM25 색인"""
+    return _bm25_index
@@ -2,10 +2,12 @@
 
 import os
 import io
+import hashlib
 import json
-import requests
-from typing import List, Dict, Any
-import PyPDF2
+import time
+import httpx
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+import bisect
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import numpy as np
 from supabase import create_client
@@ -17,11 +19,95 @@ import re
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
+from services import redis
+from utils.pdf_extraction import iter_pdf_pages
+from .vector_index import get_vector_index, parse_embedding
+from .bm25_index import get_bm25_index, tokenize
+from .search_cache import (
+    bump_corpus_version,
+    get_corpus_version,
+    normalize_query,
+    query_embedding_cache,
+    search_result_cache,
+)
+from .search_service import (
+    KEYWORD_WEIGHT,
+    VECTOR_WEIGHT,
+    HybridSearchService,
+    Retriever,
+    SearchResponse,
+)
+
 
 # Ollama API 설정 (로컬 환경 우선)
 OLLAMA_API_URL = os.getenv("OLLAMA_HOST", "http://localhost:11435")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "bge-m3")  # bge-m3 다국어 모델
 
+# 임베딩 파이프라인 설정
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))  # /api/embed 한 번에 보낼 청크 수
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))  # 동시에 보낼 배치 요청 수
+EMBEDDING_TIMEOUT_SECONDS = 120
+INSERT_BATCH_SIZE = 10  # 한번에 10개씩 저장
+
+# 스트리밍 청크 분할 시 버퍼에 모아 두는 최대 글자 수 (청크 크기의 8배)
+CHUNK_BUFFER_CHARS = 1500 * 8
+
+# 임베딩 캐시 조회 시 한 번에 보낼 content_hash 수 (URL 길이 제한)
+CACHE_LOOKUP_BATCH_SIZE = 100
+
+# 처리 진행 상황 (Redis)
+PROGRESS_KEY_PREFIX = "pdf_embedding_progress"
+PROGRESS_TTL_SECONDS = 3600 * 24
+
+def content_hash(text: str) -> str:
+    """임베딩 캐시 키로 쓰는 청크 본문 해시 (파일명/청크 번호 접두어 제외)"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+async def embed_texts(texts: List[str], client: httpx.AsyncClient) -> List[Optional[List[float]]]:
+    """Ollama /api/embed 배치 엔드포인트로 여러 텍스트를 한 번에 임베딩 (실패한 항목은 None)"""
+    try:
+        response = await client.post(
+            f"{OLLAMA_API_URL}/api/embed",
+            json={
+                "model": EMBEDDING_MODEL,
+                "input": texts
+            }
+        )
+
+        if response.status_code == 200:
+            embeddings = response.json().get("embeddings") or []
+            if len(embeddings) == len(texts):
+                return [embedding or None for embedding in embeddings]
+            print(f"Ollama 배치 임베딩 개수 불일치: 요청 {len(texts)}, 응답 {len(embeddings)}")
+        elif response.status_code == 404:
+            # /api/embed가 없는 구버전 Ollama는 단건 엔드포인트로 처리
+            return [await _embed_single(text, client) for text in texts]
+        else:
+            print(f"Ollama 임베딩 오류: {response.status_code}, 응답: {response.text}")
+    except httpx.ConnectError as e:
+        print(f"Ollama 서버 연결 실패: {str(e)}")
+        print(f"Ollama URL 확인: {OLLAMA_API_URL}")
+    except Exception as e:
+        print(f"Ollama 연결 오류: {str(e)}")
+    return [None] * len(texts)
+
+
+async def _embed_single(text: str, client: httpx.AsyncClient) -> Optional[List[float]]:
+    """구버전 /api/embeddings 단건 엔드포인트"""
+    response = await client.post(
+        f"{OLLAMA_API_URL}/api/embeddings",
+        json={
+            "model": EMBEDDING_MODEL,
+            "prompt": text
+        }
+    )
+    if response.status_code != 200:
+        print(f"Ollama 임베딩 오류: {response.status_code}, 응답: {response.text}")
+        return None
+    return response.json().get("embedding") or None
+
+
 class OllamaEmbeddingProcessor:
     def __init__(self):
         # Backend uses SUPABASE_URL instead of NEXT_PUBLIC_SUPABASE_URL
@@ -40,56 +126,135 @@ class OllamaEmbeddingProcessor:
             chunk_overlap=200,  # 충분한 오버랩으로 맥락 연결성 확보
             separators=["\n\n", "\n", ".", "!", "?", "。", "！", "？", " ", ""],
             length_function=len,
+            add_start_index=True,  # 청크의 페이지 번호 계산용
         )
+        # 벡터/키워드 검색을 동시에 실행하고 RRF로 결합
+        self.search_service = HybridSearchService([
+            Retriever('vector', self._vector_search, VECTOR_WEIGHT),
+            Retriever('keyword', self._keyword_search, KEYWORD_WEIGHT),
+        ])
     
-    def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
-        """PDF에서 텍스트 추출"""
-        pdf_file = io.BytesIO(pdf_bytes)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text() + "\n"
-        
-        return text
+    async def iter_pdf_chunks(self, pdf_bytes: bytes) -> AsyncIterator[Tuple[str, int, int]]:
+        """PDF 페이지 텍스트를 추출되는 대로 청크로 분할 (청크, 시작 페이지, 끝 페이지)
+
+        페이지 추출은 utils.pdf_extraction의 프로세스 풀에서 병렬로 진행된다.
+        버퍼가 CHUNK_BUFFER_CHARS를 넘으면 분할해서 내보내고, 마지막 청크는 다음 페이지와
+        이어질 수 있으므로 버퍼에 남겨 두어 메모리 사용량을 문서 크기와 무관하게 유지한다.
+        """
+        buffer = ""
+        buffer_offset = 0  # 버퍼 첫 글자의 문서 전체 기준 위치
+        page_offsets: List[int] = []  # 각 페이지가 시작하는 문서 전체 기준 위치
+        page_numbers: List[int] = []
+        total_length = 0
+
+        def page_at(position: int) -> int:
+            return page_numbers[max(0, bisect.bisect_right(page_offsets, position) - 1)]
+
+        def split_buffer(final: bool):
+            documents = self.text_splitter.create_documents([buffer])
+            if not final and len(documents) > 1 and documents[-1].metadata.get('start_index', -1) >= 0:
+                return documents[:-1], documents[-1].metadata['start_index']
+            return documents, len(buffer)
+
+        async for page_number, page_text in iter_pdf_pages(pdf_bytes):
+            page_offsets.append(total_length)
+            page_numbers.append(page_number)
+            buffer += page_text + "\n"
+            total_length += len(page_text) + 1
+
+            if len(buffer) < CHUNK_BUFFER_CHARS:
+                continue
+
+            documents, consumed = split_buffer(final=False)
+            for document in documents:
+                start = buffer_offset + max(0, document.metadata.get('start_index', 0))
+                yield document.page_content, page_at(start), page_at(start + len(document.page_content) - 1)
+            buffer = buffer[consumed:]
+            buffer_offset += consumed
+
+        if buffer.strip():
+            documents, _ = split_buffer(final=True)
+            for document in documents:
+                start = buffer_offset + max(0, document.metadata.get('start_index', 0))
+                yield document.page_content, page_at(start), page_at(start + len(document.page_content) - 1)
     
-    def get_ollama_embedding(self, text: str) -> List[float]:
+    async def get_ollama_embeddings(self, texts: List[str], client: httpx.AsyncClient) -> List[Optional[List[float]]]:
+        """Ollama /api/embed 배치 엔드포인트로 여러 텍스트를 한 번에 임베딩 (실패한 항목은 None)"""
+        return await embed_texts(texts, client)
+
+    async def get_ollama_embedding(self, text: str) -> Optional[List[float]]:
         """Ollama를 사용하여 텍스트 임베딩 생성"""
+        async with httpx.AsyncClient(timeout=EMBEDDING_TIMEOUT_SECONDS) as client:
+            embeddings = await self.get_ollama_embeddings([text], client)
+        return embeddings[0]
+
+    async def _report_progress(self, document_id: str, stage: str, **details: Any) -> None:
+        """처리 단계/진행률을 Redis에 기록 (embedding-status 엔드포인트에서 조회)"""
         try:
-            print(f"Ollama 임베딩 요청: URL={OLLAMA_API_URL}, 모델={EMBEDDING_MODEL}")
-            response = requests.post(
-                f"{OLLAMA_API_URL}/api/embeddings",
-                json={
-                    "model": EMBEDDING_MODEL,
-                    "prompt": text
-                },
-                timeout=30
+            await redis.set(
+                f"{PROGRESS_KEY_PREFIX}:{document_id}",
+                json.dumps({"stage": stage, "updated_at": time.time(), **details}),
+                ex=PROGRESS_TTL_SECONDS
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                embedding = result.get("embedding", [])
-                print(f"임베딩 성공: 차원 {len(embedding)}")
-                return embedding
-            else:
-                print(f"Ollama 임베딩 오류: {response.status_code}, 응답: {response.text}")
-                return None
-        except requests.exceptions.ConnectionError as e:
-            print(f"Ollama 서버 연결 실패: {str(e)}")
-            print(f"Ollama URL 확인: {OLLAMA_API_URL}")
-            return None
         except Exception as e:
-            print(f"Ollama 연결 오류: {str(e)}")
-            return None
-    
+            print(f"진행 상황 기록 실패: {str(e)}")
+
+    async def _download_pdf(self, storage_path: str) -> Any:
+        """Supabase Storage에서 PDF 다운로드 (동기 클라이언트이므로 스레드에서 실행)"""
+        return await asyncio.to_thread(self.supabase.storage.from_('pdf-documents').download, storage_path)
+
+    def _lookup_cached_embeddings(self, chunk_hashes: List[str]) -> Dict[str, List[float]]:
+        """같은 모델로 이미 임베딩된 동일 내용 청크의 벡터 조회 (content_hash → embedding)
+
+        pdf_embeddings.metadata의 content_hash/embedding_model을 캐시 키로 사용하므로
+        재업로드/재처리 시 내용이 바뀌지 않은 청크는 Ollama를 다시 호출하지 않는다.
+        두 키에 대한 표현식 인덱스는 supabase/migrations의 idx_pdf_embeddings_model_content_hash.
+        """
+        cached: Dict[str, List[float]] = {}
+        unique_hashes = list(dict.fromkeys(chunk_hashes))
+        for i in range(0, len(unique_hashes), CACHE_LOOKUP_BATCH_SIZE):
+            batch = unique_hashes[i:i + CACHE_LOOKUP_BATCH_SIZE]
+            try:
+                result = self.supabase.table('pdf_embeddings').select(
+                    'embedding, metadata'
+                ).eq('metadata->>embedding_model', EMBEDDING_MODEL).in_(
+                    'metadata->>content_hash', batch
+                ).execute()
+            except Exception as e:
+                # 캐시 조회 실패 시 전체 임베딩으로 진행
+                print(f"임베딩 캐시 조회 실패: {str(e)}")
+                return cached
+            for item in result.data or []:
+                embedding = parse_embedding(item.get('embedding'))
+                chunk_hash = (item.get('metadata') or {}).get('content_hash')
+                if embedding and chunk_hash:
+                    cached[chunk_hash] = embedding
+        return cached
+
+    def _insert_embedding_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """임베딩 행을 작은 배치로 나누어 저장 (너무 크면 Supabase 저장 실패)"""
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            result = self.supabase.table('pdf_embeddings').insert(rows[i:i + INSERT_BATCH_SIZE]).execute()
+
+            # 최신 Supabase Python 클라이언트 응답 처리
+            if hasattr(result, 'error') and result.error:
+                raise Exception(f"임베딩 저장 실패: {result.error}")
+
     async def process_document(self, document_id: str, storage_path: str, file_name: str) -> Dict[str, Any]:
-        """Supabase Storage에서 문서를 다운로드하고 임베딩 생성"""
+        """Supabase Storage에서 문서를 다운로드하고 임베딩 생성
+
+        다운로드 → 텍스트 추출 → 청크 분할 → 배치 임베딩(동시 요청 수 제한) → 배치별 즉시 저장.
+        Ollama/Supabase 호출은 이벤트 루프를 막지 않으며, 단계별 소요 시간과 진행률을 기록한다.
+        """
+        metrics: Dict[str, float] = {}
+        started = time.time()
         try:
             print(f"임베딩 처리 시작: document_id={document_id}, storage_path={storage_path}")
+            await self._report_progress(document_id, "downloading")
             
             # 1. Supabase Storage에서 PDF 파일 다운로드
-            file_response = self.supabase.storage.from_('pdf-documents').download(storage_path)
+            stage_started = time.time()
+            file_response = await self._download_pdf(storage_path)
             
             # 최신 Supabase Python 클라이언트는 직접 bytes를 반환함
             if isinstance(file_response, bytes):
@@ -102,94 +267,150 @@ class OllamaEmbeddingProcessor:
             if not pdf_bytes:
                 return {"success": False, "error": "PDF 파일이 비어있습니다."}
             
+            metrics["download_seconds"] = round(time.time() - stage_started, 3)
             print(f"PDF 파일 다운로드 완료: {len(pdf_bytes)} bytes")
             
-            # 2. PDF에서 텍스트 추출
-            text = self.extract_text_from_pdf(pdf_bytes)
+            # 2~3. 페이지별로 병렬 추출하면서 바로 청크로 분할
+            await self._report_progress(document_id, "extracting")
+            stage_started = time.time()
+            chunks = []
+            chunk_bodies = []
+            chunk_pages = []
+            async for chunk, page_start, page_end in self.iter_pdf_chunks(pdf_bytes):
+                chunks.append(f"{file_name.replace('.pdf', '')}{len(chunks)+1}\n\n{chunk}")
+                chunk_bodies.append(chunk)
+                chunk_pages.append((page_start, page_end))
             
-            if not text.strip():
+            if not chunks:
                 return {"success": False, "error": "PDF에서 텍스트를 추출할 수 없습니다."}
             
-            print(f"텍스트 추출 완료: {len(text)} 문자")
+            metrics["extract_seconds"] = round(time.time() - stage_started, 3)
+            print(f"텍스트 추출 및 분할 완료: {len(chunks)}개 청크")
             
-            # 3. 텍스트를 청크로 분할
-            chunks = self.text_splitter.split_text(text)
-            print(f"텍스트 분할 완료: {len(chunks)}개 청크")
-            chunks = [f"{file_name.replace('.pdf', '')}{idx+1}\n\n{chunk}" for idx, chunk in enumerate(chunks)]
+            # 4. 내용 해시로 기존 임베딩 조회 (삭제 전에 조회해야 같은 문서의 청크도 재사용 가능)
+            # 파일명/청크 번호 접두어는 빼고 본문만 해시하므로 이름이 바뀌거나 청크 경계가 밀린 문서도 재사용된다
+            chunk_hashes = [content_hash(body) for body in chunk_bodies]
+            cached_embeddings = await asyncio.to_thread(self._lookup_cached_embeddings, chunk_hashes)
+            metrics["cache_hits"] = sum(1 for chunk_hash in chunk_hashes if chunk_hash in cached_embeddings)
+            print(f"임베딩 캐시: {metrics['cache_hits']}/{len(chunks)}개 청크 재사용")
             
-            # 4. 기존 임베딩 삭제
-            delete_result = self.supabase.table('pdf_embeddings').delete().eq('document_id', document_id).execute()
+            # 5. 기존 임베딩 삭제
+            await asyncio.to_thread(
+                lambda: self.supabase.table('pdf_embeddings').delete().eq('document_id', document_id).execute()
+            )
             print(f"기존 임베딩 삭제 완료")
             
-            # 5. 각 청크에 대해 임베딩 생성 및 저장
-            embeddings_data = []
-            for i, chunk in enumerate(chunks):
-                print(f"청크 {i+1}/{len(chunks)} 임베딩 생성 중...")
-                embedding = self.get_ollama_embedding(chunk)
+            # 6. 배치 단위로 임베딩 생성 후 바로 저장 (동시 요청 수 제한, 캐시된 청크는 Ollama 호출 생략)
+            total_chunks = len(chunks)
+            embeddings_data: List[Dict[str, Any]] = []
+            metrics["embed_seconds"] = 0.0
+            metrics["insert_seconds"] = 0.0
+            semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+            
+            async def embed_and_store(batch_start: int, client: httpx.AsyncClient) -> None:
+                batch = chunks[batch_start:batch_start + EMBEDDING_BATCH_SIZE]
+                batch_hashes = chunk_hashes[batch_start:batch_start + EMBEDDING_BATCH_SIZE]
+                embeddings = [cached_embeddings.get(chunk_hash) for chunk_hash in batch_hashes]
+                missing = [offset for offset, embedding in enumerate(embeddings) if embedding is None]
                 
-                if embedding:
-                    embedding_data = {
+                if missing:
+                    async with semaphore:
+                        embed_started = time.time()
+                        new_embeddings = await self.get_ollama_embeddings([batch[offset] for offset in missing], client)
+                        metrics["embed_seconds"] += time.time() - embed_started
+                    for offset, embedding in zip(missing, new_embeddings):
+                        embeddings[offset] = embedding
+                
+                rows = []
+                for offset, (chunk, embedding) in enumerate(zip(batch, embeddings)):
+                    if not embedding:
+                        print(f"청크 {batch_start + offset} 임베딩 생성 실패")
+                        continue
+                    rows.append({
                         'document_id': document_id,
-                        'chunk_index': i,
+                        'chunk_index': batch_start + offset,
                         'chunk_text': chunk[:5000],  # 텍스트 길이 제한
                         'embedding': embedding,
                         'metadata': {
                             'chunk_length': len(chunk),
-                            'total_chunks': len(chunks)
+                            'total_chunks': total_chunks,
+                            'page_start': chunk_pages[batch_start + offset][0],
+                            'page_end': chunk_pages[batch_start + offset][1],
+                            'content_hash': batch_hashes[offset],
+                            'embedding_model': EMBEDDING_MODEL
                         }
-                    }
-                    embeddings_data.append(embedding_data)
-                    print(f"청크 {i} 임베딩 생성 완료!")
-                else:
-                    print(f"청크 {i} 임베딩 생성 실패")
-            
-            # 6. 작은 배치로 나누어서 임베딩 저장 (대용량 데이터 처리)
-            if embeddings_data:
-                print(f"{len(embeddings_data)}개 임베딩 데이터베이스에 저장 중...")
+                    })
                 
-                # 배치 크기 설정 (너무 크면 Supabase 저장 실패)
-                BATCH_SIZE = 10  # 한번에 10개씩 저장
-                saved_count = 0
+                if rows:
+                    insert_started = time.time()
+                    await asyncio.to_thread(self._insert_embedding_rows, rows)
+                    metrics["insert_seconds"] += time.time() - insert_started
+                    embeddings_data.extend(rows)
                 
-                for i in range(0, len(embeddings_data), BATCH_SIZE):
-                    batch = embeddings_data[i:i + BATCH_SIZE]
-                    print(f"배치 {i//BATCH_SIZE + 1}/{(len(embeddings_data) + BATCH_SIZE - 1)//BATCH_SIZE}: {len(batch)}개 저장 중...")
-                    
-                    try:
-                        result = self.supabase.table('pdf_embeddings').insert(batch).execute()
-                        
-                        # 최신 Supabase Python 클라이언트 응답 처리
-                        if hasattr(result, 'error') and result.error:
-                            print(f"배치 저장 오류: {result.error}")
-                            return {"success": False, "error": f"임베딩 저장 실패: {result.error}"}
-                        
-                        saved_count += len(batch)
-                        print(f"배치 저장 완료: {saved_count}/{len(embeddings_data)}")
-                        
-                    except Exception as batch_error:
-                        print(f"배치 저장 중 예외 발생: {batch_error}")
-                        return {"success": False, "error": f"배치 저장 실패: {str(batch_error)}"}
+                await self._report_progress(
+                    document_id,
+                    "embedding",
+                    processed_chunks=len(embeddings_data),
+                    total_chunks=total_chunks
+                )
+                print(f"임베딩 저장 진행: {len(embeddings_data)}/{total_chunks}")
+            
+            await self._report_progress(document_id, "embedding", processed_chunks=0, total_chunks=total_chunks)
+            async with httpx.AsyncClient(timeout=EMBEDDING_TIMEOUT_SECONDS) as client:
+                tasks = [
+                    asyncio.create_task(embed_and_store(batch_start, client))
+                    for batch_start in range(0, total_chunks, EMBEDDING_BATCH_SIZE)
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                except Exception as batch_error:
+                    for task in tasks:
+                        task.cancel()
+                    print(f"배치 저장 중 예외 발생: {batch_error}")
+                    return {"success": False, "error": f"배치 저장 실패: {str(batch_error)}"}
+            
+            if embeddings_data:
+                saved_count = len(embeddings_data)
                 
                 # 7. 문서 상태 업데이트
-                update_result = self.supabase.table('pdf_documents').update({
-                    'embedding_status': 'completed',
-                    'total_chunks': saved_count
-                }).eq('id', document_id).execute()
+                update_result = await asyncio.to_thread(
+                    lambda: self.supabase.table('pdf_documents').update({
+                        'embedding_status': 'completed',
+                        'total_chunks': saved_count
+                    }).eq('id', document_id).execute()
+                )
                 
                 if hasattr(update_result, 'error') and update_result.error:
                     print(f"문서 상태 업데이트 오류: {update_result.error}")
                 
-                print(f"임베딩 처리 완료: {saved_count}개 임베딩 생성됨")
+                # 8. 코퍼스 버전을 올려 검색 캐시를 무효화하고 검색 인덱스 증분 갱신
+                embeddings_data.sort(key=lambda row: row['chunk_index'])
+                corpus_version = await bump_corpus_version()
+                await asyncio.to_thread(self._update_search_indexes, document_id, embeddings_data, corpus_version)
+                
+                metrics["embed_seconds"] = round(metrics["embed_seconds"], 3)
+                metrics["insert_seconds"] = round(metrics["insert_seconds"], 3)
+                metrics["total_seconds"] = round(time.time() - started, 3)
+                await self._report_progress(
+                    document_id,
+                    "completed",
+                    processed_chunks=saved_count,
+                    total_chunks=total_chunks,
+                    metrics=metrics
+                )
+                print(f"임베딩 처리 완료: {saved_count}개 임베딩 생성됨 (단계별 소요 시간: {metrics})")
                 return {
                     "success": True,
                     "message": f"{saved_count}개의 임베딩이 생성되었습니다.",
-                    "chunks_processed": saved_count
+                    "chunks_processed": saved_count,
+                    "metrics": metrics
                 }
             else:
                 return {"success": False, "error": "임베딩을 생성할 수 없습니다."}
             
         except Exception as e:
             print(f"문서 처리 오류: {str(e)}")
+            await self._report_progress(document_id, "failed", error=str(e))
             
             # 오류 발생해도 저장된 청크가 있으면 completed로, 없으면 failed로 처리
             try:
@@ -224,294 +445,115 @@ class OllamaEmbeddingProcessor:
                 print(f"오류 상태 업데이트 실패: {update_error}")
                 return {"success": False, "error": f"처리 오류: {str(e)}, 상태 업데이트 오류: {str(update_error)}"}
     
+    def _update_search_indexes(self, document_id: str, embeddings_data: List[Dict[str, Any]], corpus_version: int = None) -> None:
+        """처리 완료된 문서의 청크를 벡터 인덱스와 BM25 색인에 반영"""
+        try:
+            doc_result = self.supabase.table('pdf_documents').select(
+                'original_file_name, department'
+            ).eq('id', document_id).execute()
+            doc_info = doc_result.data[0] if doc_result.data else {}
+            for index in (get_vector_index(), get_bm25_index()):
+                index.add_document(
+                    document_id,
+                    embeddings_data,
+                    doc_info.get('original_file_name'),
+                    doc_info.get('department'),
+                    corpus_version
+                )
+        except Exception as e:
+            # 인덱스는 주기적으로 재적재되므로 실패해도 처리 결과에는 영향 없음
+            print(f"검색 인덱스 갱신 실패: {str(e)}")
+
     async def search_similar_documents(
         self,
         query: str,
         match_count: int = 5,
         filter_department: str = None
     ) -> List[Dict[str, Any]]:
-        """하이브리드 검색 (벡터 + 키워드) - RPC 없이 직접 구현"""
+        """하이브리드 검색 (벡터 + 키워드) 결과 목록"""
+        response = await self.search_documents(query, match_count, filter_department)
+        return response.results
+
+    async def search_documents(
+        self,
+        query: str,
+        match_count: int = 5,
+        filter_department: str = None
+    ) -> SearchResponse:
+        """하이브리드 검색 (벡터 + 키워드, RRF 결합) - 결과와 단계별 소요 시간"""
+        started = time.perf_counter()
+        corpus_version = await get_corpus_version()
         try:
             print(f"하이브리드 검색 시작: '{query}' (최대 {match_count}개)")
 
-            # 1. 벡터 검색 실행
-            vector_results = await self._vector_search(query, match_count * 2, filter_department)
-            print(f"벡터 검색 결과: {len(vector_results)}개")
-
-            # 2. 키워드 검색 실행
-            keyword_results = await self._keyword_search(query, match_count * 2, filter_department)
-            print(f"키워드 검색 결과: {len(keyword_results)}개")
-
-            # 3. 하이브리드 결합 (간단한 점수 기반)
-            combined_results = self._combine_search_results(vector_results, keyword_results)
-            print(f"결합 후 결과: {len(combined_results)}개")
+            # 같은 코퍼스 버전에서 같은 질의를 이미 검색했다면 캐시된 결과 반환
+            cache_key = (normalize_query(query), filter_department, match_count, corpus_version)
+            cached_results = search_result_cache.get(cache_key)
+            if cached_results is not None:
+                print(f"검색 결과 캐시 사용: {len(cached_results)}개")
+                return SearchResponse(
+                    results=[dict(result) for result in cached_results],
+                    timings_ms={'cache': round((time.perf_counter() - started) * 1000, 2)},
+                )
 
-            # 4. 최종 결과 반환
-            final_results = combined_results[:match_count]
-            print(f"최종 반환: {len(final_results)}개")
-            print(f"{final_results}")
+            response = await self.search_service.search(query, match_count, filter_department, corpus_version)
+            print(f"하이브리드 검색 완료: 후보 {response.candidate_counts}, 최종 {len(response.results)}개, 소요 {response.timings_ms}")
 
-            return final_results
+            search_result_cache.set(cache_key, [dict(result) for result in response.results])
+            return response
 
         except Exception as e:
             print(f"하이브리드 검색 오류: {str(e)}")
             # 오류시 키워드 검색만 실행
-            return await self._keyword_search(query, match_count, filter_department)
+            results = await self._keyword_search(query, match_count, filter_department, corpus_version)
+            return SearchResponse(
+                results=results,
+                timings_ms={'total': round((time.perf_counter() - started) * 1000, 2)},
+            )
 
     async def _vector_search(
         self,
         query: str,
         match_count: int,
-        filter_department: str = None
+        filter_department: str = None,
+        corpus_version: int = None
     ) -> List[Dict[str, Any]]:
-        """벡터 검색 (RPC 없이 직접 구현)"""
+        """벡터 검색 (프로세스 내 벡터 인덱스 사용)"""
         try:
-            # 쿼리 임베딩 생성
-            query_embedding = self.get_ollama_embedding(query)
-            if not query_embedding:
-                return []
-
-            # 부서 필터 적용 쿼리 구성
-            query_builder = self.supabase.table('pdf_embeddings').select(
-                'document_id, chunk_text, embedding, metadata, pdf_documents(original_file_name, department)'
-            ).eq('pdf_documents.embedding_status', 'completed').is_('pdf_documents.deleted_at', 'null')
-
-            if filter_department:
-                query_builder = query_builder.eq('pdf_documents.department', filter_department)
-
-            # 충분한 데이터 가져오기
-            embeddings_result = query_builder.limit(200).execute()
-
-            if not embeddings_result.data:
-                return []
-
-            # 코사인 유사도 계산
-            scored_results = []
-            for item in embeddings_result.data:
-                doc_embedding = item.get('embedding', [])
-                if doc_embedding and len(doc_embedding) == len(query_embedding):
-                    similarity = self._cosine_similarity(query_embedding, doc_embedding)
-
-                    doc_info = item.get('pdf_documents', {})
-                    scored_results.append({
-                        'document_id': item['document_id'],
-                        'chunk_text': item['chunk_text'],
-                        'similarity': round(similarity, 4),
-                        'document_title': doc_info.get('original_file_name', '제목 없음'),
-                        'department': doc_info.get('department', '부서 정보 없음'),
-                        'metadata': item.get('metadata', {}),
-                        'search_type': 'vector'
-                    })
-
-            # 유사도순 정렬 후 임계값 필터링
-            scored_results.sort(key=lambda x: x['similarity'], reverse=True)
-            return [r for r in scored_results[:match_count] if r['similarity'] > 0.2]
+            # 쿼리 임베딩 생성 (같은 질의는 캐시된 벡터 재사용)
+            embedding_cache_key = (EMBEDDING_MODEL, normalize_query(query))
+            query_embedding = query_embedding_cache.get(embedding_cache_key)
+            if query_embedding is None:
+                query_embedding = await self.get_ollama_embedding(query)
+                if not query_embedding:
+                    return []
+                query_embedding_cache.set(embedding_cache_key, query_embedding)
+
+            # 전체 코퍼스 인덱스에서 top-k 계산 (부서 필터 포함)
+            vector_index = get_vector_index()
+            await asyncio.to_thread(vector_index.ensure_loaded, self.supabase, corpus_version)
+            return vector_index.search(query_embedding, match_count, filter_department)
 
         except Exception as e:
             print(f"벡터 검색 오류: {str(e)}")
             return []
 
-    def _combine_search_results(
-        self,
-        vector_results: List[Dict],
-        keyword_results: List[Dict]
-    ) -> List[Dict[str, Any]]:
-        """벡터 검색과 키워드 검색 결과를 결합"""
-        # 결과를 document_id + chunk_text로 식별하여 중복 제거 및 점수 결합
-        combined_scores = {}
-
-        # 벡터 검색 결과 처리 (가중치 0.7)
-        for i, result in enumerate(vector_results):
-            key = f"{result['document_id']}_{hash(result['chunk_text'][:100])}"
-
-            if key not in combined_scores:
-                combined_scores[key] = result.copy()
-                combined_scores[key]['vector_score'] = result.get('similarity', 0)
-                combined_scores[key]['keyword_score'] = 0
-                combined_scores[key]['vector_rank'] = i + 1
-                combined_scores[key]['keyword_rank'] = 999
-            else:
-                combined_scores[key]['vector_score'] = max(
-                    combined_scores[key]['vector_score'],
-                    result.get('similarity', 0)
-                )
-                combined_scores[key]['vector_rank'] = min(combined_scores[key]['vector_rank'], i + 1)
-
-        # BM25 검색 결과 처리
-        for i, result in enumerate(keyword_results):
-            key = f"{result['document_id']}_{hash(result['chunk_text'][:100])}"
-
-            # BM25 점수 사용 (기존 similarity 대신)
-            bm25_score = result.get('bm25_score', 0)
-            normalized_bm25 = result.get('similarity', bm25_score / 10)
-
-            if key not in combined_scores:
-                combined_scores[key] = result.copy()
-                combined_scores[key]['vector_score'] = 0
-                combined_scores[key]['keyword_score'] = normalized_bm25
-                combined_scores[key]['bm25_raw_score'] = bm25_score
-                combined_scores[key]['vector_rank'] = 999
-                combined_scores[key]['keyword_rank'] = i + 1
-            else:
-                # 더 높은 BM25 점수 선택
-                if bm25_score > combined_scores[key].get('bm25_raw_score', 0):
-                    combined_scores[key]['keyword_score'] = normalized_bm25
-                    combined_scores[key]['bm25_raw_score'] = bm25_score
-                combined_scores[key]['keyword_rank'] = min(combined_scores[key]['keyword_rank'], i + 1)
-
-        # 최종 점수 계산 및 정렬
-        final_results = []
-        for result in combined_scores.values():
-            # RRF (Reciprocal Rank Fusion) 기반 점수 계산
-            vector_rrf = 1 / (60 + result['vector_rank'])
-            keyword_rrf = 1 / (60 + result['keyword_rank'])
-
-            # 가중 결합 점수
-            final_score = (
-                result['vector_score'] * 0.8 +
-                result['keyword_score'] * 0.2 +
-                vector_rrf * 0.3 +
-                keyword_rrf * 0.1
-            )
-
-            result['final_score'] = round(final_score, 4)
-            result['similarity'] = round(final_score, 4)  # 호환성을 위해
-            final_results.append(result)
-
-        # 최종 점수로 정렬
-        return sorted(final_results, key=lambda x: x['final_score'], reverse=True)
-    
-    
-    async def _keyword_search(self, query: str, match_count: int, filter_department: str = None) -> List[Dict]:
-        """BM25 기반 키워드 검색"""
+    async def _keyword_search(self, query: str, match_count: int, filter_department: str = None, corpus_version: int = None) -> List[Dict]:
+        """BM25 기반 키워드 검색 (전체 코퍼스 역색인 사용)"""
         try:
             print(f"BM25 키워드 검색 시작: '{query}'")
 
-            # 모든 문서 조회 (BM25 계산을 위해)
-            query_builder = self.supabase.table('pdf_embeddings').select(
-                'document_id, chunk_text, pdf_documents(original_file_name, department)'
-            ).eq('pdf_documents.embedding_status', 'completed').is_('pdf_documents.deleted_at', 'null')
-
-            if filter_department:
-                query_builder = query_builder.eq('pdf_documents.department', filter_department)
+            bm25_index = get_bm25_index()
+            await asyncio.to_thread(bm25_index.ensure_loaded, self.supabase, corpus_version)
+            results = bm25_index.search(query, match_count, filter_department)
 
-            result = query_builder.limit(500).execute()  # BM25 계산을 위해 더 많이 조회
-
-            if not result.data:
-                return []
-
-            print(f"BM25 계산 대상: {len(result.data)}개 문서")
-
-            # BM25 점수 계산
-            bm25_scores = self._calculate_bm25_scores(query, result.data)
-
-            # 점수순 정렬 후 상위 결과만 선택
-            ranked_results = sorted(bm25_scores, key=lambda x: x['bm25_score'], reverse=True)
-
-            # 점수가 0인 결과 제거
-            filtered_results = [r for r in ranked_results if r['bm25_score'] > 0]
-
-            print(f"BM25 검색 완료: {len(filtered_results)}개 관련 문서")
-
-            return filtered_results[:match_count]
+            print(f"BM25 검색 완료: {len(results)}개 관련 문서 (색인 {len(bm25_index)}개 청크)")
+            return results
 
         except Exception as e:
             print(f"BM25 검색 오류: {str(e)}")
             return []
 
-    def _calculate_bm25_scores(self, query: str, documents: List[Dict]) -> List[Dict]:
-        """BM25 알고리즘으로 문서 점수 계산"""
-        # BM25 파라미터
-        k1 = 1.5  # term frequency saturation parameter
-        b = 0.75  # length normalization parameter
-
-        # 쿼리 토큰화
-        query_terms = self._tokenize(query.lower())
-        if not query_terms:
-            return []
-
-        # 문서 전처리
-        doc_tokens = []
-        doc_lengths = []
-        term_doc_freq = Counter()  # 각 단어가 포함된 문서 수
-
-        for doc in documents:
-            tokens = self._tokenize(doc['chunk_text'].lower())
-            doc_tokens.append(tokens)
-            doc_lengths.append(len(tokens))
-
-            # 문서별 고유 단어들
-            unique_terms = set(tokens)
-            for term in unique_terms:
-                term_doc_freq[term] += 1
-
-        total_docs = len(documents)
-        avg_doc_length = sum(doc_lengths) / total_docs if total_docs > 0 else 0
-
-        # BM25 점수 계산
-        scored_results = []
-        for i, doc in enumerate(documents):
-            doc_token_count = Counter(doc_tokens[i])
-            doc_length = doc_lengths[i]
-            bm25_score = 0
-
-            for term in query_terms:
-                if term in doc_token_count:
-                    # Term Frequency (TF)
-                    tf = doc_token_count[term]
-
-                    # Inverse Document Frequency (IDF)
-                    df = term_doc_freq.get(term, 0)
-                    if df > 0:
-                        idf = math.log((total_docs - df + 0.5) / (df + 0.5))
-                    else:
-                        continue
-
-                    # BM25 점수 계산
-                    numerator = tf * (k1 + 1)
-                    denominator = tf + k1 * (1 - b + b * (doc_length / avg_doc_length))
-                    bm25_score += idf * (numerator / denominator)
-
-            # 결과 포맷팅
-            doc_info = doc.get('pdf_documents', {})
-            scored_results.append({
-                'document_id': doc['document_id'],
-                'chunk_text': doc['chunk_text'],
-                'document_title': doc_info.get('original_file_name', '제목 없음'),
-                'department': doc_info.get('department', '부서 정보 없음'),
-                'search_type': 'bm25',
-                'bm25_score': round(bm25_score, 4),
-                'similarity': min(bm25_score / 10, 1.0)  # 0-1 범위로 정규화
-            })
-
-        return scored_results
-
     def _tokenize(self, text: str) -> List[str]:
         """텍스트 토큰화 (한국어/영어 지원)"""
-        # 한국어, 영어, 숫자만 남기고 나머지 제거
-        text = re.sub(r'[^\w\s가-힣]', ' ', text)
-
-        # 공백으로 분할하여 토큰화
-        tokens = text.split()
-
-        # 길이가 1인 토큰 제거 (너무 짧은 단어)
-        tokens = [token for token in tokens if len(token) > 1]
-
-        return tokens
-    
-    
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """코사인 유사도 계산"""
-        import numpy as np
-        vec1_np = np.array(vec1)
-        vec2_np = np.array(vec2)
-        
-        dot_product = np.dot(vec1_np, vec2_np)
-        norm1 = np.linalg.norm(vec1_np)
-        norm2 = np.linalg.norm(vec2_np)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0
-        
-        return dot_product / (norm1 * norm2)
-    
+        return tokenize(text)
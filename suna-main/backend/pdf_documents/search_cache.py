@@ -0,0 +1,94 @@
+# PDF 검색 캐시
+#
+# 에이전트는 한 실행 안에서, 또 같은 부서 사용자들끼리 같은(또는 거의 같은) 질의를 반복한다.
+# - 질의 임베딩 캐시: (임베딩 모델, 정규화된 질의) → 벡터
+# - 검색 결과 캐시: (정규화된 질의, 부서, 결과 개수, 코퍼스 버전) → 최종 순위 결과
+# 두 캐시 모두 프로세스 내 LRU + TTL이다.
+#
+# 코퍼스 버전은 Redis 카운터로, 문서가 추가/삭제될 때 bump_corpus_version으로 올린다.
+# 버전이 키에 포함되므로 문서가 바뀐 뒤에는 이전 결과가 쓰이지 않고,
+# 다른 프로세스의 검색 인덱스도 버전이 바뀌면 다시 적재된다.
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from services import redis
+
+
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = 3600
+SEARCH_RESULT_CACHE_SIZE = 512
+SEARCH_RESULT_CACHE_TTL_SECONDS = 600
+
+CORPUS_VERSION_KEY = "pdf_corpus_version"
+
+
+class LRUTTLCache:
+    """크기 제한(LRU)과 만료 시간(TTL)이 있는 스레드 안전 캐시"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+query_embedding_cache = LRUTTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL_SECONDS)
+search_result_cache = LRUTTLCache(SEARCH_RESULT_CACHE_SIZE, SEARCH_RESULT_CACHE_TTL_SECONDS)
+
+# Redis를 쓸 수 없을 때 사용하는 프로세스 내 버전
+_local_corpus_version = 0
+
+
+def normalize_query(query: str) -> str:
+    """대소문자/공백 차이만 있는 질의를 같은 키로 취급"""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+async def get_corpus_version() -> int:
+    """현재 코퍼스 버전"""
+    try:
+        version = await redis.get(CORPUS_VERSION_KEY)
+        return int(version) if version else 0
+    except Exception as e:
+        print(f"코퍼스 버전 조회 실패 (로컬 버전 사용): {str(e)}")
+        return _local_corpus_version
+
+
+async def bump_corpus_version() -> int:
+    """문서 추가/삭제 시 코퍼스 버전을 올려 검색 결과 캐시를 무효화"""
+    global _local_corpus_version
+    _local_corpus_version += 1
+    search_result_cache.clear()
+    try:
+        redis_client = await redis.get_client()
+        return int(await redis_client.incr(CORPUS_VERSION_KEY))
+    except Exception as e:
+        print(f"코퍼스 버전 갱신 실패 (로컬 버전 사용): {str(e)}")
+        return _local_corpus_version
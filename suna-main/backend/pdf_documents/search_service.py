@@ -0,0 +1,176 @@
+# PDF 하이브리드 검색 서비스
+#
+# 여러 검색기(retriever)를 동시에 실행하고 Reciprocal Rank Fusion(RRF)으로 결합한다.
+# - 검색기는 (query, limit, filter_department, corpus_version) → 결과 목록인 비동기 함수로,
+#   이름과 가중치를 붙여 등록한다. (현재: 벡터, BM25 키워드)
+# - 결합 점수: Σ weight / (rrf_k + rank). 점수 크기가 서로 다른 검색기도 순위만으로 공정하게 결합된다.
+# - 검색기별/결합/전체 소요 시간(ms)을 함께 반환한다.
+#
+# RRF 상수와 가중치는 환경 변수로 조정하며, 값을 바꾸기 전에는 benchmark/run_search_benchmark.py로
+# recall@k, MRR, 지연 시간을 비교한다.
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+RRF_K = int(os.getenv("PDF_SEARCH_RRF_K", "60"))
+VECTOR_WEIGHT = float(os.getenv("PDF_SEARCH_VECTOR_WEIGHT", "1.0"))
+KEYWORD_WEIGHT = float(os.getenv("PDF_SEARCH_KEYWORD_WEIGHT", "1.0"))
+# 결합 전에 각 검색기에서 가져올 후보 수 = match_count * CANDIDATE_MULTIPLIER
+CANDIDATE_MULTIPLIER = 2
+
+RetrieverFn = Callable[[str, int, Optional[str], Optional[int]], Awaitable[List[Dict[str, Any]]]]
+
+
+@dataclass
+class Retriever:
+    """이름이 붙은 검색기 (결과는 관련도 높은 순)"""
+    name: str
+    search: RetrieverFn
+    weight: float = 1.0
+
+
+@dataclass
+class SearchResponse:
+    results: List[Dict[str, Any]]
+    # 검색기 이름/'fusion'/'total' → 소요 시간(ms)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    # 검색기 이름 → 결합 전 후보 수
+    candidate_counts: Dict[str, int] = field(default_factory=dict)
+
+
+def result_key(result: Dict[str, Any]) -> Tuple[Any, str]:
+    """검색기 간 같은 청크를 식별하는 키"""
+    return result.get('document_id'), result.get('chunk_text') or ''
+
+
+def rrf_scores(
+    rankings: Sequence[Sequence[Hashable]],
+    weights: Optional[Sequence[float]] = None,
+    rrf_k: int = RRF_K,
+) -> Dict[Hashable, float]:
+    """순위 목록(관련도 높은 순 키 목록)별 RRF 점수 합계
+
+    키는 처음 등장한 순서로 반환된다. 한 목록에 같은 키가 여러 번 있으면 가장 높은 순위만 반영한다.
+    PDF 하이브리드 검색과 지식 베이스 검색(knowledge_base.retrieval)이 함께 사용한다.
+    """
+    scores: Dict[Hashable, float] = {}
+    for index, ranking in enumerate(rankings):
+        weight = 1.0 if weights is None else weights[index]
+        seen = set()
+        for rank, key in enumerate(ranking, start=1):
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    return scores
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[Dict[str, Any]]],
+    weights: Optional[Dict[str, float]] = None,
+    rrf_k: int = RRF_K,
+) -> List[Dict[str, Any]]:
+    """검색기별 순위 목록을 RRF로 결합
+
+    결과 dict에는 검색기별 순위/유사도(`{name}_rank`, `{name}_score`)와 RRF 점수(`final_score`)가
+    추가된다. `similarity`는 화면 표시용으로 검색기 유사도 중 가장 큰 값(0~1)을 유지한다.
+    """
+    weights = weights or {}
+    scores = rrf_scores(
+        [[result_key(result) for result in results] for results in rankings.values()],
+        [weights.get(name, 1.0) for name in rankings],
+        rrf_k,
+    )
+    fused: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+
+    for name, results in rankings.items():
+        for rank, result in enumerate(results, start=1):
+            key = result_key(result)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = dict(result)
+                entry['similarity'] = 0.0
+                entry['search_types'] = []
+            elif f'{name}_rank' in entry:
+                # 같은 검색기에서 중복된 청크는 더 높은 순위만 반영
+                continue
+            entry[f'{name}_rank'] = rank
+            entry[f'{name}_score'] = result.get('similarity', 0)
+            entry['similarity'] = max(entry['similarity'], result.get('similarity', 0))
+            entry['search_types'].append(name)
+
+    for key, entry in fused.items():
+        entry['final_score'] = round(scores[key], 6)
+        entry['search_type'] = 'hybrid' if len(entry['search_types']) > 1 else entry['search_types'][0]
+
+    return sorted(fused.values(), key=lambda entry: entry['final_score'], reverse=True)
+
+
+class HybridSearchService:
+    """검색기를 동시에 실행하고 RRF로 결합"""
+
+    def __init__(
+        self,
+        retrievers: Sequence[Retriever],
+        rrf_k: int = RRF_K,
+        candidate_multiplier: int = CANDIDATE_MULTIPLIER,
+    ):
+        self.retrievers = list(retrievers)
+        self.rrf_k = rrf_k
+        self.candidate_multiplier = candidate_multiplier
+
+    async def _run_retriever(
+        self,
+        retriever: Retriever,
+        query: str,
+        limit: int,
+        filter_department: Optional[str],
+        corpus_version: Optional[int],
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        started = time.perf_counter()
+        try:
+            results = await retriever.search(query, limit, filter_department, corpus_version)
+        except Exception as e:
+            # 검색기 하나가 실패해도 나머지 결과로 응답
+            print(f"{retriever.name} 검색 오류: {str(e)}")
+            results = []
+        return results, (time.perf_counter() - started) * 1000
+
+    async def search(
+        self,
+        query: str,
+        match_count: int,
+        filter_department: Optional[str] = None,
+        corpus_version: Optional[int] = None,
+    ) -> SearchResponse:
+        started = time.perf_counter()
+        limit = match_count * self.candidate_multiplier
+        outputs = await asyncio.gather(*[
+            self._run_retriever(retriever, query, limit, filter_department, corpus_version)
+            for retriever in self.retrievers
+        ])
+
+        timings = {}
+        rankings = {}
+        for retriever, (results, elapsed_ms) in zip(self.retrievers, outputs):
+            rankings[retriever.name] = results
+            timings[retriever.name] = round(elapsed_ms, 2)
+
+        fusion_started = time.perf_counter()
+        fused = reciprocal_rank_fusion(
+            rankings,
+            {retriever.name: retriever.weight for retriever in self.retrievers},
+            self.rrf_k,
+        )[:match_count]
+        timings['fusion'] = round((time.perf_counter() - fusion_started) * 1000, 2)
+        timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+
+        return SearchResponse(
+            results=fused,
+            timings_ms=timings,
+            candidate_counts={name: len(results) for name, results in rankings.items()},
+        )
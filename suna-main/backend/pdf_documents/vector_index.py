@@ -0,0 +1,328 @@
+# PDF 임베딩 벡터 인덱스
+#
+# pdf_embeddings 전체 코퍼스를 프로세스 메모리에 NumPy 행렬로 올려두고
+# 검색 시 전체 청크에 대해 top-k를 계산한다. (기존: 200행만 조회 후 Python 루프로 점수 계산)
+#
+# - 최초 검색 시 PostgREST에서 페이지 단위로 전체 임베딩을 적재
+# - process_document 완료 시 add_document로 해당 문서만 교체 (증분 갱신)
+# - 백엔드에서 문서 삭제 시 remove_document로 제거
+# - 프론트엔드 등 다른 경로의 변경은 INDEX_REFRESH_SECONDS 주기의 재적재로 반영
+#
+# 저장 형식은 열(column) 단위 배열이다.
+# - 임베딩: 미리 L2 정규화된 연속(contiguous) float32 행렬 → 코사인 유사도 = 행렬·벡터 곱 한 번
+# - 문서 ID/본문/제목/부서/메타데이터: 같은 순서의 object 배열
+# - 부서별 부분 행렬은 처음 필터링될 때 만들어 캐시하고, 인덱스가 바뀌면 버린다
+# 검색 결과는 (행 번호, 유사도) 구조화 배열로 계산하고, 최종 top-k만 dict로 변환한다.
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# PostgREST 한 번 조회당 행 수
+INDEX_PAGE_SIZE = 1000
+# 다른 프로세스/프론트엔드에서 변경된 내용을 반영하기 위한 전체 재적재 주기
+INDEX_REFRESH_SECONDS = 300
+
+# 검색 결과 레코드 (인덱스 행 번호, 코사인 유사도)
+HIT_DTYPE = np.dtype([('row', np.int64), ('similarity', np.float32)])
+
+_COLUMNS = ('document_id', 'chunk_index', 'chunk_text', 'metadata', 'document_title', 'department')
+
+
+def parse_embedding(embedding: Any) -> Optional[List[float]]:
+    """pgvector 컬럼은 문자열('[0.1,...]')로, float 배열은 리스트로 반환된다"""
+    if isinstance(embedding, str):
+        try:
+            embedding = json.loads(embedding)
+        except json.JSONDecodeError:
+            return None
+    return embedding or None
+
+
+def fetch_completed_chunks(supabase, include_embeddings: bool = True) -> List[Dict[str, Any]]:
+    """완료된 문서의 청크를 페이지 단위로 모두 조회 (벡터/BM25 인덱스 공용)"""
+    fields = 'document_id, chunk_index, chunk_text, metadata'
+    if include_embeddings:
+        fields += ', embedding'
+
+    rows = []
+    start = 0
+    while True:
+        result = supabase.table('pdf_embeddings').select(
+            f'{fields}, pdf_documents!inner(original_file_name, department)'
+        ).eq('pdf_documents.embedding_status', 'completed').is_(
+            'pdf_documents.deleted_at', 'null'
+        ).order('document_id').order('chunk_index').range(start, start + INDEX_PAGE_SIZE - 1).execute()
+
+        page = result.data or []
+        for item in page:
+            doc_info = item.get('pdf_documents') or {}
+            rows.append({
+                'document_id': item['document_id'],
+                'chunk_index': item.get('chunk_index'),
+                'chunk_text': item['chunk_text'],
+                'embedding': item.get('embedding'),
+                'metadata': item.get('metadata') or {},
+                'document_title': doc_info.get('original_file_name', '제목 없음'),
+                'department': doc_info.get('department', '부서 정보 없음'),
+            })
+
+        if len(page) < INDEX_PAGE_SIZE:
+            return rows
+        start += INDEX_PAGE_SIZE
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """행 단위 L2 정규화 (노름 0인 행은 0으로 유지)"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+class PdfVectorIndex:
+    """pdf_embeddings 전체에 대한 프로세스 내 벡터 인덱스"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 동시 검색이 전체 적재를 중복 실행하지 않도록 분리된 lock 사용
+        self._load_lock = threading.Lock()
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype=object) for name in _COLUMNS}
+        # 부서명 → (부분 행렬, 전체 인덱스 기준 행 번호)
+        self._department_views: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._loaded_at = 0.0
+        # 마지막으로 반영한 코퍼스 버전 (search_cache.get_corpus_version)
+        self._corpus_version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._vectors.shape[0]
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self._loaded_at > INDEX_REFRESH_SECONDS
+
+    def _to_arrays(self, rows: List[Dict[str, Any]], dimension: Optional[int]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """행 목록을 정규화된 행렬과 열 배열로 변환 (차원이 다른 임베딩은 제외)"""
+        kept_rows = []
+        vectors = []
+        for row in rows:
+            embedding = parse_embedding(row.get('embedding'))
+            if embedding is None:
+                continue
+            if dimension is None:
+                dimension = len(embedding)
+            if len(embedding) != dimension:
+                continue
+            kept_rows.append(row)
+            vectors.append(embedding)
+
+        if not vectors:
+            return np.empty((0, dimension or 0), dtype=np.float32), {name: np.empty(0, dtype=object) for name in _COLUMNS}
+
+        matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        columns = {}
+        for name in _COLUMNS:
+            column = np.empty(len(kept_rows), dtype=object)
+            column[:] = [row.get(name) for row in kept_rows]
+            columns[name] = column
+        return matrix, columns
+
+    def _replace(self, vectors: np.ndarray, columns: Dict[str, np.ndarray]) -> None:
+        """인덱스 내용을 교체하고 부서별 캐시를 무효화 (lock 보유 상태에서 호출)"""
+        self._vectors = vectors
+        self._columns = columns
+        self._department_views = {}
+
+    def snapshot(self) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+        """검색 한 번 동안 일관되게 사용할 (행렬, 열 배열, 부서별 캐시)"""
+        with self._lock:
+            return self._vectors, self._columns, self._department_views
+
+    @staticmethod
+    def _department_view(snapshot, department: str) -> Tuple[np.ndarray, np.ndarray]:
+        """부서별 부분 행렬 (처음 요청될 때 생성 후 캐시)"""
+        vectors, columns, views = snapshot
+        view = views.get(department)
+        if view is None:
+            row_numbers = np.flatnonzero(columns['department'] == department)
+            view = (np.ascontiguousarray(vectors[row_numbers]), row_numbers)
+            views[department] = view
+        return view
+
+    def needs_reload(self, corpus_version: Optional[int] = None) -> bool:
+        """재적재 주기가 지났거나 다른 프로세스에서 코퍼스가 바뀐 경우"""
+        if self.is_stale:
+            return True
+        return corpus_version is not None and corpus_version != self._corpus_version
+
+    def _advance_version(self, corpus_version: Optional[int]) -> bool:
+        """증분 갱신이 바로 다음 코퍼스 버전일 때만 버전을 올린다 (lock 보유 상태에서 호출)
+
+        그 사이에 다른 프로세스의 변경이 있었다면 인덱스에 빠진 문서가 있으므로
+        적재되지 않은 상태로 되돌려 다음 검색 때 전체를 다시 적재한다.
+        """
+        if corpus_version is None:
+            return True
+        if self._corpus_version is None or corpus_version != self._corpus_version + 1:
+            self._loaded_at = 0.0
+            return False
+        self._corpus_version = corpus_version
+        return True
+
+    def build(self, rows: List[Dict[str, Any]], corpus_version: Optional[int] = None) -> None:
+        """행 목록으로 인덱스 전체를 다시 만든다"""
+        vectors, columns = self._to_arrays(rows, None)
+        with self._lock:
+            self._replace(vectors, columns)
+            self._loaded_at = time.time()
+            self._corpus_version = corpus_version
+
+    def load(self, supabase, corpus_version: Optional[int] = None) -> None:
+        """전체 코퍼스를 다시 적재"""
+        started = time.time()
+        self.build(fetch_completed_chunks(supabase), corpus_version)
+        print(f"벡터 인덱스 적재 완료: {len(self)}개 청크 ({time.time() - started:.2f}초)")
+
+    def ensure_loaded(self, supabase, corpus_version: Optional[int] = None) -> None:
+        if not self.needs_reload(corpus_version):
+            return
+        with self._load_lock:
+            if self.needs_reload(corpus_version):
+                self.load(supabase, corpus_version)
+
+    def add_document(
+        self,
+        document_id: str,
+        rows: List[Dict[str, Any]],
+        document_title: str,
+        department: str,
+        corpus_version: Optional[int] = None
+    ) -> None:
+        """문서 한 건의 청크를 교체 (process_document 완료 시 호출)"""
+        new_rows = [{
+            'document_id': document_id,
+            'chunk_index': row.get('chunk_index'),
+            'chunk_text': row['chunk_text'],
+            'embedding': row['embedding'],
+            'metadata': row.get('metadata') or {},
+            'document_title': document_title or '제목 없음',
+            'department': department or '부서 정보 없음',
+        } for row in rows]
+
+        with self._lock:
+            # 아직 적재되지 않았다면 다음 검색 때 전체 적재에 포함된다
+            if not self._loaded_at or not self._advance_version(corpus_version):
+                return
+            dimension = self._vectors.shape[1] if len(self._vectors) else None
+            new_vectors, new_columns = self._to_arrays(new_rows, dimension)
+            keep = self._columns['document_id'] != document_id
+            if len(self._vectors):
+                new_vectors = np.concatenate([self._vectors[keep], new_vectors])
+                new_columns = {
+                    name: np.concatenate([self._columns[name][keep], new_columns[name]])
+                    for name in _COLUMNS
+                }
+            self._replace(np.ascontiguousarray(new_vectors), new_columns)
+
+    def remove_document(self, document_id: str, corpus_version: Optional[int] = None) -> None:
+        """삭제된 문서의 청크를 인덱스에서 제거"""
+        with self._lock:
+            if not self._loaded_at or not self._advance_version(corpus_version):
+                return
+            keep = self._columns['document_id'] != document_id
+            if keep.all():
+                return
+            self._replace(
+                np.ascontiguousarray(self._vectors[keep]),
+                {name: column[keep] for name, column in self._columns.items()}
+            )
+
+    def search_hits(
+        self,
+        snapshot,
+        query_embedding: List[float],
+        match_count: int,
+        filter_department: str = None,
+        min_similarity: float = 0.2
+    ) -> np.ndarray:
+        """유사도 내림차순 top-k를 HIT_DTYPE 구조화 배열로 반환"""
+        empty = np.empty(0, dtype=HIT_DTYPE)
+        if filter_department:
+            vectors, row_numbers = self._department_view(snapshot, filter_department)
+        else:
+            vectors, row_numbers = snapshot[0], None
+
+        if not len(vectors) or match_count <= 0:
+            return empty
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != vectors.shape[1]:
+            print(f"벡터 차원 불일치: 쿼리 {query.shape[0]}, 인덱스 {vectors.shape[1]}")
+            return empty
+
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return empty
+
+        # 행이 미리 정규화되어 있으므로 행렬·벡터 곱이 곧 코사인 유사도
+        scores = vectors @ (query / query_norm)
+
+        k = min(match_count, len(scores))
+        if k < len(scores):
+            candidates = np.argpartition(scores, -k)[-k:]
+        else:
+            candidates = np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        candidates = candidates[scores[candidates] > min_similarity]
+
+        hits = np.empty(len(candidates), dtype=HIT_DTYPE)
+        hits['row'] = candidates if row_numbers is None else row_numbers[candidates]
+        hits['similarity'] = scores[candidates]
+        return hits
+
+    @staticmethod
+    def to_results(snapshot, hits: np.ndarray) -> List[Dict[str, Any]]:
+        """구조화 배열 결과를 검색 결과 dict 목록으로 변환"""
+        columns = snapshot[1]
+
+        rows = hits['row']
+        document_ids = columns['document_id'][rows]
+        chunk_texts = columns['chunk_text'][rows]
+        titles = columns['document_title'][rows]
+        departments = columns['department'][rows]
+        metadatas = columns['metadata'][rows]
+        similarities = np.round(hits['similarity'].astype(np.float64), 4).tolist()
+
+        return [{
+            'document_id': document_ids[i],
+            'chunk_text': chunk_texts[i],
+            'similarity': similarities[i],
+            'document_title': titles[i],
+            'department': departments[i],
+            'metadata': metadatas[i],
+            'search_type': 'vector'
+        } for i in range(len(hits))]
+
+    def search(
+        self,
+        query_embedding: List[float],
+        match_count: int,
+        filter_department: str = None,
+        min_similarity: float = 0.2
+    ) -> List[Dict[str, Any]]:
+        """전체 코퍼스에 대한 코사인 유사도 top-k"""
+        snapshot = self.snapshot()
+        hits = self.search_hits(snapshot, query_embedding, match_count, filter_department, min_similarity)
+        return self.to_results(snapshot, hits)
+
+
+_vector_index = PdfVectorIndex()
+
+
+def get_vector_index() -> PdfVectorIndex:
+    """프로세스 전역 벡터 인덱스"""
+    return _vector_index
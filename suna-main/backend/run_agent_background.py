@@ -21,7 +21,7 @@ from services.langfuse import langfuse
 from utils.retry import retry
 
 import sentry_sdk
-from typing import Dict, Any
+from typing import Any, Dict, List
 
 redis_host = os.getenv('REDIS_HOST', 'redis')
 redis_port = int(os.getenv('REDIS_PORT', 6379))
@@ -332,6 +332,71 @@ async def run_agent_background(
 
         logger.info(f"Agent run background task fully completed for: {agent_run_id} (Instance: {instance_id}) with final status: {final_status}")
 
+@dramatiq.actor(max_retries=0, time_limit=60 * 60 * 1000)
+async def process_kb_ingestion_job(
+    job_id: str,
+    job_type: str,
+    agent_id: str,
+    account_id: str,
+    source_info: Dict[str, Any],
+):
+    """Ingest an uploaded file or ZIP archive into an agent's knowledge base."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(
+        kb_job_id=job_id,
+        agent_id=agent_id,
+    )
+
+    try:
+        await initialize()
+    except Exception as e:
+        logger.critical(f"Failed to initialize Redis connection: {e}")
+        raise e
+
+    from knowledge_base.ingestion import run_ingestion_job
+    await run_ingestion_job(job_id, job_type, agent_id, account_id, source_info)
+
+@dramatiq.actor(max_retries=0, time_limit=10 * 60 * 1000)
+async def sync_knowledge_base_entries(agent_id: str, entry_ids: List[str]):
+    """Index knowledge-base entries written through the API (embedding stays off the request path)."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(
+        agent_id=agent_id,
+    )
+
+    try:
+        await initialize()
+    except Exception as e:
+        logger.critical(f"Failed to initialize Redis connection: {e}")
+        raise e
+
+    from knowledge_base.retrieval import invalidate_agent, sync_entry_ids
+    try:
+        await sync_entry_ids(agent_id, entry_ids)
+    except Exception as e:
+        logger.error(f"Failed to index knowledge base entries for agent {agent_id}: {str(e)}")
+        await invalidate_agent(agent_id)
+
+@dramatiq.actor(max_retries=0, time_limit=30 * 60 * 1000)
+async def reindex_knowledge_base(agent_id: str):
+    """Rebuild an agent's knowledge-base retrieval index (scheduled when its index is missing)."""
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(
+        agent_id=agent_id,
+    )
+
+    try:
+        await initialize()
+    except Exception as e:
+        logger.critical(f"Failed to initialize Redis connection: {e}")
+        raise e
+
+    from knowledge_base.retrieval import reindex_agent
+    try:
+        await reindex_agent(agent_id)
+    except Exception as e:
+        logger.error(f"Failed to reindex knowledge base for agent {agent_id}: {str(e)}")
+
 async def _cleanup_redis_instance_key(agent_run_id: str):
     """Clean up the instance-specific Redis key for an agent run."""
     if not instance_id:
@@ -9,7 +9,9 @@ from pydantic import BaseModel
 from daytona_sdk import AsyncSandbox
 
 from sandbox.sandbox import get_or_start_sandbox, delete_sandbox
+from sandbox.registry import sandbox_registry
 from utils.logger import logger
+from utils.cache import Cache
 from utils.auth_utils import get_optional_user_id
 from services.supabase import DBConnection
 
@@ -17,6 +19,11 @@ from services.supabase import DBConnection
 router = APIRouter(tags=["sandbox"])
 db = None
 
+# The file browser fires many requests per second for the same sandbox, so the
+# lookup of a private project is cached briefly in Redis. Account membership is not cached:
+# it changes through basejump outside this API, so there is nothing to invalidate from here
+SANDBOX_ACCESS_CACHE_TTL_SECONDS = 30
+
 def initialize(_db: DBConnection):
     """Initialize the sandbox API with resources from the main API."""
     global db
@@ -67,10 +74,43 @@ def normalize_path(path: str) -> str:
         logger.error(f"Error normalizing path '{path}': {str(e)}")
         return path  # Return original path if decoding fails
 
+async def _get_sandbox_project(client, sandbox_id: str) -> Optional[dict]:
+    """Project that owns the sandbox (cached while private)."""
+    cache_key = f"sandbox_project:{sandbox_id}"
+    project_data = await Cache.get(cache_key)
+    if project_data is not None:
+        return project_data
+
+    project_result = await client.table('projects').select('*').filter('sandbox->>id', 'eq', sandbox_id).execute()
+    if not project_result.data or len(project_result.data) == 0:
+        return None
+
+    project_data = project_result.data[0]
+    # Public projects are not cached, so making a project private takes effect immediately
+    if not project_data.get('is_public'):
+        await Cache.set(cache_key, project_data, ttl=SANDBOX_ACCESS_CACHE_TTL_SECONDS)
+    return project_data
+
+async def _is_account_member(client, account_id: str, user_id: str) -> bool:
+    """Whether the user belongs to the account."""
+    account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
+    return bool(account_user_result.data)
+
+async def invalidate_sandbox_cache(sandbox_id: str):
+    """Drop cached project data and the sandbox handle after the sandbox or its project changed."""
+    sandbox_registry.evict_sandbox(sandbox_id)
+    try:
+        await Cache.invalidate(f"sandbox_project:{sandbox_id}")
+    except Exception as e:
+        logger.warning(f"Failed to invalidate sandbox cache for {sandbox_id}: {str(e)}")
+
 async def verify_sandbox_access(client, sandbox_id: str, user_id: Optional[str] = None):
     """
     Verify that a user has access to a specific sandbox based on account membership.
     
+    The lookup of a private project is cached for SANDBOX_ACCESS_CACHE_TTL_SECONDS;
+    public projects and account membership are always read from the database.
+    
     Args:
         client: The Supabase client
         sandbox_id: The sandbox ID to check access for
@@ -83,12 +123,10 @@ async def verify_sandbox_access(client, sandbox_id: str, user_id: Optional[str]
         HTTPException: If the user doesn't have access to the sandbox or sandbox doesn't exist
     """
     # Find the project that owns this sandbox
-    project_result = await client.table('projects').select('*').filter('sandbox->>id', 'eq', sandbox_id).execute()
+    project_data = await _get_sandbox_project(client, sandbox_id)
     
-    if not project_result.data or len(project_result.data) == 0:
+    if not project_data:
         raise HTTPException(status_code=404, detail="Sandbox not found")
-    
-    project_data = project_result.data[0]
 
     if project_data.get('is_public'):
         return project_data
@@ -100,20 +138,23 @@ async def verify_sandbox_access(client, sandbox_id: str, user_id: Optional[str]
     account_id = project_data.get('account_id')
     
     # Verify account membership
-    if account_id:
-        account_user_result = await client.schema('basejump').from_('account_user').select('account_role').eq('user_id', user_id).eq('account_id', account_id).execute()
-        if account_user_result.data and len(account_user_result.data) > 0:
-            return project_data
+    if account_id and await _is_account_member(client, account_id, user_id):
+        return project_data
     
     raise HTTPException(status_code=403, detail="Not authorized to access this sandbox")
 
-async def get_sandbox_by_id_safely(client, sandbox_id: str) -> AsyncSandbox:
+async def get_sandbox_by_id_safely(client, sandbox_id: str, project_data: Optional[dict] = None) -> AsyncSandbox:
     """
     Safely retrieve a sandbox object by its ID, using the project that owns it.
     
+    The handle comes from the process-wide sandbox registry, so repeated
+    requests for the same sandbox do not call Daytona again until the handle
+    needs revalidation.
+    
     Args:
         client: The Supabase client
         sandbox_id: The sandbox ID to retrieve
+        project_data: The owning project, if already known (e.g. from verify_sandbox_access)
     
     Returns:
         AsyncSandbox: The sandbox object
@@ -121,23 +162,23 @@ async def get_sandbox_by_id_safely(client, sandbox_id: str) -> AsyncSandbox:
     Raises:
         HTTPException: If the sandbox doesn't exist or can't be retrieved
     """
-    # Find the project that owns this sandbox
-    project_result = await client.table('projects').select('project_id').filter('sandbox->>id', 'eq', sandbox_id).execute()
+    if project_data is None:
+        # Find the project that owns this sandbox
+        project_data = await _get_sandbox_project(client, sandbox_id)
     
-    if not project_result.data or len(project_result.data) == 0:
+    if not project_data:
         logger.error(f"No project found for sandbox ID: {sandbox_id}")
         raise HTTPException(status_code=404, detail="Sandbox not found - no project owns this sandbox ID")
     
-    # project_id = project_result.data[0]['project_id']
-    # logger.debug(f"Found project {project_id} for sandbox {sandbox_id}")
-    
     try:
-        # Get the sandbox
-        sandbox = await get_or_start_sandbox(sandbox_id)
-        # Extract just the sandbox object from the tuple (sandbox, sandbox_id, sandbox_pass)
-        # sandbox = sandbox_tuple[0]
-            
-        return sandbox
+        handle = await sandbox_registry.acquire(project_data['project_id'], db)
+        if handle.sandbox_id != sandbox_id:
+            # The project was moved to another sandbox; this one is not served anymore
+            await invalidate_sandbox_cache(sandbox_id)
+            raise HTTPException(status_code=404, detail="Sandbox not found - no project owns this sandbox ID")
+        return handle.sandbox
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving sandbox {sandbox_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve sandbox: {str(e)}")
@@ -158,11 +199,11 @@ async def create_file(
     client = await db.client
     
     # Verify the user has access to this sandbox
-    await verify_sandbox_access(client, sandbox_id, user_id)
+    project_data = await verify_sandbox_access(client, sandbox_id, user_id)
     
     try:
         # Get sandbox using the safer method
-        sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
+        sandbox = await get_sandbox_by_id_safely(client, sandbox_id, project_data)
         
         # Read file content directly from the uploaded file
         content = await file.read()
@@ -191,11 +232,11 @@ async def list_files(
     client = await db.client
     
     # Verify the user has access to this sandbox
-    await verify_sandbox_access(client, sandbox_id, user_id)
+    project_data = await verify_sandbox_access(client, sandbox_id, user_id)
     
     try:
         # Get sandbox using the safer method
-        sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
+        sandbox = await get_sandbox_by_id_safely(client, sandbox_id, project_data)
         
         # List files
         files = await sandbox.fs.list_files(path)
@@ -240,11 +281,11 @@ async def read_file(
     client = await db.client
     
     # Verify the user has access to this sandbox
-    await verify_sandbox_access(client, sandbox_id, user_id)
+    project_data = await verify_sandbox_access(client, sandbox_id, user_id)
     
     try:
         # Get sandbox using the safer method
-        sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
+        sandbox = await get_sandbox_by_id_safely(client, sandbox_id, project_data)
         
         # Read file directly - don't check existence first with a separate call
         try:
@@ -292,11 +333,11 @@ async def delete_file(
     client = await db.client
     
     # Verify the user has access to this sandbox
-    await verify_sandbox_access(client, sandbox_id, user_id)
+    project_data = await verify_sandbox_access(client, sandbox_id, user_id)
     
     try:
         # Get sandbox using the safer method
-        sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
+        sandbox = await get_sandbox_by_id_safely(client, sandbox_id, project_data)
         
         # Delete file
         await sandbox.fs.delete_file(path)
@@ -323,6 +364,7 @@ async def delete_sandbox_route(
     try:
         # Delete the sandbox using the sandbox module function
         await delete_sandbox(sandbox_id)
+        await invalidate_sandbox_cache(sandbox_id)
         
         return {"status": "success", "deleted": True, "sandbox_id": sandbox_id}
     except Exception as e:
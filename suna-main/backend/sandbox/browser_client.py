@@ -0,0 +1,164 @@
+"""
+HTTP client for the browser automation APIs inside a sandbox.
+
+The browser tools used to reach the in-sandbox APIs (`BrowserTool`: Stagehand
+on `localhost:8004/api/*`, `SandboxBrowserTool`: `localhost:8003/api/automation/*`)
+by running `curl` through `sandbox.process.exec`, paying a process spawn per
+action, shell-quoting JSON payloads and piping multi-megabyte base64
+screenshots through the exec output. `BrowserApiClient` calls an API directly
+through the sandbox's Daytona preview URL for its port:
+
+- one `httpx.AsyncClient` per sandbox, so connections are reused across actions
+  and across tool instances of the same worker process
+- large responses (screenshots) are parsed off the event loop
+- if the preview URL cannot be reached, the call falls back to curl over exec
+"""
+
+import asyncio
+import json
+import os
+import shlex
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from daytona_sdk import AsyncSandbox
+
+from utils.logger import logger
+
+BROWSER_API_PORT = 8003
+BROWSER_API_BASE_PATH = "/api/automation"
+STAGEHAND_API_PORT = 8004
+STAGEHAND_API_BASE_PATH = "/api"
+BROWSER_API_TIMEOUT_SECONDS = float(os.getenv("BROWSER_API_TIMEOUT_SECONDS", "30"))
+BROWSER_API_MAX_CLIENTS = int(os.getenv("BROWSER_API_MAX_CLIENTS", "64"))
+PREVIEW_TOKEN_HEADER = "X-Daytona-Preview-Token"
+# Responses larger than this are parsed in a worker thread
+OFFLOAD_PARSE_BYTES = 256 * 1024
+
+
+class BrowserApiError(Exception):
+    pass
+
+
+async def _parse_json(body: bytes) -> Dict[str, Any]:
+    if len(body) > OFFLOAD_PARSE_BYTES:
+        return await asyncio.to_thread(json.loads, body)
+    return json.loads(body)
+
+
+class BrowserApiClient:
+    def __init__(self, sandbox: AsyncSandbox, port: int = BROWSER_API_PORT, base_path: str = BROWSER_API_BASE_PATH):
+        self.sandbox = sandbox
+        self.port = port
+        self.base_path = base_path.rstrip('/')
+        self._http = httpx.AsyncClient(
+            timeout=BROWSER_API_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=120),
+        )
+        self._endpoint: Optional[Tuple[str, Dict[str, str]]] = None
+
+    async def _resolve_endpoint(self) -> Tuple[str, Dict[str, str]]:
+        if self._endpoint is None:
+            preview_link = await self.sandbox.get_preview_link(self.port)
+            url = preview_link.url if hasattr(preview_link, 'url') else str(preview_link).split("url='")[1].split("'")[0]
+            token = getattr(preview_link, 'token', None)
+            headers = {PREVIEW_TOKEN_HEADER: token} if token else {}
+            self._endpoint = (url.rstrip('/'), headers)
+        return self._endpoint
+
+    def _path(self, endpoint: str) -> str:
+        return f"{self.base_path}/{endpoint}" if endpoint else self.base_path
+
+    async def request(
+        self,
+        endpoint: str,
+        params: Optional[dict] = None,
+        method: str = "POST",
+        timeout: float = BROWSER_API_TIMEOUT_SECONDS,
+    ) -> Dict[str, Any]:
+        """Call `{base_path}/{endpoint}` and return the decoded JSON response."""
+        started = time.perf_counter()
+        body = await self._request_via_preview(endpoint, params, method, timeout)
+        channel = "http"
+        if body is None:
+            self._endpoint = None
+            body = await self._request_via_exec(endpoint, params, method, timeout)
+            channel = "exec"
+
+        try:
+            result = await _parse_json(body)
+        except ValueError as e:
+            raise BrowserApiError(f"Failed to parse response JSON: {body[:500]!r} {e}")
+        logger.info(
+            f"Browser action {endpoint} via {channel}: {(time.perf_counter() - started) * 1000:.0f}ms, {len(body)} bytes"
+        )
+        return result
+
+    async def _request_via_preview(
+        self, endpoint: str, params: Optional[dict], method: str, timeout: float
+    ) -> Optional[bytes]:
+        """Return the response body, or None when the request cannot have reached the browser API.
+
+        Only failures before the action could run fall back to exec, so actions such as clicks are
+        never sent twice; read timeouts and other errors propagate.
+        """
+        try:
+            base_url, headers = await self._resolve_endpoint()
+        except Exception as e:
+            logger.warning(f"Could not resolve browser API preview URL, falling back to exec: {str(e)}")
+            return None
+
+        url = f"{base_url}{self._path(endpoint)}"
+        try:
+            if method == "GET":
+                response = await self._http.get(url, params=params, headers=headers, timeout=timeout)
+            else:
+                response = await self._http.request(method, url, json=params, headers=headers, timeout=timeout)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            logger.warning(f"Browser API unreachable via preview URL, falling back to exec: {str(e)}")
+            return None
+        if response.status_code in (502, 503):
+            # Returned by the preview proxy when it cannot reach the sandbox port
+            logger.warning(f"Browser API preview proxy returned {response.status_code}, falling back to exec")
+            return None
+        return response.content
+
+    async def _request_via_exec(self, endpoint: str, params: Optional[dict], method: str, timeout: float) -> bytes:
+        url = f"http://localhost:{self.port}{self._path(endpoint)}"
+        if method == "GET" and params:
+            url = f"{url}?{httpx.QueryParams(params)}"
+        curl_cmd = f"curl -s -X {method} {shlex.quote(url)} -H 'Content-Type: application/json'"
+        if method != "GET" and params:
+            curl_cmd += f" -d {shlex.quote(json.dumps(params))}"
+
+        response = await self.sandbox.process.exec(curl_cmd, timeout=int(timeout))
+        if response.exit_code != 0:
+            raise BrowserApiError(f"Browser automation request failed: {response}")
+        return (response.result or "").encode()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_clients: "OrderedDict[Tuple[str, int], BrowserApiClient]" = OrderedDict()
+
+
+def get_browser_client(
+    sandbox_id: str,
+    sandbox: AsyncSandbox,
+    port: int = BROWSER_API_PORT,
+    base_path: str = BROWSER_API_BASE_PATH,
+) -> BrowserApiClient:
+    """Return the shared client for a sandbox's API on `port`, pointing it at the current sandbox handle."""
+    key = (sandbox_id, port)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = BrowserApiClient(sandbox, port, base_path)
+    client.sandbox = sandbox
+    _clients.move_to_end(key)
+    while len(_clients) > BROWSER_API_MAX_CLIENTS:
+        _, evicted = _clients.popitem(last=False)
+        asyncio.ensure_future(evicted.aclose())
+    return client
@@ -0,0 +1,231 @@
+"""
+Batched filesystem operations on a Daytona sandbox.
+
+The per-file `sandbox.fs` calls cost one round-trip each, so tools that touch
+many files (workspace snapshots) or do exists/upload/chmod sequences for one
+write pay for every call. `SandboxFS` groups them:
+
+- `read_many` fetches many files as one tar archive built inside the sandbox
+  (falling back to bounded-concurrency `download_file` calls)
+- `write_many` applies a multi-file write plan all-or-nothing: the files are
+  uploaded as one tar and extracted to a staging directory (under /tmp when it
+  is on the target's filesystem, so dev-server file watchers do not see it),
+  preconditions (must / must not exist) are checked for every target before
+  anything is touched, and the files are then renamed into place one by one;
+  if a rename fails, the files already replaced are restored from backups and
+  the directories created for them are removed
+"""
+
+import asyncio
+import io
+import os
+import posixpath
+import shlex
+import tarfile
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from daytona_sdk import AsyncSandbox
+
+from utils.logger import logger
+
+SANDBOX_FS_READ_CONCURRENCY = int(os.getenv("SANDBOX_FS_READ_CONCURRENCY", "8"))
+# Reads of at least this many files go through a single tar archive
+TAR_READ_MIN_FILES = 4
+EXEC_TIMEOUT_SECONDS = 60
+
+WRITE_MODE_CREATE = "create"        # every target must not exist yet
+WRITE_MODE_OVERWRITE = "overwrite"  # every target must already exist
+WRITE_MODE_ANY = "any"
+
+_EXISTS_MARKER = "__EXISTS__"
+_MISSING_MARKER = "__MISSING__"
+
+
+class SandboxFSConflict(Exception):
+    """A write plan was rejected because targets did (create) or did not (overwrite) exist."""
+
+    def __init__(self, mode: str, paths: List[str]):
+        self.mode = mode
+        self.paths = paths
+        state = "already exist" if mode == WRITE_MODE_CREATE else "do not exist"
+        super().__init__(f"Files {state}: {', '.join(paths)}")
+
+
+class SandboxFS:
+    def __init__(self, sandbox: AsyncSandbox, concurrency: int = SANDBOX_FS_READ_CONCURRENCY):
+        self.sandbox = sandbox
+        self.concurrency = concurrency
+
+    async def _exec(self, script: str, timeout: int = EXEC_TIMEOUT_SECONDS):
+        return await self.sandbox.process.exec(f"/bin/sh -c {shlex.quote(script)}", timeout=timeout)
+
+    async def read_many(self, paths: Iterable[str]) -> Dict[str, bytes]:
+        """Read many absolute paths; files that are missing or unreadable are left out."""
+        paths = list(dict.fromkeys(paths))
+        if len(paths) >= TAR_READ_MIN_FILES:
+            try:
+                return await self._read_via_tar(paths)
+            except Exception as e:
+                logger.warning(f"Batched tar read of {len(paths)} files failed, reading individually: {str(e)}")
+        return await self._read_concurrently(paths)
+
+    async def _read_concurrently(self, paths: List[str]) -> Dict[str, bytes]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def read(path: str) -> Optional[bytes]:
+            async with semaphore:
+                try:
+                    return await self.sandbox.fs.download_file(path)
+                except Exception as e:
+                    logger.debug(f"Failed to read {path} from sandbox: {str(e)}")
+                    return None
+
+        contents = await asyncio.gather(*[read(path) for path in paths])
+        return {path: content for path, content in zip(paths, contents) if content is not None}
+
+    async def _read_via_tar(self, paths: List[str]) -> Dict[str, bytes]:
+        archive_path = f"/tmp/suna_fs_read_{uuid.uuid4().hex}.tar"
+        members = " ".join(shlex.quote(path.lstrip("/")) for path in paths)
+        response = await self._exec(
+            f"tar --ignore-failed-read -cf {archive_path} -C / -- {members} 2>/dev/null; test -f {archive_path}"
+        )
+        if getattr(response, "exit_code", 1) != 0:
+            raise Exception(f"tar exited with {getattr(response, 'exit_code', None)}")
+        try:
+            archive = await self.sandbox.fs.download_file(archive_path)
+        finally:
+            try:
+                await self.sandbox.fs.delete_file(archive_path)
+            except Exception:
+                pass
+        return await asyncio.to_thread(_extract_tar, archive)
+
+    async def write_many(
+        self,
+        files: Dict[str, bytes],
+        permissions: Optional[str] = None,
+        mode: str = WRITE_MODE_ANY,
+    ) -> None:
+        """Write all files or none of them (a failed rename rolls back the files already written).
+
+        `permissions` is an octal string applied to every file; when omitted,
+        overwritten files keep their current mode and new files get 644.
+        Raises `SandboxFSConflict` if the mode's precondition fails for any target.
+        """
+        if not files:
+            return
+        targets = list(files)
+        archive = await asyncio.to_thread(_build_tar, [files[target] for target in targets])
+
+        token = uuid.uuid4().hex
+        archive_path = f"/tmp/suna_fs_write_{token}.tar"
+        await self.sandbox.fs.upload_file(archive, archive_path)
+        lines = _write_plan_script(targets, archive_path, token, permissions, mode)
+        response = await self._exec("\n".join(lines))
+        exit_code = getattr(response, "exit_code", 1)
+        if exit_code == 3:
+            output = getattr(response, "result", "") or ""
+            conflicts = [
+                line.split(marker, 1)[1]
+                for line in output.splitlines()
+                for marker in (_EXISTS_MARKER, _MISSING_MARKER)
+                if marker in line
+            ]
+            raise SandboxFSConflict(mode, conflicts)
+        if exit_code != 0:
+            raise Exception(f"Batched write failed (exit code {exit_code}): {getattr(response, 'result', '')}")
+
+    async def write_file(
+        self,
+        path: str,
+        content: bytes,
+        permissions: Optional[str] = None,
+        mode: str = WRITE_MODE_ANY,
+    ) -> None:
+        await self.write_many({path: content}, permissions, mode)
+
+
+def _write_plan_script(
+    targets: List[str],
+    archive_path: str,
+    token: str,
+    permissions: Optional[str],
+    mode: str,
+) -> List[str]:
+    """Shell script lines applying a write plan; exits 2 (staging), 3 (precondition) or 4 (rolled back)."""
+    archive = shlex.quote(archive_path)
+    first_dir = shlex.quote(posixpath.dirname(targets[0]) or "/")
+    lines = [
+        # Stage in /tmp if it is on the same filesystem as the targets (renames must not cross
+        # filesystems), else next to the nearest existing ancestor; never create directories yet
+        f'd={first_dir}; while [ ! -d "$d" ]; do d=$(dirname "$d"); done',
+        f'if [ "$(stat -c %d /tmp)" = "$(stat -c %d "$d")" ]; then S=/tmp/suna_fs_stage_{token}; '
+        f'else S="$d/.suna_staging_{token}"; fi',
+        f'mkdir "$S" && tar -xf {archive} -C "$S" || {{ rm -rf "$S" {archive}; exit 2; }}',
+        f"rm -f {archive}",
+        "conflict=0",
+    ]
+    for target in targets:
+        quoted = shlex.quote(target)
+        if mode == WRITE_MODE_CREATE:
+            lines.append(f"[ -e {quoted} ] && {{ echo {_EXISTS_MARKER}{quoted}; conflict=1; }}")
+        elif mode == WRITE_MODE_OVERWRITE:
+            lines.append(f"[ -e {quoted} ] || {{ echo {_MISSING_MARKER}{quoted}; conflict=1; }}")
+    lines.append('[ "$conflict" = 1 ] && { rm -rf "$S"; exit 3; }')
+
+    # Undo the renames done so far (restore backups, remove new files), then the created directories
+    lines.append("DONE=0")
+    lines.append("rollback() {")
+    for index, target in enumerate(targets):
+        quoted = shlex.quote(target)
+        lines.append(
+            f'  [ "$DONE" -gt {index} ] && {{ if [ -e "$S/b{index}" ]; then mv -f "$S/b{index}" {quoted}; '
+            f"else rm -f {quoted}; fi; }}"
+        )
+    lines.append('  [ -f "$S/dirs" ] && sort -r "$S/dirs" | while read -r dir; do rmdir "$dir" 2>/dev/null; done')
+    lines.append('  rm -rf "$S"')
+    lines.append("}")
+
+    for index, target in enumerate(targets):
+        quoted = shlex.quote(target)
+        parent = shlex.quote(posixpath.dirname(target) or "/")
+        staged = f'"$S/{index}"'
+        backup = f'"$S/b{index}"'
+        if permissions:
+            chmod = f"chmod {shlex.quote(permissions)} {staged}"
+        else:
+            chmod = f"{{ [ -e {quoted} ] && chmod --reference={quoted} {staged} || chmod 644 {staged}; }}"
+        lines.append(
+            f'd={parent}; while [ ! -d "$d" ]; do echo "$d" >> "$S/dirs"; d=$(dirname "$d"); done'
+        )
+        lines.append(
+            f"mkdir -p {parent} && {{ [ ! -e {quoted} ] || ln -f {quoted} {backup} 2>/dev/null || cp -p {quoted} {backup}; }} "
+            f"&& {chmod} && mv -f {staged} {quoted} && DONE={index + 1} || {{ rollback; exit 4; }}"
+        )
+    lines.append('rm -rf "$S"')
+    return lines
+
+
+def _build_tar(contents: List[bytes]) -> bytes:
+    """Archive contents as members named by index, so target paths never need escaping in tar."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for index, content in enumerate(contents):
+            info = tarfile.TarInfo(name=str(index))
+            info.size = len(content)
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _extract_tar(archive: bytes) -> Dict[str, bytes]:
+    contents: Dict[str, bytes] = {}
+    with tarfile.open(fileobj=io.BytesIO(archive), mode="r") as tar:
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            extracted = tar.extractfile(member)
+            if extracted is not None:
+                contents["/" + member.name.lstrip("/")] = extracted.read()
+    return contents
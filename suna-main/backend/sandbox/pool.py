@@ -0,0 +1,203 @@
+"""
+Warm pool of pre-created, running sandboxes.
+
+Creating a sandbox (provision, start, supervisord) dominates the first tool call
+of a new project. With SANDBOX_POOL_SIZE > 0, sandboxes are created ahead of
+time and kept in a Redis list shared by all API and worker processes:
+
+- `claim_pooled_sandbox` pops one atomically (LPOP), assigns it to the project
+  (label, auto-stop) and returns it with its VNC password; expired or broken
+  entries are discarded
+- `create_or_claim_sandbox` is the drop-in for `create_sandbox` used by every
+  creation path: a pooled sandbox if one is available, a new one otherwise
+- claims and API startup schedule `replenish_pool` in the background; a Redis
+  lock keeps processes from over-filling the pool, and entries older than
+  SANDBOX_POOL_MAX_AGE_SECONDS are removed and their sandboxes deleted first
+- `schedule_sandbox_prestart` starts an existing project's stopped sandbox as
+  soon as an agent run is requested, so it is up by the first tool call; it
+  goes through `get_or_start_sandbox`, whose per-sandbox start lock makes the
+  worker wait for that start instead of issuing a second one
+
+Pooled sandboxes are created with auto-stop disabled (they must stay warm) and
+get the normal auto-stop interval when claimed.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Optional, Tuple
+
+from daytona_sdk import AsyncSandbox
+
+from sandbox.sandbox import SANDBOX_AUTO_STOP_MINUTES, create_sandbox, delete_sandbox, get_or_start_sandbox
+from services import redis
+from utils.logger import logger
+
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "0"))
+# Pooled sandboxes older than this are deleted instead of handed out
+SANDBOX_POOL_MAX_AGE_SECONDS = int(os.getenv("SANDBOX_POOL_MAX_AGE_SECONDS", str(6 * 3600)))
+SANDBOX_POOL_MAX_PARALLEL_CREATES = int(os.getenv("SANDBOX_POOL_MAX_PARALLEL_CREATES", "3"))
+SANDBOX_PRESTART_ENABLED = os.getenv("SANDBOX_PRESTART_ENABLED", "true").lower() == "true"
+
+POOL_KEY = "sandbox_warm_pool"
+REPLENISH_LOCK_KEY = "sandbox_warm_pool:replenish_lock"
+REPLENISH_LOCK_TTL_SECONDS = 600
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-run
+_background_tasks = set()
+
+
+def _run_in_background(coro) -> None:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _discard(sandbox_id: str) -> None:
+    try:
+        await delete_sandbox(sandbox_id)
+    except Exception as e:
+        logger.warning(f"Failed to delete discarded pooled sandbox {sandbox_id}: {str(e)}")
+
+
+async def _assign_to_project(sandbox: AsyncSandbox, project_id: str) -> None:
+    """Give a claimed sandbox the project label and the normal auto-stop interval (best effort)."""
+    try:
+        await sandbox.set_labels({'id': project_id})
+    except Exception as e:
+        logger.warning(f"Failed to label pooled sandbox {sandbox.id} for project {project_id}: {str(e)}")
+    try:
+        await sandbox.set_autostop_interval(SANDBOX_AUTO_STOP_MINUTES)
+    except Exception as e:
+        logger.warning(f"Failed to set auto-stop on pooled sandbox {sandbox.id}: {str(e)}")
+
+
+async def claim_pooled_sandbox(project_id: str) -> Optional[Tuple[AsyncSandbox, str]]:
+    """Take a warm sandbox from the pool for the project; returns (sandbox, password) or None."""
+    if SANDBOX_POOL_SIZE <= 0:
+        return None
+    try:
+        while True:
+            raw = await redis.lpop(POOL_KEY)
+            if raw is None:
+                logger.info("Sandbox warm pool is empty")
+                return None
+            entry = json.loads(raw)
+            if time.time() - entry['created_at'] > SANDBOX_POOL_MAX_AGE_SECONDS:
+                _run_in_background(_discard(entry['id']))
+                continue
+            try:
+                sandbox = await get_or_start_sandbox(entry['id'])
+            except Exception as e:
+                logger.warning(f"Pooled sandbox {entry['id']} is unusable, discarding: {str(e)}")
+                _run_in_background(_discard(entry['id']))
+                continue
+            await _assign_to_project(sandbox, project_id)
+            logger.info(f"Claimed pooled sandbox {sandbox.id} for project {project_id}")
+            return sandbox, entry['pass']
+    except Exception as e:
+        logger.error(f"Error claiming pooled sandbox: {str(e)}")
+        return None
+    finally:
+        schedule_pool_replenish()
+
+
+async def create_or_claim_sandbox(project_id: str) -> Tuple[AsyncSandbox, str]:
+    """Return a running sandbox for a new project and its VNC password, preferring the warm pool."""
+    claimed = await claim_pooled_sandbox(project_id)
+    if claimed is not None:
+        return claimed
+    sandbox_pass = str(uuid.uuid4())
+    sandbox = await create_sandbox(sandbox_pass, project_id)
+    return sandbox, sandbox_pass
+
+
+async def _create_pooled_sandbox() -> None:
+    sandbox_pass = str(uuid.uuid4())
+    sandbox = await create_sandbox(sandbox_pass, auto_stop_interval=0)
+    await redis.rpush(POOL_KEY, json.dumps({
+        'id': sandbox.id,
+        'pass': sandbox_pass,
+        'created_at': time.time(),
+    }))
+    logger.info(f"Added sandbox {sandbox.id} to the warm pool")
+
+
+async def _prune_expired() -> None:
+    """Remove pool entries older than SANDBOX_POOL_MAX_AGE_SECONDS and delete their sandboxes.
+
+    Pooled sandboxes never auto-stop, so an entry nobody claims would otherwise run forever.
+    """
+    now = time.time()
+    for raw in await redis.lrange(POOL_KEY, 0, -1):
+        entry = json.loads(raw)
+        if now - entry['created_at'] <= SANDBOX_POOL_MAX_AGE_SECONDS:
+            continue
+        # Only the process that removed the entry deletes the sandbox (a claim may have popped it)
+        if await redis.lrem(POOL_KEY, 1, raw):
+            logger.info(f"Removing expired sandbox {entry['id']} from the warm pool")
+            await _discard(entry['id'])
+
+
+async def replenish_pool() -> None:
+    """Drop expired entries, then create sandboxes until the pool holds SANDBOX_POOL_SIZE (one replenisher at a time)."""
+    if SANDBOX_POOL_SIZE <= 0:
+        return
+    if not await redis.set(REPLENISH_LOCK_KEY, "1", ex=REPLENISH_LOCK_TTL_SECONDS, nx=True):
+        return
+    try:
+        await _prune_expired()
+        while True:
+            missing = SANDBOX_POOL_SIZE - await redis.llen(POOL_KEY)
+            if missing <= 0:
+                return
+            results = await asyncio.gather(
+                *[_create_pooled_sandbox() for _ in range(min(missing, SANDBOX_POOL_MAX_PARALLEL_CREATES))],
+                return_exceptions=True,
+            )
+            failures = [result for result in results if isinstance(result, Exception)]
+            for failure in failures:
+                logger.error(f"Failed to create pooled sandbox: {str(failure)}")
+            if len(failures) == len(results):
+                # Do not spin on a failing provider; the next claim retries
+                return
+    except Exception as e:
+        logger.error(f"Error replenishing sandbox warm pool: {str(e)}")
+    finally:
+        try:
+            await redis.delete(REPLENISH_LOCK_KEY)
+        except Exception:
+            pass
+
+
+def schedule_pool_replenish() -> None:
+    if SANDBOX_POOL_SIZE > 0:
+        _run_in_background(replenish_pool())
+
+
+async def _prestart(sandbox_id: str) -> None:
+    # get_or_start_sandbox takes the per-sandbox start lock, so a concurrent
+    # registry resolution in the worker waits for this start instead of racing it
+    try:
+        await get_or_start_sandbox(sandbox_id)
+    except Exception as e:
+        logger.warning(f"Pre-start of sandbox {sandbox_id} failed: {str(e)}")
+
+
+async def _prestart_project_sandbox(client, project_id: str) -> None:
+    try:
+        project = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+        sandbox_id = ((project.data[0].get('sandbox') or {}).get('id')) if project.data else None
+    except Exception as e:
+        logger.warning(f"Could not look up sandbox for pre-start of project {project_id}: {str(e)}")
+        return
+    if sandbox_id:
+        await _prestart(sandbox_id)
+
+
+def schedule_sandbox_prestart(client, project_id: str) -> None:
+    """Start the project's sandbox in the background if it has one (it may have auto-stopped)."""
+    if SANDBOX_PRESTART_ENABLED and project_id:
+        _run_in_background(_prestart_project_sandbox(client, project_id))
@@ -0,0 +1,182 @@
+"""
+Per-process registry of sandbox handles, shared by all sandbox tools.
+
+Every `SandboxToolsBase` tool used to resolve its sandbox on its first call:
+a `projects` lookup, `daytona.get` and a start check, repeated for each of the
+15+ tools of a run. The registry resolves a project's sandbox once per worker
+process and hands the same `AsyncSandbox` to every tool:
+
+- single-flight: concurrent callers for a project share one resolution
+  (including the lazy create for projects that have no sandbox yet)
+- handles older than SANDBOX_HANDLE_TTL_SECONDS are revalidated through
+  `get_or_start_sandbox`, which restarts sandboxes that auto-stopped
+- handles idle for SANDBOX_HANDLE_IDLE_SECONDS, or beyond
+  SANDBOX_REGISTRY_MAX_HANDLES, are evicted; `evict` drops a handle explicitly
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from daytona_sdk import AsyncSandbox
+
+from sandbox.sandbox import (
+    get_or_start_sandbox, create_sandbox, delete_sandbox, get_sandbox_preview_links, start_supervisord_session
+)
+from sandbox.pool import claim_pooled_sandbox
+from services.supabase import DBConnection
+from utils.logger import logger
+
+SANDBOX_HANDLE_TTL_SECONDS = int(os.getenv("SANDBOX_HANDLE_TTL_SECONDS", "60"))
+SANDBOX_HANDLE_IDLE_SECONDS = int(os.getenv("SANDBOX_HANDLE_IDLE_SECONDS", "1800"))
+SANDBOX_REGISTRY_MAX_HANDLES = int(os.getenv("SANDBOX_REGISTRY_MAX_HANDLES", "256"))
+
+
+@dataclass
+class SandboxHandle:
+    project_id: str
+    sandbox_id: str
+    sandbox_pass: Optional[str]
+    sandbox: AsyncSandbox
+    validated_at: float
+    last_used_at: float
+
+
+class SandboxRegistry:
+    def __init__(
+        self,
+        ttl_seconds: float = SANDBOX_HANDLE_TTL_SECONDS,
+        idle_seconds: float = SANDBOX_HANDLE_IDLE_SECONDS,
+        max_handles: int = SANDBOX_REGISTRY_MAX_HANDLES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.idle_seconds = idle_seconds
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[str, SandboxHandle]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def acquire(self, project_id: str, db: DBConnection) -> SandboxHandle:
+        """Return a ready sandbox handle for the project, resolving it at most once concurrently."""
+        now = time.monotonic()
+        handle = self._handles.get(project_id)
+        if handle is not None and now - handle.validated_at < self.ttl_seconds:
+            handle.last_used_at = now
+            self._handles.move_to_end(project_id)
+            return handle
+
+        task = self._inflight.get(project_id)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve(project_id, db, handle))
+            self._inflight[project_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(project_id, None))
+        # Shield so one cancelled caller does not abort the resolution the others wait on
+        return await asyncio.shield(task)
+
+    def evict(self, project_id: str) -> None:
+        self._handles.pop(project_id, None)
+
+    def evict_sandbox(self, sandbox_id: str) -> None:
+        for project_id, handle in list(self._handles.items()):
+            if handle.sandbox_id == sandbox_id:
+                self._handles.pop(project_id, None)
+
+    def _store(self, handle: SandboxHandle) -> SandboxHandle:
+        self._handles[handle.project_id] = handle
+        self._handles.move_to_end(handle.project_id)
+        now = time.monotonic()
+        for project_id, cached in list(self._handles.items()):
+            if now - cached.last_used_at > self.idle_seconds:
+                self._handles.pop(project_id, None)
+        while len(self._handles) > self.max_handles:
+            self._handles.popitem(last=False)
+        return handle
+
+    async def _resolve(self, project_id: str, db: DBConnection, stale: Optional[SandboxHandle]) -> SandboxHandle:
+        if stale is not None:
+            try:
+                sandbox = await get_or_start_sandbox(stale.sandbox_id)
+                now = time.monotonic()
+                return self._store(SandboxHandle(project_id, stale.sandbox_id, stale.sandbox_pass, sandbox, now, now))
+            except Exception as e:
+                # The sandbox may have been replaced or deleted; fall back to the project record
+                logger.warning(f"Revalidating sandbox {stale.sandbox_id} for project {project_id} failed: {str(e)}")
+                self.evict(project_id)
+
+        try:
+            client = await db.client
+
+            project = await client.table('projects').select('*').eq('project_id', project_id).execute()
+            if not project.data or len(project.data) == 0:
+                raise ValueError(f"Project {project_id} not found")
+
+            project_data = project.data[0]
+            sandbox_info = project_data.get('sandbox') or {}
+
+            # If there is no sandbox recorded for this project, create one lazily;
+            # the created handle is already running, so it is used as-is without a refetch
+            if not sandbox_info.get('id'):
+                sandbox, sandbox_id, sandbox_pass = await self._create_for_project(project_id, client)
+            else:
+                sandbox_id = sandbox_info['id']
+                sandbox_pass = sandbox_info.get('pass')
+                sandbox = await get_or_start_sandbox(sandbox_id)
+
+            now = time.monotonic()
+            return self._store(SandboxHandle(project_id, sandbox_id, sandbox_pass, sandbox, now, now))
+
+        except Exception as e:
+            logger.error(f"Error retrieving/creating sandbox for project {project_id}: {str(e)}", exc_info=True)
+            raise e
+
+    async def _create_for_project(self, project_id: str, client) -> tuple:
+        """Create (or claim from the warm pool) and record a sandbox; returns (sandbox, sandbox_id, sandbox_pass).
+
+        Supervisord startup runs concurrently with preview-link resolution and the project update.
+        """
+        logger.info(f"No sandbox recorded for project {project_id}; creating lazily")
+        claimed = await claim_pooled_sandbox(project_id)
+        if claimed is not None:
+            # Pooled sandboxes already run supervisord
+            sandbox_obj, sandbox_pass = claimed
+            start_services = None
+        else:
+            sandbox_pass = str(uuid.uuid4())
+            sandbox_obj = await create_sandbox(sandbox_pass, project_id, start_services=False)
+            start_services = start_supervisord_session(sandbox_obj)
+        sandbox_id = sandbox_obj.id
+
+        async def persist_metadata():
+            # Gather preview links and token (best-effort parsing)
+            try:
+                links = await get_sandbox_preview_links(sandbox_obj)
+            except Exception:
+                # If preview link extraction fails, still proceed but leave fields None
+                logger.warning(f"Failed to extract preview links for sandbox {sandbox_id}", exc_info=True)
+                links = {'vnc_preview': None, 'sandbox_url': None, 'token': None}
+
+            # Persist sandbox metadata to project record
+            update_result = await client.table('projects').update({
+                'sandbox': {'id': sandbox_id, 'pass': sandbox_pass, **links}
+            }).eq('project_id', project_id).execute()
+            if not update_result.data:
+                raise Exception("Database update failed when storing sandbox metadata")
+
+        steps = [persist_metadata()] + ([start_services] if start_services is not None else [])
+        results = await asyncio.gather(*steps, return_exceptions=True)
+        failure = next((result for result in results if isinstance(result, Exception)), None)
+        if failure is not None:
+            # Cleanup created sandbox if the DB update or service startup failed
+            try:
+                await delete_sandbox(sandbox_id)
+            except Exception:
+                logger.error(f"Failed to delete sandbox {sandbox_id} after setup failure", exc_info=True)
+            raise failure
+
+        return sandbox_obj, sandbox_id, sandbox_pass
+
+
+sandbox_registry = SandboxRegistry()
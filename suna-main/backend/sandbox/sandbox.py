@@ -1,8 +1,12 @@
+import asyncio
+import time
+
 from daytona_sdk import AsyncDaytona, DaytonaConfig, CreateSandboxFromSnapshotParams, AsyncSandbox, SessionExecuteRequest, Resources, SandboxState
 from dotenv import load_dotenv
 from utils.logger import logger
 from utils.config import config
 from utils.config import Configuration
+from services import redis
 
 load_dotenv()
 
@@ -30,29 +34,64 @@ else:
 
 daytona = AsyncDaytona(daytona_config)
 
+# Minutes of inactivity before a project's sandbox is stopped
+SANDBOX_AUTO_STOP_MINUTES = 15
+
+# Held (in Redis, across API and worker processes) by whoever starts a stopped sandbox,
+# from the start request until supervisord runs
+SANDBOX_START_LOCK_PREFIX = "sandbox_start_lock"
+SANDBOX_START_TIMEOUT_SECONDS = 120
+SANDBOX_START_POLL_SECONDS = 1.0
+# States of a sandbox that is already on its way to STARTED
+SANDBOX_STARTING_STATES = (SandboxState.STARTING, SandboxState.RESTORING)
+
+async def _wait_until_started(sandbox: AsyncSandbox, lock_key: str) -> None:
+    """Wait until a sandbox another caller is starting is STARTED and that caller released the start lock."""
+    deadline = time.monotonic() + SANDBOX_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if not await redis.get(lock_key):
+            await sandbox.refresh_data()
+            if sandbox.state == SandboxState.STARTED:
+                return
+            if sandbox.state not in SANDBOX_STARTING_STATES:
+                raise Exception(f"Sandbox {sandbox.id} did not start (state: {sandbox.state})")
+        await asyncio.sleep(SANDBOX_START_POLL_SECONDS)
+    raise TimeoutError(f"Sandbox {sandbox.id} did not start within {SANDBOX_START_TIMEOUT_SECONDS} seconds")
+
 async def get_or_start_sandbox(sandbox_id: str) -> AsyncSandbox:
-    """Retrieve a sandbox by ID, check its state, and start it if needed."""
+    """Retrieve a sandbox by ID, check its state, and start it if needed.
+
+    Only one caller starts a stopped sandbox (per-sandbox Redis lock); the others, and callers
+    that find it STARTING, wait until it is STARTED instead of returning an unready sandbox.
+    """
     
     logger.info(f"Getting or starting sandbox with ID: {sandbox_id}")
+    lock_key = f"{SANDBOX_START_LOCK_PREFIX}:{sandbox_id}"
 
     try:
         sandbox = await daytona.get(sandbox_id)
         
         # Check if sandbox needs to be started
         if sandbox.state == SandboxState.ARCHIVED or sandbox.state == SandboxState.STOPPED:
-            logger.info(f"Sandbox is in {sandbox.state} state. Starting...")
-            try:
-                await daytona.start(sandbox)
-                # Wait a moment for the sandbox to initialize
-                # sleep(5)
-                # Refresh sandbox state after starting
-                sandbox = await daytona.get(sandbox_id)
-                
-                # Start supervisord in a session when restarting
-                await start_supervisord_session(sandbox)
-            except Exception as e:
-                logger.error(f"Error starting sandbox: {e}")
-                raise e
+            if await redis.set(lock_key, "1", ex=SANDBOX_START_TIMEOUT_SECONDS, nx=True):
+                logger.info(f"Sandbox is in {sandbox.state} state. Starting...")
+                try:
+                    # start() waits for the started state and refreshes this handle, so no refetch is needed
+                    await daytona.start(sandbox)
+                    
+                    # Start supervisord in a session when restarting
+                    await start_supervisord_session(sandbox)
+                except Exception as e:
+                    logger.error(f"Error starting sandbox: {e}")
+                    raise e
+                finally:
+                    await redis.delete(lock_key)
+            else:
+                logger.info(f"Sandbox {sandbox_id} is being started elsewhere, waiting")
+                await _wait_until_started(sandbox, lock_key)
+        elif sandbox.state in SANDBOX_STARTING_STATES:
+            logger.info(f"Sandbox is in {sandbox.state} state, waiting until it is started")
+            await _wait_until_started(sandbox, lock_key)
         
         logger.info(f"Sandbox {sandbox_id} is ready")
         return sandbox
@@ -78,8 +117,18 @@ async def start_supervisord_session(sandbox: AsyncSandbox):
         logger.error(f"Error starting supervisord session: {str(e)}")
         raise e
 
-async def create_sandbox(password: str, project_id: str = None) -> AsyncSandbox:
-    """Create a new sandbox with all required services configured and running."""
+async def create_sandbox(
+    password: str,
+    project_id: str = None,
+    auto_stop_interval: int = SANDBOX_AUTO_STOP_MINUTES,
+    start_services: bool = True,
+) -> AsyncSandbox:
+    """Create a new sandbox with all required services configured and running.
+
+    Pass auto_stop_interval=0 to keep the sandbox running until it is claimed (warm pool).
+    With start_services=False the caller starts supervisord (start_supervisord_session),
+    e.g. concurrently with other setup steps.
+    """
     
     logger.debug("Creating new Daytona sandbox environment")
     logger.debug("Configuring sandbox with snapshot and environment variables")
@@ -111,7 +160,7 @@ async def create_sandbox(password: str, project_id: str = None) -> AsyncSandbox:
             memory=4,
             disk=5,
         ),
-        auto_stop_interval=15,
+        auto_stop_interval=auto_stop_interval,
         auto_archive_interval=2 * 60,
     )
     
@@ -120,11 +169,30 @@ async def create_sandbox(password: str, project_id: str = None) -> AsyncSandbox:
     logger.debug(f"Sandbox created with ID: {sandbox.id}")
     
     # Start supervisord in a session for new sandbox
-    await start_supervisord_session(sandbox)
+    if start_services:
+        await start_supervisord_session(sandbox)
     
     logger.debug(f"Sandbox environment successfully initialized")
     return sandbox
 
+async def get_sandbox_preview_links(sandbox: AsyncSandbox) -> dict:
+    """Resolve the VNC (6080) and website (8080) preview links concurrently.
+
+    Returns the `vnc_preview`, `sandbox_url` and `token` fields stored on the project record.
+    """
+    vnc_link, website_link = await asyncio.gather(
+        sandbox.get_preview_link(6080),
+        sandbox.get_preview_link(8080),
+    )
+    vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
+    website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
+    token = None
+    if hasattr(vnc_link, 'token'):
+        token = vnc_link.token
+    elif "token='" in str(vnc_link):
+        token = str(vnc_link).split("token='")[1].split("'")[0]
+    return {'vnc_preview': vnc_url, 'sandbox_url': website_url, 'token': token}
+
 async def delete_sandbox(sandbox_id: str) -> bool:
     """Delete a sandbox by its ID."""
     logger.info(f"Deleting sandbox with ID: {sandbox_id}")
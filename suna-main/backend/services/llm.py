@@ -17,8 +17,11 @@ import asyncio
 from openai import OpenAIError
 import litellm
 from litellm.files.main import ModelResponse
+from litellm.utils import token_counter
 from utils.logger import logger
 from utils.config import config
+from services import llm_rate_limiter
+from services import llm_cache
 
 # litellm.set_verbose=True
 # Let LiteLLM auto-adjust params and drop unsupported ones (e.g., GPT-5 temperature!=1)
@@ -98,13 +101,81 @@ def get_openrouter_fallback(model_name: str) -> Optional[str]:
     
     return None
 
-async def handle_error(error: Exception, attempt: int, max_attempts: int) -> None:
-    """Handle API errors with appropriate delays and logging."""
-    delay = RATE_LIMIT_DELAY if isinstance(error, litellm.exceptions.RateLimitError) else RETRY_DELAY
+async def handle_error(error: Exception, attempt: int, max_attempts: int, model_name: Optional[str] = None, api_key: Optional[str] = None) -> None:
+    """Handle API errors with appropriate delays and logging.
+
+    Rate limit errors honour the provider's retry-after hint and block the shared
+    rate limiter bucket, so other workers defer instead of hitting the same 429.
+    """
+    delay = RETRY_DELAY
+    if isinstance(error, litellm.exceptions.RateLimitError):
+        retry_after = llm_rate_limiter.get_retry_after(error)
+        delay = retry_after if retry_after is not None else RATE_LIMIT_DELAY
+        if model_name:
+            await llm_rate_limiter.penalize(model_name, delay, api_key=api_key)
     logger.warning(f"Error on attempt {attempt + 1}/{max_attempts}: {str(error)}")
     logger.debug(f"Waiting {delay} seconds before retry...")
     await asyncio.sleep(delay)
 
+def estimate_prompt_tokens(messages: List[Dict[str, Any]], model_name: str) -> int:
+    """Estimate prompt tokens for rate limiting, falling back to a character heuristic."""
+    try:
+        return token_counter(model=model_name, messages=messages)
+    except Exception:
+        return len(json.dumps(messages, default=str)) // 4
+
+def _set_cache_breakpoint(message: Dict[str, Any]) -> bool:
+    """Mark the last text block of a message as an Anthropic cache breakpoint."""
+    content = message.get("content")
+    if isinstance(content, str):
+        if not content:
+            return False
+        message["content"] = [
+            {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+        ]
+        return True
+    if isinstance(content, list):
+        for item in reversed(content):
+            if isinstance(item, dict) and item.get("type") == "text" and item.get("text"):
+                item["cache_control"] = {"type": "ephemeral"}
+                return True
+    return False
+
+def apply_anthropic_cache_layout(messages: List[Dict[str, Any]]) -> None:
+    """
+    Place Anthropic prompt cache breakpoints so the cached prefix survives across calls.
+
+    - A pinned breakpoint at the end of the system prompt. Anthropic renders tool
+      schemas before the system prompt, so this caches both.
+    - A rolling breakpoint at the last stable history message: the last persisted
+      message (one with a message_id) before any content that only exists for this
+      call, such as the temporary browser-state message or partial assistant output.
+      Each call writes the longer prefix and the next call reads it back.
+
+    Tool messages are skipped when choosing the rolling breakpoint, since not every
+    provider route accepts cache_control on tool results.
+    """
+    # Breakpoints left over from a previous call would count towards Anthropic's limit of 4
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict):
+                    item.pop("cache_control", None)
+
+    history_start = 0
+    if messages and isinstance(messages[0], dict) and messages[0].get("role") == "system":
+        _set_cache_breakpoint(messages[0])
+        history_start = 1
+
+    stable_end = history_start
+    while stable_end < len(messages) and isinstance(messages[stable_end], dict) and messages[stable_end].get("message_id"):
+        stable_end += 1
+
+    for message in reversed(messages[history_start:stable_end]):
+        if message.get("role") in ("user", "assistant") and _set_cache_breakpoint(message):
+            break
+
 def prepare_params(
     messages: List[Dict[str, Any]],
     model_name: str,
@@ -202,7 +273,6 @@ def prepare_params(
     #     }]
     #     logger.debug(f"Added OpenRouter fallback for model: {model_name} to {fallback_model}")
 
-    # Apply Anthropic prompt caching (minimal implementation)
     # Check model name *after* potential modifications (like adding bedrock/ prefix)
     effective_model_name = params.get("model", model_name) # Use model from params if set, else original
 
@@ -220,33 +290,8 @@ def prepare_params(
         params["extra_body"] = extra_body
     if "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
         messages = params["messages"] # Direct reference, modification affects params
-
-        # Ensure messages is a list
-        if not isinstance(messages, list):
-            return params # Return early if messages format is unexpected
-
-        # Apply cache control to the first 4 text blocks across all messages
-        cache_control_count = 0
-        max_cache_control_blocks = 3
-
-        for message in messages:
-            if cache_control_count >= max_cache_control_blocks:
-                break
-                
-            content = message.get("content")
-            
-            if isinstance(content, str):
-                message["content"] = [
-                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
-                cache_control_count += 1
-            elif isinstance(content, list):
-                for item in content:
-                    if cache_control_count >= max_cache_control_blocks:
-                        break
-                    if isinstance(item, dict) and item.get("type") == "text" and "cache_control" not in item:
-                        item["cache_control"] = {"type": "ephemeral"}
-                        cache_control_count += 1
+        if isinstance(messages, list):
+            apply_anthropic_cache_layout(messages)
 
     # Add reasoning_effort for Anthropic models if enabled
     use_thinking = enable_thinking if enable_thinking is not None else False
@@ -298,7 +343,8 @@ async def make_llm_api_call(
     top_p: Optional[float] = None,
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
-    reasoning_effort: Optional[str] = 'low'
+    reasoning_effort: Optional[str] = 'low',
+    cache_ttl: Optional[int] = None
 ) -> Union[Dict[str, Any], AsyncGenerator, ModelResponse]:
     """
     Make an API call to a language model using LiteLLM.
@@ -318,6 +364,7 @@ async def make_llm_api_call(
         model_id: Optional ARN for Bedrock inference profiles
         enable_thinking: Whether to enable thinking
         reasoning_effort: Level of reasoning effort
+        cache_ttl: Opt in to the response cache for this many seconds (non-streaming, temperature 0 only)
 
     Returns:
         Union[Dict[str, Any], AsyncGenerator]: API response or stream
@@ -345,20 +392,49 @@ async def make_llm_api_call(
         enable_thinking=enable_thinking,
         reasoning_effort=reasoning_effort
     )
+
+    cache_key = None
+    if cache_ttl and not stream and not temperature:
+        try:
+            cache_key = llm_cache.make_cache_key(params)
+            cached_response = await llm_cache.get(cache_key)
+            if cached_response:
+                logger.debug(f"LLM response cache hit for model {model_name}")
+                return ModelResponse(**cached_response)
+        except Exception as e:
+            logger.warning(f"LLM response cache unavailable, making uncached call: {str(e)}")
+            cache_key = None
+    elif cache_ttl and temperature:
+        logger.debug(f"Skipping LLM response cache for non-deterministic call (temperature={temperature})")
+
+    # Counting tokens walks the whole prompt, so only do it when the limiter will use the estimate
+    estimated_tokens = estimate_prompt_tokens(messages, model_name) if config.LLM_RATE_LIMITER_ENABLED else 0
     last_error = None
     for attempt in range(MAX_RETRIES):
         try:
             logger.debug(f"Attempt {attempt + 1}/{MAX_RETRIES}")
             # logger.debug(f"API request parameters: {json.dumps(params, indent=2)}")
 
+            # Defer the call until the shared provider bucket has room
+            await llm_rate_limiter.acquire(model_name, estimated_tokens, api_key=api_key)
+
             response = await litellm.acompletion(**params)
             logger.debug(f"Successfully received API response from {model_name}")
             # logger.debug(f"Response: {response}")
+
+            # Prompt tokens were reserved up front; streaming usage is charged by the ResponseProcessor
+            if not stream:
+                usage = getattr(response, 'usage', None)
+                completion_tokens = getattr(usage, 'completion_tokens', None) if usage else None
+                if completion_tokens:
+                    await llm_rate_limiter.record_usage(model_name, completion_tokens, api_key=api_key)
+            if cache_key:
+                await llm_cache.set_response(cache_key, response, cache_ttl)
             return response
 
         except (litellm.exceptions.RateLimitError, OpenAIError, json.JSONDecodeError) as e:
             last_error = e
-            await handle_error(e, attempt, MAX_RETRIES)
+            await handle_error(e, attempt, MAX_RETRIES, model_name=model_name, api_key=api_key)
 
         except Exception as e:
             logger.error(f"Unexpected error during API call: {str(e)}", exc_info=True)
@@ -0,0 +1,121 @@
+"""
+Content-addressed response cache for non-streaming LLM calls.
+
+Utility calls such as project naming send small, near-identical prompts over
+and over. Callers can opt in by passing `cache_ttl` to `make_llm_api_call`;
+the response is then stored in Redis under a hash of the model, the
+normalized messages and the sampling parameters, and identical requests are
+served from Redis instead of the provider. The streaming agent path never
+uses this cache.
+
+Only deterministic calls are cached: `make_llm_api_call` skips the cache when
+temperature > 0, since a cached response would freeze one random sample.
+
+Size is bounded two ways: oversized responses are not stored, and an index
+sorted by expiry time drops expired keys on every write and evicts the
+soonest-expiring entries beyond LLM_RESPONSE_CACHE_MAX_ENTRIES.
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+KEY_PREFIX = "llm_response_cache"
+INDEX_KEY = f"{KEY_PREFIX}:index"
+
+# Request parameters that change the response; everything else (API keys, headers, ...) is ignored
+_KEYED_PARAMS = (
+    "model", "temperature", "top_p", "max_tokens", "max_completion_tokens",
+    "response_format", "tools", "tool_choice", "reasoning_effort",
+)
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return " ".join(content.split())
+    if isinstance(content, list):
+        normalized = []
+        for item in content:
+            if isinstance(item, dict):
+                item = {k: v for k, v in item.items() if k != "cache_control"}
+                if isinstance(item.get("text"), str):
+                    item["text"] = " ".join(item["text"].split())
+            normalized.append(item)
+        # A single text block is equivalent to plain string content
+        if len(normalized) == 1 and isinstance(normalized[0], dict) and normalized[0].keys() == {"type", "text"}:
+            return normalized[0]["text"]
+        return normalized
+    return content
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "role": message.get("role"),
+            "content": _normalize_content(message.get("content")),
+            **({"tool_calls": message["tool_calls"]} if message.get("tool_calls") else {}),
+            **({"tool_call_id": message["tool_call_id"]} if message.get("tool_call_id") else {}),
+        }
+        for message in messages
+    ]
+
+
+def make_cache_key(params: Dict[str, Any]) -> str:
+    """Build the cache key for prepared LiteLLM params."""
+    payload = {name: params.get(name) for name in _KEYED_PARAMS if params.get(name) is not None}
+    payload["messages"] = _normalize_messages(params.get("messages") or [])
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+async def get(key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached response dict, or None on a miss or Redis error."""
+    try:
+        cached = await redis.get(key)
+    except Exception as e:
+        logger.debug(f"LLM response cache lookup failed: {str(e)}")
+        return None
+    if not cached:
+        return None
+    try:
+        return json.loads(cached)
+    except json.JSONDecodeError:
+        return None
+
+
+async def set_response(key: str, response: Any, ttl: int) -> None:
+    """Store a response, enforcing the entry size and entry count limits."""
+    try:
+        data = response.model_dump() if hasattr(response, "model_dump") else dict(response)
+        serialized = json.dumps(data, default=str)
+    except Exception as e:
+        logger.debug(f"LLM response is not cacheable: {str(e)}")
+        return
+
+    if len(serialized) > config.LLM_RESPONSE_CACHE_MAX_ENTRY_BYTES:
+        logger.debug(f"Skipping LLM response cache for {len(serialized)} byte response")
+        return
+
+    try:
+        now = time.time()
+        redis_client = await redis.get_client()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(key, serialized, ex=ttl)
+            # Scored by expiry, so keys Redis has already expired can be trimmed from the index
+            pipe.zadd(INDEX_KEY, {key: now + ttl})
+            pipe.zremrangebyscore(INDEX_KEY, "-inf", now)
+            pipe.zcard(INDEX_KEY)
+            results = await pipe.execute()
+
+        overflow = results[-1] - config.LLM_RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = await redis_client.zpopmin(INDEX_KEY, overflow)
+            if evicted:
+                await redis_client.delete(*[member for member, _ in evicted])
+    except Exception as e:
+        logger.debug(f"Failed to store LLM response in cache: {str(e)}")
@@ -0,0 +1,233 @@
+"""
+Shared, Redis-backed rate limiter for LLM provider calls.
+
+Every dramatiq worker thread calls the providers independently, so without
+coordination a burst of agent runs hits the provider limits together and all
+of them back off at once. This module keeps one token bucket per
+(provider, model, API key) in Redis that tracks both requests per minute and
+tokens per minute:
+
+- `acquire` reserves one request plus the estimated prompt tokens before a
+  call is sent, deferring the caller until the bucket has room.
+- `record_usage` charges the tokens reported in the provider's usage block
+  once the response is complete (completion tokens are unknown up front).
+- `penalize` applies a provider `retry-after` to the shared bucket so every
+  worker pauses, and drains it so traffic ramps back up instead of bursting.
+
+Redis errors never block an LLM call; the limiter fails open.
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+KEY_PREFIX = "llm_rate_limit"
+# Upper bound on a single sleep so a waiting call re-checks the bucket regularly
+MAX_SLEEP_SECONDS = 5.0
+# Buckets are refilled lazily, so idle keys can expire
+BUCKET_TTL_MS = 120_000
+
+# Refill both buckets for the elapsed time, then try to take the requested
+# cost. Returns 0 when admitted, otherwise the number of milliseconds to wait.
+# With force=1 the cost is always taken (used to charge actual usage).
+_TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local req_cost = tonumber(ARGV[4])
+local tok_cost = tonumber(ARGV[5])
+local force = tonumber(ARGV[6])
+
+local state = redis.call('HMGET', key, 'req', 'tok', 'ts', 'blocked_until')
+local req = tonumber(state[1]) or rpm
+local tok = tonumber(state[2]) or tpm
+local ts = tonumber(state[3]) or now
+local blocked_until = tonumber(state[4]) or 0
+
+local elapsed = math.max(0, now - ts)
+req = math.min(rpm, req + elapsed * rpm / 60000)
+tok = math.min(tpm, tok + elapsed * tpm / 60000)
+
+local wait = 0
+if force == 0 then
+    if blocked_until > now then
+        wait = blocked_until - now
+    else
+        -- A single request larger than the whole budget must still go through eventually
+        tok_cost = math.min(tok_cost, tpm)
+        if req < req_cost then
+            wait = math.ceil((req_cost - req) * 60000 / rpm)
+        end
+        if tok < tok_cost then
+            wait = math.max(wait, math.ceil((tok_cost - tok) * 60000 / tpm))
+        end
+    end
+end
+
+if wait == 0 then
+    req = req - req_cost
+    tok = tok - tok_cost
+end
+
+redis.call('HSET', key, 'req', req, 'tok', tok, 'ts', now)
+redis.call('PEXPIRE', key, math.max(tonumber(ARGV[7]), blocked_until - now))
+return wait
+"""
+
+_PENALIZE_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local blocked_until = tonumber(ARGV[2])
+local current = tonumber(redis.call('HGET', key, 'blocked_until')) or 0
+if blocked_until > current then
+    redis.call('HSET', key, 'blocked_until', blocked_until)
+end
+redis.call('HSET', key, 'tok', 0, 'req', 0, 'ts', now)
+redis.call('PEXPIRE', key, math.max(tonumber(ARGV[3]), blocked_until - now))
+return 1
+"""
+
+_PROVIDER_API_KEY_NAMES = {
+    'anthropic': 'ANTHROPIC_API_KEY',
+    'openai': 'OPENAI_API_KEY',
+    'groq': 'GROQ_API_KEY',
+    'openrouter': 'OPENROUTER_API_KEY',
+    'xai': 'XAI_API_KEY',
+    'gemini': 'GEMINI_API_KEY',
+}
+
+
+def get_provider(model_name: str) -> str:
+    """Derive the provider from a LiteLLM model name."""
+    if "/" in model_name:
+        return model_name.split("/", 1)[0].lower()
+    lowered = model_name.lower()
+    if "claude" in lowered:
+        return "anthropic"
+    if "gemini" in lowered:
+        return "gemini"
+    if "grok" in lowered:
+        return "xai"
+    return "openai"
+
+
+def get_limits(provider: str) -> Tuple[int, int]:
+    """Return the (requests per minute, tokens per minute) ceiling for a provider."""
+    limits = config.LLM_RATE_LIMITS.get(provider) or config.LLM_RATE_LIMITS['default']
+    return max(1, int(limits['rpm'])), max(1, int(limits['tpm']))
+
+
+def _bucket_key(model_name: str, api_key: Optional[str]) -> str:
+    provider = get_provider(model_name)
+    if not api_key:
+        key_name = _PROVIDER_API_KEY_NAMES.get(provider)
+        api_key = getattr(config, key_name, None) if key_name else None
+    key_id = hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else "default"
+    return f"{KEY_PREFIX}:{provider}:{model_name}:{key_id}"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+async def _run_bucket_script(model_name: str, api_key: Optional[str], req_cost: int, tok_cost: int, force: bool) -> int:
+    rpm, tpm = get_limits(get_provider(model_name))
+    redis_client = await redis.get_client()
+    script = redis_client.register_script(_TOKEN_BUCKET_SCRIPT)
+    wait_ms = await script(
+        keys=[_bucket_key(model_name, api_key)],
+        args=[_now_ms(), rpm, tpm, req_cost, max(0, int(tok_cost)), int(force), BUCKET_TTL_MS],
+    )
+    return int(wait_ms)
+
+
+async def acquire(model_name: str, estimated_tokens: int = 0, api_key: Optional[str] = None) -> float:
+    """
+    Wait until the shared bucket admits one request of `estimated_tokens`.
+
+    Returns the number of seconds the call was deferred. After
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS the call is let through regardless, so a
+    misconfigured limit can slow requests down but never stall them.
+    """
+    if not config.LLM_RATE_LIMITER_ENABLED:
+        return 0.0
+
+    started = time.monotonic()
+    deadline = started + config.LLM_RATE_LIMIT_MAX_WAIT_SECONDS
+    while True:
+        try:
+            wait_ms = await _run_bucket_script(model_name, api_key, 1, estimated_tokens, force=False)
+        except Exception as e:
+            logger.warning(f"LLM rate limiter unavailable, sending call unthrottled: {str(e)}")
+            return time.monotonic() - started
+
+        waited = time.monotonic() - started
+        if wait_ms <= 0:
+            if waited > 0.5:
+                logger.info(f"LLM call to {model_name} deferred {waited:.2f}s by rate limiter")
+            return waited
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.warning(f"LLM rate limiter wait for {model_name} exceeded {config.LLM_RATE_LIMIT_MAX_WAIT_SECONDS}s, sending call anyway")
+            return waited
+
+        # Jitter keeps waiting workers from re-checking the bucket in lockstep
+        sleep_for = min(wait_ms / 1000, MAX_SLEEP_SECONDS, remaining) * random.uniform(1.0, 1.2)
+        logger.debug(f"LLM rate limit reached for {model_name}, deferring call {sleep_for:.2f}s")
+        await asyncio.sleep(sleep_for)
+
+
+async def record_usage(model_name: str, tokens: int, api_key: Optional[str] = None) -> None:
+    """Charge tokens that were not reserved up front (e.g. completion tokens) to the bucket."""
+    if not config.LLM_RATE_LIMITER_ENABLED or tokens <= 0:
+        return
+    try:
+        await _run_bucket_script(model_name, api_key, 0, tokens, force=True)
+    except Exception as e:
+        logger.debug(f"Failed to record LLM usage for rate limiting: {str(e)}")
+
+
+async def penalize(model_name: str, retry_after: float, api_key: Optional[str] = None) -> None:
+    """Block the shared bucket for `retry_after` seconds after a provider 429."""
+    if not config.LLM_RATE_LIMITER_ENABLED:
+        return
+    try:
+        now = _now_ms()
+        redis_client = await redis.get_client()
+        script = redis_client.register_script(_PENALIZE_SCRIPT)
+        await script(
+            keys=[_bucket_key(model_name, api_key)],
+            args=[now, now + int(retry_after * 1000), BUCKET_TTL_MS],
+        )
+        logger.info(f"LLM rate limit bucket for {model_name} blocked for {retry_after:.1f}s")
+    except Exception as e:
+        logger.debug(f"Failed to apply LLM rate limit penalty: {str(e)}")
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Extract the provider's retry-after hint (in seconds) from a LiteLLM/OpenAI error."""
+    headers: Dict[str, Any] = {}
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "headers", None):
+        headers.update({k.lower(): v for k, v in response.headers.items()})
+    litellm_headers = getattr(error, "litellm_response_headers", None)
+    if litellm_headers:
+        headers.update({k.lower(): v for k, v in dict(litellm_headers).items()})
+
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # retry-after may also be an HTTP date; fall back to the default delay
+        pass
+    return None
@@ -166,6 +166,24 @@ async def lrange(key: str, start: int, end: int) -> List[str]:
     return await redis_client.lrange(key, start, end)
 
 
+async def lpop(key: str):
+    """Remove and return the first element of a list (None if empty)."""
+    redis_client = await get_client()
+    return await redis_client.lpop(key)
+
+
+async def lrem(key: str, count: int, value: str) -> int:
+    """Remove up to `count` occurrences of a value from a list; returns how many were removed."""
+    redis_client = await get_client()
+    return await redis_client.lrem(key, count, value)
+
+
+async def llen(key: str) -> int:
+    """Get the length of a list."""
+    redis_client = await get_client()
+    return await redis_client.llen(key)
+
+
 # Key management
 
 
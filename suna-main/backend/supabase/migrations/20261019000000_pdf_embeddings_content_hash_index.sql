@@ -0,0 +1,5 @@
+-- Index for the PDF embedding cache lookup in pdf_documents/ollama_embeddings.py
+-- (metadata->>embedding_model = ... AND metadata->>content_hash IN (...)).
+-- Without it every lookup batch scans the whole pdf_embeddings table.
+create index if not exists idx_pdf_embeddings_model_content_hash
+    on public.pdf_embeddings ((metadata->>'embedding_model'), (metadata->>'content_hash'));
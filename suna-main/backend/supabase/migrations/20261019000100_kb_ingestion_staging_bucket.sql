@@ -0,0 +1,5 @@
+-- Private bucket holding knowledge-base uploads until the ingestion worker has read them
+-- (knowledge_base/ingestion.py). Objects are named by processing job id and deleted when the job ends.
+insert into storage.buckets (id, name, public, file_size_limit)
+values ('kb-ingestion-staging', 'kb-ingestion-staging', false, 52428800)
+on conflict (id) do nothing;
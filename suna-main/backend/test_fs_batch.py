@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for batched sandbox filesystem writes.
+
+The write plan script is run with the local /bin/sh against a temporary
+directory, the same way SandboxFS.write_many runs it inside the sandbox.
+"""
+
+import os
+import stat
+import subprocess
+import sys
+import uuid
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sandbox.fs_batch import (
+    SandboxFSConflict,
+    WRITE_MODE_ANY,
+    WRITE_MODE_CREATE,
+    WRITE_MODE_OVERWRITE,
+    _build_tar,
+    _extract_tar,
+    _write_plan_script,
+)
+
+
+def _apply(tmp_path, files, permissions=None, mode=WRITE_MODE_ANY):
+    """Run a write plan for {path: bytes}; returns (exit code, output)."""
+    targets = list(files)
+    token = uuid.uuid4().hex
+    archive_path = str(tmp_path / f"upload_{token}.tar")
+    with open(archive_path, "wb") as f:
+        f.write(_build_tar([files[target] for target in targets]))
+    script = "\n".join(_write_plan_script(targets, archive_path, token, permissions, mode))
+    completed = subprocess.run(["/bin/sh", "-c", script], capture_output=True, text=True, timeout=30)
+    assert not os.path.exists(archive_path)
+    assert not os.path.exists(f"/tmp/suna_fs_stage_{token}")
+    return completed.returncode, completed.stdout
+
+
+def test_tar_round_trip():
+    contents = [b"hello", b"", bytes(range(256)) * 100]
+    assert _extract_tar(_build_tar(contents)) == {"/0": contents[0], "/1": b"", "/2": contents[2]}
+    assert _extract_tar(_build_tar([])) == {}
+
+
+def test_write_creates_files_and_parent_dirs(tmp_path):
+    existing = tmp_path / "existing.txt"
+    existing.write_bytes(b"old")
+    os.chmod(existing, 0o600)
+    new = tmp_path / "new dir" / "nested" / "it's new.txt"
+
+    code, _ = _apply(tmp_path, {str(existing): b"updated", str(new): b"created"})
+
+    assert code == 0
+    assert existing.read_bytes() == b"updated"
+    assert new.read_bytes() == b"created"
+    # Overwritten files keep their mode, new files get 644
+    assert stat.S_IMODE(existing.stat().st_mode) == 0o600
+    assert stat.S_IMODE(new.stat().st_mode) == 0o644
+
+
+def test_write_applies_permissions(tmp_path):
+    target = tmp_path / "script.sh"
+    code, _ = _apply(tmp_path, {str(target): b"#!/bin/sh\n"}, permissions="755")
+    assert code == 0
+    assert stat.S_IMODE(target.stat().st_mode) == 0o755
+
+
+def test_create_mode_conflict_touches_nothing(tmp_path):
+    existing = tmp_path / "a.txt"
+    existing.write_bytes(b"keep")
+    new = tmp_path / "sub" / "b.txt"
+
+    code, output = _apply(tmp_path, {str(new): b"new", str(existing): b"replace"}, mode=WRITE_MODE_CREATE)
+
+    assert code == 3
+    assert f"__EXISTS__{existing}" in output
+    assert existing.read_bytes() == b"keep"
+    assert not (tmp_path / "sub").exists()
+
+
+def test_overwrite_mode_reports_missing_files(tmp_path):
+    existing = tmp_path / "a.txt"
+    existing.write_bytes(b"keep")
+    missing = tmp_path / "missing.txt"
+
+    code, output = _apply(tmp_path, {str(existing): b"replace", str(missing): b"new"}, mode=WRITE_MODE_OVERWRITE)
+
+    assert code == 3
+    assert f"__MISSING__{missing}" in output
+    assert existing.read_bytes() == b"keep"
+    assert not missing.exists()
+
+
+def test_failed_rename_rolls_back(tmp_path):
+    replaced = tmp_path / "a.txt"
+    replaced.write_bytes(b"original")
+    created = tmp_path / "new" / "b.txt"
+    # A regular file where a parent directory is needed makes the last target fail
+    (tmp_path / "blocker").write_bytes(b"")
+    unreachable = tmp_path / "blocker" / "c.txt"
+
+    code, _ = _apply(tmp_path, {str(replaced): b"changed", str(created): b"new", str(unreachable): b"x"})
+
+    assert code == 4
+    assert replaced.read_bytes() == b"original"
+    assert not created.exists()
+    assert not (tmp_path / "new").exists()
+
+
+def test_conflict_exception_message():
+    error = SandboxFSConflict(WRITE_MODE_CREATE, ["/workspace/a.txt"])
+    assert error.paths == ["/workspace/a.txt"]
+    assert "already exist" in str(error)
+    assert "do not exist" in str(SandboxFSConflict(WRITE_MODE_OVERWRITE, ["/workspace/b.txt"]))
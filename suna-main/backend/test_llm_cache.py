@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM response cache key.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.llm_cache import KEY_PREFIX, make_cache_key
+
+
+def _params(content, **overrides):
+    params = {
+        "model": "anthropic/claude-sonnet-4-20250514",
+        "temperature": 0,
+        "messages": [
+            {"role": "system", "content": "You name projects."},
+            {"role": "user", "content": content},
+        ],
+    }
+    params.update(overrides)
+    return params
+
+
+def test_key_format():
+    key = make_cache_key(_params("hello"))
+    assert key.startswith(f"{KEY_PREFIX}:")
+    assert len(key.split(":", 1)[1]) == 64
+    assert make_cache_key(_params("hello")) == key
+
+
+def test_single_text_block_matches_plain_string():
+    plain = make_cache_key(_params("Name this project"))
+    block = make_cache_key(_params([{"type": "text", "text": "Name this project"}]))
+    cached_block = make_cache_key(_params([
+        {"type": "text", "text": "Name   this\nproject", "cache_control": {"type": "ephemeral"}}
+    ]))
+    assert plain == block == cached_block
+
+
+def test_other_content_is_not_collapsed():
+    plain = make_cache_key(_params("Name this project"))
+    two_blocks = make_cache_key(_params([
+        {"type": "text", "text": "Name this"}, {"type": "text", "text": "project"}
+    ]))
+    image = make_cache_key(_params([{"type": "image_url", "image_url": {"url": "https://example.com/a.png"}}]))
+    assert len({plain, two_blocks, image}) == 3
+
+
+def test_whitespace_and_unkeyed_params_are_ignored():
+    base = make_cache_key(_params("Name this project"))
+    assert make_cache_key(_params("  Name this\n\tproject ")) == base
+    assert make_cache_key(_params("Name this project", api_key="sk-1", extra_headers={"x": "1"})) == base
+
+
+def test_keyed_params_change_the_key():
+    base = make_cache_key(_params("Name this project"))
+    assert make_cache_key(_params("Name this project", temperature=0.7)) != base
+    assert make_cache_key(_params("Name this project", model="openai/gpt-5-mini")) != base
+    assert make_cache_key(_params("Name this project", max_tokens=100)) != base
+    assert make_cache_key(_params("Name this other project")) != base
+
+    tool_call = {"id": "call_1", "type": "function", "function": {"name": "f", "arguments": "{}"}}
+    with_tool_calls = _params("Name this project")
+    with_tool_calls["messages"].append({"role": "assistant", "content": "", "tool_calls": [tool_call]})
+    assert make_cache_key(with_tool_calls) != base
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the PDF BM25 inverted index.
+
+PdfBm25Index replaced the per-query Python BM25 loop; these tests check it
+against a reference scorer, including department statistics, incremental
+document updates and reloading the saved index.
+"""
+
+import math
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_documents.bm25_index import BM25_B, BM25_K1, PdfBm25Index, tokenize
+
+TEXTS = [
+    "연차 휴가 신청 절차 안내",
+    "휴가 규정 및 연차 사용 기준",
+    "출장비 정산 절차와 영수증 제출",
+    "security policy for remote access",
+    "remote work policy and vacation policy",
+    "법인카드 사용 규정 안내 안내",
+    "vacation request workflow for remote staff",
+    "영수증 분실 시 출장비 처리",
+]
+DEPARTMENTS = ["인사팀", "인사팀", "재무팀", "보안팀", "인사팀", "재무팀", "인사팀", "재무팀"]
+
+
+def _rows(dimension=8, seed=7):
+    rng = np.random.default_rng(seed)
+    return [{
+        'document_id': f"doc-{index // 2}",
+        'chunk_index': index % 2,
+        'chunk_text': text,
+        'embedding': rng.normal(size=dimension).tolist(),
+        'metadata': {'page': index},
+        'document_title': f"문서 {index // 2}",
+        'department': DEPARTMENTS[index],
+    } for index, text in enumerate(TEXTS)]
+
+
+def _reference_bm25_search(rows, query, match_count, department=None):
+    docs = [row for row in rows if not department or row['department'] == department]
+    tokenized = [tokenize(row['chunk_text'].lower()) for row in docs]
+    avg_length = sum(len(tokens) for tokens in tokenized) / len(tokenized)
+    doc_freq = Counter(term for tokens in tokenized for term in set(tokens))
+
+    scored = []
+    for row, tokens in zip(docs, tokenized):
+        counts = Counter(tokens)
+        score = 0.0
+        for term in tokenize(query.lower()):
+            if term not in counts:
+                continue
+            idf = math.log((len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            tf = counts[term]
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / avg_length))
+        if score > 0:
+            scored.append((round(score, 4), row['chunk_text']))
+    scored.sort(key=lambda item: -item[0])
+    return scored[:match_count]
+
+
+def test_bm25_index_matches_reference(tmp_path):
+    rows = _rows()
+    index = PdfBm25Index(index_dir=str(tmp_path))
+    index.build(rows)
+
+    compared = 0
+    for query in ("연차 휴가", "remote policy", "출장비 영수증", "안내 안내", "없는단어"):
+        for department in (None, "인사팀", "재무팀"):
+            results = index.search(query, 5, department)
+            expected = _reference_bm25_search(rows, query, 5, department)
+            assert [(r['bm25_score'], r['chunk_text']) for r in results] == expected
+            compared += len(expected)
+    assert compared > 0
+
+
+def test_bm25_index_incremental_updates_and_reload_match_rebuild(tmp_path):
+    rows = _rows()
+    index = PdfBm25Index(index_dir=str(tmp_path / "incremental"))
+    index.build(rows)
+
+    index.add_document("doc-1", [{'chunk_text': "휴가 신청 remote policy"}], "문서 1", "인사팀")
+    index.remove_document("doc-2")
+
+    expected_rows = [row for row in rows if row['document_id'] not in ("doc-1", "doc-2")]
+    expected_rows.append({'document_id': "doc-1", 'chunk_text': "휴가 신청 remote policy",
+                          'document_title': "문서 1", 'department': "인사팀"})
+    rebuilt = PdfBm25Index(index_dir=str(tmp_path / "rebuilt"))
+    rebuilt.build(expected_rows)
+
+    index.save()
+    reloaded = PdfBm25Index(index_dir=str(tmp_path / "incremental"))
+    assert reloaded._load_from_disk()
+
+    for query in ("휴가 신청", "remote policy", "법인카드"):
+        for department in (None, "인사팀"):
+            expected = rebuilt.search(query, 5, department)
+            assert index.search(query, 5, department) == expected
+            assert reloaded.search(query, 5, department) == expected
+
+
+def test_bm25_index_skipped_corpus_version_forces_reload(tmp_path):
+    rows = _rows()
+    index = PdfBm25Index(index_dir=str(tmp_path))
+    index.build(rows, corpus_version=4)
+
+    index.add_document("doc-9", [{'chunk_text': "신규 문서"}], "문서 9", "인사팀", corpus_version=5)
+    assert not index.needs_reload(5)
+
+    # Version 6 was made by another process; this index is missing it and must not be saved
+    index.add_document("doc-10", [{'chunk_text': "다른 문서"}], "문서 10", "인사팀", corpus_version=7)
+    assert index.needs_reload(7)
+    index.save()
+    assert not os.path.exists(tmp_path / "CURRENT")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the in-memory PDF vector index.
+
+PdfVectorIndex replaced the per-query Python cosine loop; these tests check it
+against a brute-force scorer, including the department filter and incremental
+document updates.
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_documents.vector_index import PdfVectorIndex
+
+TEXTS = [
+    "연차 휴가 신청 절차 안내",
+    "휴가 규정 및 연차 사용 기준",
+    "출장비 정산 절차와 영수증 제출",
+    "security policy for remote access",
+    "remote work policy and vacation policy",
+    "법인카드 사용 규정 안내 안내",
+    "vacation request workflow for remote staff",
+    "영수증 분실 시 출장비 처리",
+]
+DEPARTMENTS = ["인사팀", "인사팀", "재무팀", "보안팀", "인사팀", "재무팀", "인사팀", "재무팀"]
+
+
+def _rows(dimension=8, seed=7):
+    rng = np.random.default_rng(seed)
+    return [{
+        'document_id': f"doc-{index // 2}",
+        'chunk_index': index % 2,
+        'chunk_text': text,
+        'embedding': rng.normal(size=dimension).tolist(),
+        'metadata': {'page': index},
+        'document_title': f"문서 {index // 2}",
+        'department': DEPARTMENTS[index],
+    } for index, text in enumerate(TEXTS)]
+
+
+def _reference_vector_search(rows, query, match_count, department=None, min_similarity=0.2):
+    query = np.asarray(query, dtype=np.float64)
+    scored = []
+    for row in rows:
+        if department and row['department'] != department:
+            continue
+        embedding = np.asarray(row['embedding'], dtype=np.float64)
+        similarity = float(embedding @ query / (np.linalg.norm(embedding) * np.linalg.norm(query)))
+        if similarity > min_similarity:
+            scored.append((similarity, row['chunk_text']))
+    scored.sort(key=lambda item: -item[0])
+    return scored[:match_count]
+
+
+def test_vector_index_matches_brute_force():
+    rows = _rows()
+    index = PdfVectorIndex()
+    index.build(rows)
+    rng = np.random.default_rng(1)
+
+    for _ in range(20):
+        query = rng.normal(size=8).tolist()
+        for department in (None, "인사팀", "재무팀"):
+            results = index.search(query, 3, department, min_similarity=-1.0)
+            expected = _reference_vector_search(rows, query, 3, department, min_similarity=-1.0)
+            assert [r['chunk_text'] for r in results] == [text for _, text in expected]
+            for result, (similarity, _) in zip(results, expected):
+                assert math.isclose(result['similarity'], similarity, abs_tol=1e-3)
+                assert department is None or result['department'] == department
+
+
+def test_vector_index_min_similarity_and_dimension_mismatch():
+    rows = _rows()
+    index = PdfVectorIndex()
+    index.build(rows)
+    query = rows[0]['embedding']
+
+    results = index.search(query, len(rows), min_similarity=0.2)
+    expected = _reference_vector_search(rows, query, len(rows), min_similarity=0.2)
+    assert [r['chunk_text'] for r in results] == [text for _, text in expected]
+    assert results[0]['chunk_text'] == rows[0]['chunk_text']
+    assert index.search([1.0, 0.0], 3) == []
+    assert index.search([0.0] * 8, 3) == []
+
+
+def test_vector_index_incremental_updates_match_rebuild():
+    rows = _rows()
+    index = PdfVectorIndex()
+    index.build(rows)
+    # Fill the department cache so the update has to invalidate it
+    index.search(rows[0]['embedding'], 3, "인사팀")
+
+    replacement = [{'chunk_index': 0, 'chunk_text': "재택 근무 신청", 'embedding': rows[0]['embedding']}]
+    index.add_document("doc-1", replacement, "문서 1", "인사팀")
+    index.remove_document("doc-3")
+
+    expected_rows = [row for row in rows if row['document_id'] not in ("doc-1", "doc-3")]
+    expected_rows.append({**replacement[0], 'document_id': "doc-1", 'metadata': {},
+                          'document_title': "문서 1", 'department': "인사팀"})
+    rebuilt = PdfVectorIndex()
+    rebuilt.build(expected_rows)
+
+    assert len(index) == len(expected_rows)
+    for department in (None, "인사팀"):
+        query = rows[0]['embedding']
+        assert index.search(query, 5, department, -1.0) == rebuilt.search(query, 5, department, -1.0)
+
+
+def test_vector_index_skipped_corpus_version_forces_reload():
+    rows = _rows()
+    index = PdfVectorIndex()
+    index.build(rows, corpus_version=4)
+
+    index.remove_document("doc-0", corpus_version=5)
+    assert not index.needs_reload(5)
+    assert len(index) == len(rows) - 2
+
+    # Version 6 was made by another process; the index must be reloaded before it is used again
+    index.remove_document("doc-1", corpus_version=7)
+    assert index.needs_reload(7)
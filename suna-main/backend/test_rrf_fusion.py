@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for Reciprocal Rank Fusion in PDF hybrid search and knowledge base retrieval.
+"""
+
+import math
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_documents.search_service import reciprocal_rank_fusion, rrf_scores
+
+
+def _result(document_id, chunk_text, similarity):
+    return {'document_id': document_id, 'chunk_text': chunk_text, 'similarity': similarity}
+
+
+def test_reciprocal_rank_fusion_scores_and_order():
+    rankings = {
+        'vector': [_result('a', 'x', 0.9), _result('b', 'y', 0.8), _result('c', 'z', 0.7)],
+        'bm25': [_result('c', 'z', 0.5), _result('a', 'x', 0.4)],
+    }
+    fused = reciprocal_rank_fusion(rankings, rrf_k=60)
+
+    assert [entry['document_id'] for entry in fused] == ['a', 'c', 'b']
+    a, c, b = fused
+    assert math.isclose(a['final_score'], round(1 / 61 + 1 / 62, 6))
+    assert math.isclose(c['final_score'], round(1 / 63 + 1 / 61, 6))
+    assert math.isclose(b['final_score'], round(1 / 62, 6))
+    assert a['search_type'] == 'hybrid' and b['search_type'] == 'vector'
+    assert (a['vector_rank'], a['bm25_rank']) == (1, 2)
+    assert a['similarity'] == 0.9 and c['similarity'] == 0.7
+    assert 'bm25_rank' not in b
+
+
+def test_reciprocal_rank_fusion_weights_and_duplicates():
+    rankings = {
+        'vector': [_result('a', 'x', 0.9), _result('b', 'y', 0.8)],
+        'bm25': [_result('b', 'y', 0.3), _result('b', 'y', 0.2), _result('a', 'x', 0.1)],
+    }
+    fused = reciprocal_rank_fusion(rankings, weights={'bm25': 2.0}, rrf_k=10)
+
+    by_id = {entry['document_id']: entry for entry in fused}
+    # A chunk repeated by one retriever only counts at its best rank
+    assert by_id['b']['bm25_rank'] == 1
+    assert math.isclose(by_id['b']['final_score'], round(1 / 12 + 2 / 11, 6))
+    assert math.isclose(by_id['a']['final_score'], round(1 / 11 + 2 / 13, 6))
+    assert fused[0]['document_id'] == 'b'
+    assert reciprocal_rank_fusion({}) == []
+
+
+def test_rrf_scores_on_plain_keys():
+    assert rrf_scores([]) == {}
+    scores = rrf_scores([[0, 1, 2], [4, 1, 0]], rrf_k=60)
+    # Row 1, second in both rankings, outranks row 4, which tops only one of them
+    assert sorted(scores, key=lambda row: scores[row], reverse=True) == [0, 1, 4, 2]
+    assert math.isclose(scores[1], 2 / 62)
+    # Keys are returned in first-seen order and a repeated key counts at its best rank
+    weighted = rrf_scores([[3, 3, 1]], weights=[2.0], rrf_k=10)
+    assert list(weighted) == [3, 1]
+    assert math.isclose(weighted[3], 2 / 11) and math.isclose(weighted[1], 2 / 13)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests for parsing the markers SandboxShellTool reads back from tmux sessions.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent.tools.sb_shell_tool import SandboxShellTool
+
+
+def test_split_cursor_header():
+    cursor, output = SandboxShellTool._split_cursor_header("__CURSOR__10:25:15\nline 1\nline 2\n")
+    assert cursor == {"start": 10, "end": 25, "new_bytes": 15}
+    assert output == "line 1\nline 2\n"
+
+    cursor, output = SandboxShellTool._split_cursor_header("__CURSOR__0:0:0\n")
+    assert cursor == {"start": 0, "end": 0, "new_bytes": 0}
+    assert output == ""
+
+
+def test_split_cursor_header_missing_or_malformed():
+    assert SandboxShellTool._split_cursor_header("plain output") == (None, "plain output")
+    malformed = "__CURSOR__abc:1\nline"
+    assert SandboxShellTool._split_cursor_header(malformed) == (None, malformed)
+
+
+def test_split_exit_status():
+    assert SandboxShellTool._split_exit_status("__EXIT__0\nbuild ok\n") == (0, "build ok\n")
+    assert SandboxShellTool._split_exit_status("__EXIT__127\n") == (127, "")
+    assert SandboxShellTool._split_exit_status("__EXIT__-1\nkilled") == (-1, "killed")
+    # Timed out or session ended: the marker line has no status
+    assert SandboxShellTool._split_exit_status("__EXIT__\npartial") == (None, "partial")
+    assert SandboxShellTool._split_exit_status("no marker") == (None, "no marker")
+
+
+def test_parse_offset():
+    assert SandboxShellTool._parse_offset("1234\n") == 1234
+    assert SandboxShellTool._parse_offset("noise\n42\n  \n") == 42
+    assert SandboxShellTool._parse_offset("12\nnot a number\n7\ntrailing text") == 7
+    assert SandboxShellTool._parse_offset("") == 0
+    assert SandboxShellTool._parse_offset("error: no such file") == 0
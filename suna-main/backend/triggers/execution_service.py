@@ -129,25 +129,22 @@ class SessionManager:
         client = await self._db.client
         
         try:
-            from sandbox.sandbox import create_sandbox, delete_sandbox
+            from sandbox.sandbox import delete_sandbox, get_sandbox_preview_links
+            from sandbox.pool import create_or_claim_sandbox
             
-            sandbox_pass = str(uuid.uuid4())
-            sandbox = await create_sandbox(sandbox_pass, project_id)
+            sandbox, sandbox_pass = await create_or_claim_sandbox(project_id)
             sandbox_id = sandbox.id
             
-            vnc_link = await sandbox.get_preview_link(6080)
-            website_link = await sandbox.get_preview_link(8080)
-            vnc_url = self._extract_url(vnc_link)
-            website_url = self._extract_url(website_link)
-            token = self._extract_token(vnc_link)
+            # Preview links (resolved concurrently)
+            links = await get_sandbox_preview_links(sandbox)
             
             update_result = await client.table('projects').update({
                 'sandbox': {
                     'id': sandbox_id,
                     'pass': sandbox_pass,
-                    'vnc_preview': vnc_url,
-                    'sandbox_url': website_url,
-                    'token': token
+                    'vnc_preview': links['vnc_preview'],
+                    'sandbox_url': links['sandbox_url'],
+                    'token': links['token']
                 }
             }).eq('project_id', project_id).execute()
             
@@ -158,18 +155,6 @@ class SessionManager:
         except Exception as e:
             await client.table('projects').delete().eq('project_id', project_id).execute()
             raise Exception(f"Failed to create sandbox: {str(e)}")
-    
-    def _extract_url(self, link) -> str:
-        if hasattr(link, 'url'):
-            return link.url
-        return str(link).split("url='")[1].split("'")[0]
-    
-    def _extract_token(self, link) -> str:
-        if hasattr(link, 'token'):
-            return link.token
-        if "token='" in str(link):
-            return str(link).split("token='")[1].split("'")[0]
-        return None
 
 
 class AgentExecutor:
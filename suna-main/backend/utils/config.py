@@ -14,6 +14,7 @@ Usage:
     env_mode = config.ENV_MODE
 """
 
+import json
 import os
 from enum import Enum
 from typing import Dict, Any, Optional, get_type_hints, Union
@@ -217,7 +218,29 @@ class Configuration:
     
     # Model configuration
     MODEL_TO_USE: Optional[str] = "anthropic/claude-sonnet-4-20250514"
-    
+
+    # Shared LLM rate limiter (token buckets in Redis per provider, model and API key)
+    LLM_RATE_LIMITER_ENABLED: bool = True
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS: int = 60
+
+    # Opt-in response cache for deterministic non-streaming LLM calls
+    LLM_RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    LLM_RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 64 * 1024
+
+    # Requests/tokens per minute ceilings per provider; keep slightly under the account tier limits.
+    # LLM_RATE_LIMITS in the environment is a JSON object whose providers replace these entries,
+    # e.g. {"anthropic": {"rpm": 4000, "tpm": 2000000}}
+    LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+        'anthropic': {'rpm': 3500, 'tpm': 1_800_000},
+        'openai': {'rpm': 9000, 'tpm': 1_800_000},
+        'openrouter': {'rpm': 3000, 'tpm': 2_000_000},
+        'bedrock': {'rpm': 200, 'tpm': 400_000},
+        'gemini': {'rpm': 1800, 'tpm': 3_600_000},
+        'xai': {'rpm': 450, 'tpm': 1_800_000},
+        'groq': {'rpm': 900, 'tpm': 250_000},
+        'default': {'rpm': 1000, 'tpm': 1_000_000},
+    }
+
     # Supabase configuration
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
@@ -366,6 +389,15 @@ class Configuration:
                 elif expected_type == EnvMode:
                     # Already handled for ENV_MODE
                     pass
+                elif getattr(expected_type, '__origin__', None) is dict:
+                    # JSON object merged over the default entries
+                    try:
+                        parsed = json.loads(env_val)
+                        if not isinstance(parsed, dict):
+                            raise ValueError("expected a JSON object")
+                        setattr(self, key, {**getattr(self, key, {}), **parsed})
+                    except ValueError:
+                        logger.warning(f"Invalid value for {key}: {env_val}, using default")
                 else:
                     # String or other type
                     setattr(self, key, env_val)
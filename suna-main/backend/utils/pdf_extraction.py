@@ -0,0 +1,155 @@
+"""
+Page-wise PDF text extraction in a process pool.
+
+PyPDF2 text extraction is CPU-bound, so running it page after page on the
+event loop blocks the worker for the whole document on large or scanned PDFs.
+`iter_pdf_pages` instead spills the PDF to a temporary file once, hands page
+ranges to a shared ProcessPoolExecutor and yields `(page_number, text)` in page
+order as the ranges complete, so callers can chunk while later pages are
+still being extracted.
+
+Memory per document is bounded: only PDF_EXTRACTION_MAX_PENDING ranges of
+PDF_EXTRACTION_PAGES_PER_TASK pages are in flight at a time, workers read the
+file from disk instead of receiving a pickled copy of the PDF, and callers
+can stop iterating early (e.g. once they have enough text).
+
+Workers are started with the "spawn" method, since forking the multithreaded
+API/worker process can copy held locks into the child. Each worker keeps the
+last few parsed PDFs, so a document is parsed once per worker rather than once
+per page range.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, List, Optional, Tuple
+
+import PyPDF2
+
+from utils.logger import logger
+
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_EXTRACTION_PAGES_PER_TASK = int(os.getenv("PDF_EXTRACTION_PAGES_PER_TASK", "8"))
+PDF_EXTRACTION_MAX_PENDING = PDF_EXTRACTION_WORKERS * 2
+# Parsed PDFs kept per worker process (one per document being extracted concurrently)
+PDF_EXTRACTION_READER_CACHE_SIZE = 2
+
+_executor: Optional[ProcessPoolExecutor] = None
+_readers: "OrderedDict[Tuple[str, int, int], PyPDF2.PdfReader]" = OrderedDict()
+# The thread fallback in _run can open readers from several threads
+_readers_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def _open_reader(path: str) -> PyPDF2.PdfReader:
+    """Return the parsed PDF, reusing this process's copy if the file is unchanged."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _readers_lock:
+        reader = _readers.get(key)
+        if reader is not None:
+            _readers.move_to_end(key)
+            return reader
+    reader = PyPDF2.PdfReader(path)
+    with _readers_lock:
+        _readers[key] = reader
+        while len(_readers) > PDF_EXTRACTION_READER_CACHE_SIZE:
+            _readers.popitem(last=False)
+    return reader
+
+
+def _count_pages(path: str) -> int:
+    return len(_open_reader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract pages [start, end) in a worker process. Returns 1-based page numbers."""
+    reader = _open_reader(path)
+    pages = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            # One broken page should not fail the whole document
+            text = ""
+            logger.warning(f"Failed to extract text from PDF page {index + 1}: {str(e)}")
+        pages.append((index + 1, text))
+    return pages
+
+
+async def _run(func, *args):
+    """Run in the process pool, falling back to a thread if the pool is unusable."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    except BrokenProcessPool:
+        logger.warning("PDF extraction process pool is broken, recreating it and using a thread for this task")
+        _reset_executor()
+        return await asyncio.to_thread(func, *args)
+
+
+async def iter_pdf_pages(pdf_bytes: bytes) -> AsyncIterator[Tuple[int, str]]:
+    """Yield (page_number, text) for every page, in order, extracting pages in parallel."""
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    pending: deque = deque()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+
+        page_count = await _run(_count_pages, path)
+        ranges = deque(
+            (start, start + PDF_EXTRACTION_PAGES_PER_TASK)
+            for start in range(0, page_count, PDF_EXTRACTION_PAGES_PER_TASK)
+        )
+
+        while ranges or pending:
+            while ranges and len(pending) < PDF_EXTRACTION_MAX_PENDING:
+                start, end = ranges.popleft()
+                pending.append(asyncio.ensure_future(_run(_extract_page_range, path, start, end)))
+
+            for page in await pending.popleft():
+                yield page
+    finally:
+        for future in pending:
+            future.cancel()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+async def extract_pdf_text(pdf_bytes: bytes, separator: str = "\n", max_chars: Optional[int] = None) -> str:
+    """Extract the whole text of a PDF, stopping early once `max_chars` is reached."""
+    parts = []
+    total = 0
+    pages = iter_pdf_pages(pdf_bytes)
+    try:
+        async for _, text in pages:
+            parts.append(text)
+            total += len(text) + len(separator)
+            if max_chars is not None and total >= max_chars:
+                break
+    finally:
+        await pages.aclose()
+    return separator.join(parts)
@@ -3,6 +3,7 @@ Utility functions for handling image operations.
 """
 
 import base64
+import hashlib
 import uuid
 from datetime import datetime
 from utils.logger import logger
@@ -76,4 +77,28 @@ async def upload_image_bytes(image_bytes: bytes, content_type: str = "image/png"
         return public_url
     except Exception as e:
         logger.error(f"Error uploading image bytes: {e}")
-        raise RuntimeError(f"Failed to upload image: {str(e)}") 
\ No newline at end of file
+        raise RuntimeError(f"Failed to upload image: {str(e)}") 
+
+async def upload_content_addressed_image(image_bytes: bytes, content_type: str = "image/png", bucket_name: str = "browser-screenshots") -> str:
+    """Upload an image under a name derived from its SHA-256, so identical images share one object.
+
+    Uses upsert, so re-uploading an image that is already stored is harmless.
+    """
+    try:
+        ext = "jpg" if content_type in ("image/jpeg", "image/jpg") else "png"
+        filename = f"{hashlib.sha256(image_bytes).hexdigest()}.{ext}"
+
+        db = DBConnection()
+        client = await db.client
+        await client.storage.from_(bucket_name).upload(
+            filename,
+            image_bytes,
+            {"content-type": content_type, "upsert": "true"}
+        )
+
+        public_url = await client.storage.from_(bucket_name).get_public_url(filename)
+        logger.debug(f"Successfully uploaded image to {public_url}")
+        return public_url
+    except Exception as e:
+        logger.error(f"Error uploading content-addressed image: {e}")
+        raise RuntimeError(f"Failed to upload image: {str(e)}")
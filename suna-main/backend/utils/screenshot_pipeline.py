@@ -0,0 +1,103 @@
+"""
+Screenshot pipeline for browser tool results.
+
+Browser actions return full-resolution base64 screenshots. `process_screenshot`
+turns one into stored image URLs:
+
+- validation, decoding, hashing and the JPEG re-encode run in a worker thread,
+  not on the event loop
+- images are stored under their SHA-256, and hashes seen recently (Redis) skip
+  the upload entirely, so repeated actions on an unchanged page cost nothing
+- besides the original (shown in the UI), a downscaled JPEG is stored for LLM
+  context, which needs far fewer image tokens per turn
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+from typing import Callable, Tuple
+
+from PIL import Image
+
+from utils.cache import Cache
+from utils.logger import logger
+from utils.s3_upload_utils import upload_content_addressed_image
+
+SCREENSHOT_LLM_MAX_WIDTH = int(os.getenv("SCREENSHOT_LLM_MAX_WIDTH", "1024"))
+SCREENSHOT_LLM_JPEG_QUALITY = int(os.getenv("SCREENSHOT_LLM_JPEG_QUALITY", "75"))
+SCREENSHOT_DEDUPE_TTL_SECONDS = 24 * 3600
+
+
+class ScreenshotValidationError(Exception):
+    pass
+
+
+@dataclass
+class ProcessedScreenshot:
+    image_url: str
+    llm_image_url: str
+    sha256: str
+    deduplicated: bool
+
+
+def _prepare(base64_data: str, validate: Callable[[str], Tuple[bool, str]]) -> Tuple[bytes, str, bytes]:
+    """Validate and decode the screenshot and build its LLM variant (runs in a worker thread)."""
+    is_valid, message = validate(base64_data)
+    if not is_valid:
+        raise ScreenshotValidationError(message)
+
+    if base64_data.startswith('data:'):
+        base64_data = base64_data.split(',', 1)[1]
+    image_data = base64.b64decode(base64_data)
+    digest = hashlib.sha256(image_data).hexdigest()
+
+    with Image.open(io.BytesIO(image_data)) as img:
+        img = img.convert("RGB")
+        if img.width > SCREENSHOT_LLM_MAX_WIDTH:
+            height = max(1, round(img.height * SCREENSHOT_LLM_MAX_WIDTH / img.width))
+            img = img.resize((SCREENSHOT_LLM_MAX_WIDTH, height), Image.LANCZOS)
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=SCREENSHOT_LLM_JPEG_QUALITY, optimize=True)
+    return image_data, digest, output.getvalue()
+
+
+def _content_type(image_data: bytes) -> str:
+    return "image/jpeg" if image_data.startswith(b'\xff\xd8\xff') else "image/png"
+
+
+async def process_screenshot(
+    base64_data: str,
+    validate: Callable[[str], Tuple[bool, str]],
+) -> ProcessedScreenshot:
+    """Store a base64 screenshot (original + LLM variant) and return their URLs.
+
+    Raises `ScreenshotValidationError` if `validate` rejects the data.
+    """
+    image_data, digest, llm_image = await asyncio.to_thread(_prepare, base64_data, validate)
+
+    cache_key = f"browser_screenshot:{digest}"
+    try:
+        cached = await Cache.get(cache_key)
+    except Exception as e:
+        logger.warning(f"Screenshot dedupe lookup failed: {e}")
+        cached = None
+    if cached:
+        logger.debug(f"Screenshot {digest[:12]} unchanged, skipping upload")
+        return ProcessedScreenshot(cached["image_url"], cached["llm_image_url"], digest, True)
+
+    image_url, llm_image_url = await asyncio.gather(
+        upload_content_addressed_image(image_data, _content_type(image_data)),
+        upload_content_addressed_image(llm_image, "image/jpeg"),
+    )
+    try:
+        await Cache.set(
+            cache_key,
+            {"image_url": image_url, "llm_image_url": llm_image_url},
+            ttl=SCREENSHOT_DEDUPE_TTL_SECONDS,
+        )
+    except Exception as e:
+        logger.warning(f"Screenshot dedupe store failed: {e}")
+    return ProcessedScreenshot(image_url, llm_image_url, digest, False)